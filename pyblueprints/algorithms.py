@@ -0,0 +1,421 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+
+#####################################################################
+# Graph algorithms over any Blueprints graph implementation. Every  #
+# algorithm expands a whole frontier of vertices at once, so the    #
+# number of backend requests grows with the depth of the traversal  #
+# and not with the number of visited vertices.                      #
+#                                                                   #
+# File: pyblueprints/algorithms.py                                  #
+#####################################################################
+
+from multiprocessing.pool import ThreadPool
+
+from base import _labels, _project
+from memory import MemoryGraph
+
+
+# Threads used to expand a frontier on backends without batching
+DEFAULT_WORKERS = 8
+
+_REVERSE = {"out": "in", "in": "out", "both": "both"}
+
+
+def _toId(vertex):
+    """Accepts either a Vertex object or a vertex identifier"""
+    if hasattr(vertex, "getId"):
+        return vertex.getId()
+    return vertex
+
+
+class FrontierExpander(object):
+    """Expands a set of vertices to their neighbours. It uses the
+    expandFrontier method of the graph when the backend implements
+    it and a pool of threads issuing one request per vertex
+    otherwise"""
+
+    def __init__(self, graph, workers=DEFAULT_WORKERS):
+        """Constructor
+        @params graph: The Graph to be traversed
+        @params workers: Number of threads for backends without batching"""
+        self.graph = graph
+        self.workers = workers
+        # Errors raised inside the backend methods are not mistaken
+        # for a missing method
+        self._batching = hasattr(graph, "expandFrontier")
+        self._multiGet = hasattr(graph, "getVerticesById")
+        self._projecting = True
+        self._pool = None
+
+    def expand(self, ids, direction="out", label=None):
+        """Retrieves the neighbours of every given vertex
+        @params ids: Iterable of vertex unique identifiers
+        @params direction: out, in or both
+        @params label: Optional label, or list of labels, to filter
+                       the edges
+
+        @returns A dictionary mapping each vertex identifier to a
+        list of (Edge, neighbour identifier) tuples"""
+        ids = list(ids)
+        if not ids:
+            return {}
+        if self._batching:
+            try:
+                return self.graph.expandFrontier(ids, direction, label)
+            except NotImplementedError:
+                self._batching = False
+        if self._pool is None:
+            self._pool = ThreadPool(self.workers)
+        expanded = self._pool.map(
+            lambda _id: self._expandVertex(_id, direction, label), ids)
+        return dict(zip(ids, expanded))
+
+    def fetchVertices(self, ids, properties=None):
+        """Retrieves several vertices with the getVerticesById method
+        of the graph or, when the graph does not implement it, in
+        parallel with the pool of threads
+        @params ids: Iterable of vertex unique identifiers
+        @params properties: Optional list of the property keys to
+                            retrieve, or False to retrieve none. It is
+                            dropped on graphs without projections
+
+        @returns A list of Vertex objects or None, in input order"""
+        ids = list(ids)
+        if not ids:
+            return []
+        if not self._projecting:
+            properties = None
+        if self._multiGet:
+            try:
+                return _project(self.graph.getVerticesById, properties, ids)
+            except NotImplementedError:
+                self._multiGet = False
+            except TypeError:
+                if properties is None:
+                    raise
+                self._projecting = False
+                return self.fetchVertices(ids)
+        if self._pool is None:
+            self._pool = ThreadPool(self.workers)
+        return self._pool.map(
+            lambda _id: _project(self.graph.getVertex, properties, _id), ids)
+
+    def _expandVertex(self, _id, direction, label):
+        vertex = self.graph.getVertex(_id)
+        if vertex is None:
+            return []
+        labels = _labels(label)
+        # Vertices filter by a single label, several are filtered here
+        single = labels[0] if labels is not None and len(labels) == 1 \
+            else None
+        if direction == "out":
+            edges = vertex.getOutEdges(single)
+        elif direction == "in":
+            edges = vertex.getInEdges(single)
+        else:
+            edges = vertex.getBothEdges(single)
+        neighbours = []
+        for edge in edges:
+            if single is None and labels is not None and \
+                    edge.getLabel() not in labels:
+                continue
+            if direction == "in":
+                neighbour = edge.getOutVertex().getId()
+            elif direction == "out":
+                neighbour = edge.getInVertex().getId()
+            else:
+                neighbour = edge.getOutVertex().getId()
+                if neighbour == _id:
+                    neighbour = edge.getInVertex().getId()
+            neighbours.append((edge, neighbour))
+        return neighbours
+
+    def close(self):
+        """Releases the threads of the pool, if any"""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+
+def bfs(graph, start, direction="out", label=None, maxDepth=None,
+        workers=DEFAULT_WORKERS):
+    """Breadth first traversal from one or several vertices
+    @params graph: The Graph to be traversed
+    @params start: A Vertex, a vertex identifier or a list of them
+    @params direction: out, in or both
+    @params label: Optional parameter to filter the edges
+    @params maxDepth: Optional maximum depth of the traversal
+    @params workers: Number of threads for backends without batching
+
+    @returns A generator of (vertex identifier, depth) tuples"""
+    if not isinstance(start, (list, tuple, set)):
+        start = [start]
+    frontier = []
+    visited = set()
+    for vertex in start:
+        _id = _toId(vertex)
+        if _id not in visited:
+            visited.add(_id)
+            frontier.append(_id)
+    depth = 0
+    with FrontierExpander(graph, workers) as expander:
+        while frontier:
+            for _id in frontier:
+                yield _id, depth
+            if maxDepth is not None and depth >= maxDepth:
+                break
+            expanded = expander.expand(frontier, direction, label)
+            nextFrontier = []
+            for _id in frontier:
+                for edge, neighbour in expanded.get(_id, []):
+                    if neighbour not in visited:
+                        visited.add(neighbour)
+                        nextFrontier.append(neighbour)
+            frontier = nextFrontier
+            depth += 1
+
+
+def kHop(graph, start, k, direction="out", label=None,
+         workers=DEFAULT_WORKERS):
+    """Returns the vertices reachable in at most k hops. It takes
+    k frontier expansions regardless of the number of vertices
+    @params graph: The Graph to be traversed
+    @params start: A Vertex, a vertex identifier or a list of them
+    @params k: Maximum number of hops
+    @params direction: out, in or both
+    @params label: Optional parameter to filter the edges
+    @params workers: Number of threads for backends without batching
+
+    @returns A dictionary mapping each reached vertex identifier
+    to its distance in hops"""
+    return dict(bfs(graph, start, direction, label, k, workers))
+
+
+def shortestPath(graph, source, target, direction="out", label=None,
+                 maxDepth=None, workers=DEFAULT_WORKERS):
+    """Finds a shortest path by expanding frontiers from both ends,
+    always growing the smallest one
+    @params graph: The Graph to be traversed
+    @params source: The origin Vertex or its identifier
+    @params target: The destination Vertex or its identifier
+    @params direction: out, in or both
+    @params label: Optional parameter to filter the edges
+    @params maxDepth: Optional maximum length of the path
+    @params workers: Number of threads for backends without batching
+
+    @returns The list of vertex identifiers of the path, or None"""
+    source = _toId(source)
+    target = _toId(target)
+    if source == target:
+        return [source]
+    # Parents found from each end: vertex -> previous vertex
+    forward = {source: None}
+    backward = {target: None}
+    forwardFrontier = [source]
+    backwardFrontier = [target]
+    length = 0
+    with FrontierExpander(graph, workers) as expander:
+        while forwardFrontier and backwardFrontier:
+            if maxDepth is not None and length >= maxDepth:
+                return None
+            if len(forwardFrontier) <= len(backwardFrontier):
+                frontier, parents, others = forwardFrontier, forward, backward
+                expanded = expander.expand(frontier, direction, label)
+            else:
+                frontier, parents, others = (backwardFrontier, backward,
+                                             forward)
+                expanded = expander.expand(frontier, _REVERSE[direction],
+                                           label)
+            length += 1
+            nextFrontier = []
+            meeting = None
+            for _id in frontier:
+                for edge, neighbour in expanded.get(_id, []):
+                    if neighbour in parents:
+                        continue
+                    parents[neighbour] = _id
+                    nextFrontier.append(neighbour)
+                    if neighbour in others and meeting is None:
+                        meeting = neighbour
+            if meeting is not None:
+                return _joinPath(forward, backward, meeting)
+            if parents is forward:
+                forwardFrontier = nextFrontier
+            else:
+                backwardFrontier = nextFrontier
+    return None
+
+
+def _joinPath(forward, backward, meeting):
+    path = []
+    _id = meeting
+    while _id is not None:
+        path.append(_id)
+        _id = forward[_id]
+    path.reverse()
+    _id = backward[meeting]
+    while _id is not None:
+        path.append(_id)
+        _id = backward[_id]
+    return path
+
+
+def connectedComponents(graph, ids=None, label=None,
+                        workers=DEFAULT_WORKERS):
+    """Finds the weakly connected components of the graph, growing
+    each component one frontier at a time
+    @params graph: The Graph to be traversed
+    @params ids: Optional vertex identifiers to start from. All the
+                 vertices of the graph are used by default
+    @params label: Optional parameter to filter the edges
+    @params workers: Number of threads for backends without batching
+
+    @returns A list of sets of vertex identifiers"""
+    if ids is None:
+        ids = [vertex.getId() for vertex in graph.getVertices()]
+    components = []
+    assigned = set()
+    with FrontierExpander(graph, workers) as expander:
+        for _id in ids:
+            _id = _toId(_id)
+            if _id in assigned:
+                continue
+            component = set([_id])
+            frontier = [_id]
+            while frontier:
+                expanded = expander.expand(frontier, "both", label)
+                nextFrontier = []
+                for vertex in frontier:
+                    for edge, neighbour in expanded.get(vertex, []):
+                        if neighbour not in component:
+                            component.add(neighbour)
+                            nextFrontier.append(neighbour)
+                frontier = nextFrontier
+            assigned.update(component)
+            components.append(component)
+    return components
+
+
+def _loadedKeys(element):
+    """Returns the keys retrieved by the projection an element was
+    loaded with, or None if it was loaded whole"""
+    if not hasattr(element, "getLoadedKeys"):
+        return None
+    try:
+        return element.getLoadedKeys()
+    except NotImplementedError:
+        return None
+
+
+def _readProperties(element, keys):
+    """Reads the requested properties of an element
+    @params element: A Vertex or Edge
+    @params keys: List of keys, or None for all of them
+
+    @returns A dictionary of properties"""
+    if keys is not None and not keys:
+        return {}
+    loadedKeys = _loadedKeys(element)
+    if keys is not None and loadedKeys is not None and \
+            loadedKeys.issuperset(keys):
+        # Retrieved with the element, no request is needed
+        properties = dict((key, element.getProperty(key)) for key in keys)
+        return dict((key, value) for key, value in properties.items()
+                    if value is not None)
+    properties = None
+    if hasattr(element, "getProperties"):
+        try:
+            properties = element.getProperties()
+        except NotImplementedError:
+            pass
+    if properties is None:
+        if keys is None:
+            keys = element.getPropertyKeys()
+        properties = dict((key, element.getProperty(key)) for key in keys)
+    if keys is not None:
+        properties = dict((key, properties[key]) for key in keys
+                          if key in properties)
+    return properties
+
+
+def _outVertexId(edge):
+    """Returns the identifier of the origin vertex of an edge,
+    without retrieving the vertex when the backend allows it"""
+    if hasattr(edge, "getOutVertexId"):
+        try:
+            return edge.getOutVertexId()
+        except NotImplementedError:
+            pass
+    return edge.getOutVertex().getId()
+
+
+def subgraph(graph, seeds, depth=1, direction="both", labels=None,
+             properties=None, workers=DEFAULT_WORKERS):
+    """Copies the neighbourhood of some vertices into a read only
+    MemoryGraph, so it can be traversed locally with the same API
+    @params graph: The Graph to be copied from
+    @params seeds: A Vertex, a vertex identifier or a list of them
+    @params depth: Number of hops to copy around the seeds
+    @params direction: out, in or both
+    @params labels: Optional list of edge labels to follow
+    @params properties: List of property keys to copy, None to copy
+                        all of them or an empty list to copy none
+    @params workers: Number of threads for backends without batching
+
+    @returns A read only MemoryGraph"""
+    if not isinstance(seeds, (list, tuple, set)):
+        seeds = [seeds]
+    visited = []
+    seen = set()
+    for seed in seeds:
+        _id = _toId(seed)
+        if _id not in seen:
+            seen.add(_id)
+            visited.append(_id)
+    frontier = list(visited)
+    edges = {}
+    with FrontierExpander(graph, workers) as expander:
+        for level in range(depth):
+            if not frontier:
+                break
+            nextFrontier = []
+            # A single expansion per level, for every label at once
+            expanded = expander.expand(frontier, direction, labels)
+            for _id in frontier:
+                for edge, neighbour in expanded.get(_id, []):
+                    if direction == "out" or (direction == "both" and
+                                              _outVertexId(edge) == _id):
+                        ends = (_id, neighbour)
+                    else:
+                        ends = (neighbour, _id)
+                    edges[edge.getId()] = (edge, ends)
+                    if neighbour not in seen:
+                        seen.add(neighbour)
+                        visited.append(neighbour)
+                        nextFrontier.append(neighbour)
+            frontier = nextFrontier
+        local = MemoryGraph()
+        # Only the copied properties are retrieved
+        projection = properties
+        if properties is not None and not properties:
+            projection = False
+        for _id, vertex in zip(visited,
+                               expander.fetchVertices(visited, projection)):
+            if vertex is not None:
+                local.addVertex(_id, _readProperties(vertex, properties))
+    for _id, (edge, (outId, inId)) in edges.items():
+        outVertex = local.getVertex(outId)
+        inVertex = local.getVertex(inId)
+        if outVertex is not None and inVertex is not None:
+            local.addEdge(outVertex, inVertex, edge.getLabel(), _id,
+                          _readProperties(edge, properties))
+    local.readOnly = True
+    return local
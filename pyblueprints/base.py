@@ -10,12 +10,38 @@
 # File: pyblueprints/base.py                                        #
 #####################################################################
 
+from multiprocessing.pool import ThreadPool
+
+
+def _project(get, properties, *args):
+    """Calls a retrieval method passing the projection only when
+    there is one, so backends without projections keep working"""
+    if properties is None:
+        return get(*args)
+    return get(*args, properties=properties)
+
+
+def _labels(label):
+    """Returns the labels accepted by an edge filter given as a
+    label or a list of labels, or None if every label is accepted"""
+    if label is None:
+        return None
+    if isinstance(label, (list, tuple, set, frozenset)):
+        return list(label) or None
+    return [label]
+
 
 class Graph(object):
     """This is an abstract class that specifies all the
     methods that should be reimplemented in order to
     follow a Blueprints-like API in python"""
 
+    # Maximum number of elements requested at once by the multi-get
+    # methods on backends able to batch requests
+    batchSize = 500
+    # Threads used by the multi-get methods on backends without batching
+    workers = 8
+
     def addVertex(self, _id):
         """Adds a new vertex to the graph
         @params _id: Node unique identifier
@@ -23,17 +49,33 @@ class Graph(object):
         @returns The created Vertex or None"""
         raise NotImplementedError("Method has to be implemented")
 
-    def getVertex(self, _id):
+    def getVertex(self, _id, properties=None):
         """Retrieves an existing vertex from the graph
         @params _id: Node unique identifier
+        @params properties: Optional list of the property keys to
+                            retrieve, or False to retrieve none. The
+                            rest are retrieved when they are read
 
         @returns The requested Vertex or None"""
         raise NotImplementedError("Method has to be implemented")
 
-    def getVertices(self):
-        """Returns an iterator with all the vertices"""
+    def getVertices(self, properties=None):
+        """Returns an iterator with all the vertices
+        @params properties: Optional list of the property keys to
+                            retrieve, or False to retrieve none"""
         raise NotImplementedError("Method has to be implemented")
 
+    def getVerticesById(self, ids, properties=None):
+        """Retrieves several vertices at once. Backends unable to
+        batch requests fetch them with a pool of workers threads
+        @params ids: Iterable of node unique identifiers
+        @params properties: Optional list of the property keys to
+                            retrieve, or False to retrieve none
+
+        @returns A list with the requested Vertex objects in input
+        order, with None for the missing ones"""
+        return self._getById(self.getVertex, ids, properties)
+
     def removeVertex(self, vertex):
         """Removes the given vertex
         @params vertex: Node to be removed"""
@@ -48,22 +90,91 @@ class Graph(object):
         @returns The created Edge object"""
         raise NotImplementedError("Method has to be implemented")
 
-    def getEdge(self, _id):
+    def getEdge(self, _id, properties=None):
         """Retrieves an existing edge from the graph
         @params _id: Edge unique identifier
+        @params properties: Optional list of the property keys to
+                            retrieve, or False to retrieve none. The
+                            rest are retrieved when they are read
 
         @returns The requested Edge or None"""
         raise NotImplementedError("Method has to be implemented")
 
-    def getEdges(self):
-        """Returns an iterator with all the vertices"""
-        raise NotImplementedError("Method has to be implemented")
+    def getEdges(self, properties=None):
+        """Returns an iterator with all the vertices
+        @params properties: Optional list of the property keys to
+                            retrieve, or False to retrieve none"""
+        raise NotImplementedError("Method has to be implemented")
+
+    def getEdgesById(self, ids, properties=None):
+        """Retrieves several edges at once. Backends unable to
+        batch requests fetch them with a pool of workers threads
+        @params ids: Iterable of edge unique identifiers
+        @params properties: Optional list of the property keys to
+                            retrieve, or False to retrieve none
+
+        @returns A list with the requested Edge objects in input
+        order, with None for the missing ones"""
+        return self._getById(self.getEdge, ids, properties)
+
+    def _getById(self, get, ids, properties=None):
+        if properties is not None:
+            project = get
+            get = lambda _id: _project(project, properties, _id)
+        ids = list(ids)
+        if len(ids) < 2 or self.workers < 2:
+            return [get(_id) for _id in ids]
+        pool = ThreadPool(min(self.workers, len(ids)))
+        try:
+            return pool.map(get, ids)
+        finally:
+            pool.close()
+            pool.join()
 
     def removeEdge(self, edge):
         """Removes the given edge
         @params edge: The edge to be removed"""
         raise NotImplementedError("Method has to be implemented")
 
+    def getModifiedElements(self, key, since=None):
+        """Retrieves the elements whose timestamp property is
+        greater than or equal to a given value
+        @params key: The property holding the modification timestamp
+        @params since: Lower bound of the timestamp, or None for all
+
+        @returns A tuple with an iterator of vertices and an
+        iterator of edges"""
+        raise NotImplementedError("Method has to be implemented")
+
+    def expandFrontier(self, ids, direction="out", label=None):
+        """Retrieves the edges adjacent to a whole set of vertices
+        in as few requests as the backend allows
+        @params ids: Iterable of vertex unique identifiers
+        @params direction: out, in or both
+        @params label: Optional label, or list of labels, to filter
+                       the edges
+
+        @returns A dictionary mapping each vertex identifier to a
+        list of (Edge, neighbour identifier) tuples"""
+        raise NotImplementedError("Method has to be implemented")
+
+    def v(self, *vertices):
+        """Starts a lazily evaluated traversal pipeline
+        @params vertices: Vertex objects or vertex identifiers
+
+        @returns A pipeline.Pipeline object"""
+        from pipeline import Pipeline
+        return Pipeline(self, vertices)
+
+    def compileTraversal(self, steps):
+        """Compiles the longest possible run of traversal steps,
+        from the first one, into a single backend request
+        @params steps: List of pipeline.Step objects
+
+        @returns A tuple with a stage running the request and the
+        number of steps it covers"""
+        raise NotImplementedError("Method has to be implemented")
+
     def clear(self):
         """TODO Documentation"""
         raise NotImplementedError("Method has to be implemented")
@@ -136,6 +247,12 @@ class Element():
         @returns Set of property keys"""
         raise NotImplementedError("Method has to be implemented")
 
+    def getProperties(self):
+        """Returns all the properties of the element at once
+
+        @returns A dictionary with the properties of the element"""
+        raise NotImplementedError("Method has to be implemented")
+
     def setProperty(self, key, value):
         """Sets the property of the element to the given value
         @params key: The property key to set
@@ -148,6 +265,14 @@ class Element():
         @returns The unique identifier of the element"""
         raise NotImplementedError("Method has to be implemented")
 
+    def getLoadedKeys(self):
+        """Returns the keys of the properties retrieved with the
+        element when it was loaded with a projection. The rest are
+        retrieved when they are read
+
+        @returns A set of keys, or None if all were retrieved"""
+        return None
+
     def removeProperty(self, key):
         """Removes the value of the property for the given key
         @params key: The key which value is being removed"""
@@ -158,29 +283,35 @@ class Vertex(Element):
     """An abstract class defining a Vertex object representing
     a node of the graph with a set of properties"""
 
-    def getOutEdges(self, label=None):
+    def getOutEdges(self, label=None, properties=None):
         """Gets all the outgoing edges of the node. If label
         parameter is provided, it only returns the edges of
         the given label
         @params label: Optional parameter to filter the edges
+        @params properties: Optional list of the property keys of
+                            the edges to retrieve, or False for none
 
         @returns A generator function of edges"""
         raise NotImplementedError("Method has to be implemented")
 
-    def getInEdges(self, label=None):
+    def getInEdges(self, label=None, properties=None):
         """Gets all the incoming edges of the node. If label
         parameter is provided, it only returns the edges of
         the given label
         @params label: Optional parameter to filter the edges
+        @params properties: Optional list of the property keys of
+                            the edges to retrieve, or False for none
 
         @returns A generator function of edges"""
         raise NotImplementedError("Method has to be implemented")
 
-    def getBothEdges(self, label=None):
+    def getBothEdges(self, label=None, properties=None):
         """Gets all the edges of the node. If label
         parameter is provided, it only returns the edges of
         the given label
         @params label: Optional parameter to filter the edges
+        @params properties: Optional list of the property keys of
+                            the edges to retrieve, or False for none
 
         @returns A generator function of edges"""
         raise NotImplementedError("Method has to be implemented")
@@ -201,6 +332,20 @@ class Edge(Element):
         @returns The target Vertex"""
         raise NotImplementedError("Method has to be implemented")
 
+    def getOutVertexId(self):
+        """Returns the identifier of the origin Vertex without
+        retrieving the vertex itself
+
+        @returns The origin Vertex identifier"""
+        raise NotImplementedError("Method has to be implemented")
+
+    def getInVertexId(self):
+        """Returns the identifier of the target Vertex without
+        retrieving the vertex itself
+
+        @returns The target Vertex identifier"""
+        raise NotImplementedError("Method has to be implemented")
+
     def getLabel(self):
         """Returns the label of the relationship
 
@@ -231,8 +376,14 @@ class Index():
         """TODO Documentation"""
         raise NotImplementedError("Method has to be implemented")
 
-    def get(self, key, value):
-        """TODO Documentation"""
+    def get(self, key, value, properties=None):
+        """Gets the elements indexed under a key-value pair
+        @params key: Index key string
+        @params value: Index value string
+        @params properties: Optional list of the property keys to
+                            retrieve, or False to retrieve none
+
+        @returns A generator of Vertex or Edge objects"""
         raise NotImplementedError("Method has to be implemented")
 
     def remove(self, key, value, element):
@@ -0,0 +1,814 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+
+#####################################################################
+# A read cache that can be placed in front of any Blueprints graph  #
+# implementation. Reads are served from memory when possible and    #
+# writes made through the wrapper invalidate the affected entries.  #
+#                                                                   #
+# File: pyblueprints/cache.py                                       #
+#####################################################################
+
+import sys
+import threading
+from collections import OrderedDict
+
+from base import Graph, _project
+
+
+DEFAULT_MAX_ENTRIES = 10000
+
+
+def _sizeof(value):
+    """Approximates the memory footprint of a cached value
+    @params value: The cached value
+
+    @returns The approximate size in bytes"""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        for key, item in value.items():
+            size += _sizeof(key) + _sizeof(item)
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        for item in value:
+            size += _sizeof(item)
+    return size
+
+
+class LRUCache(object):
+    """A thread safe least recently used cache bounded by
+    a number of entries and, optionally, by an approximate
+    amount of memory"""
+
+    def __init__(self, maxEntries=DEFAULT_MAX_ENTRIES, maxBytes=None):
+        """Constructor
+        @params maxEntries: Maximum number of entries, or None
+        @params maxBytes: Maximum approximate size in bytes, or None"""
+        self.maxEntries = maxEntries
+        self.maxBytes = maxBytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._bytes = 0
+        self._lock = threading.RLock()
+
+    def get(self, key, default=None):
+        """Gets a value from the cache, marking it as recently used
+        @params key: The key of the entry
+        @params default: Value returned when the key is not cached
+
+        @returns The cached value or default"""
+        with self._lock:
+            try:
+                value = self._entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self._entries[key] = value
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Stores a value in the cache, evicting the least
+        recently used entries if a limit is exceeded
+        @params key: The key of the entry
+        @params value: The value to store"""
+        size = _sizeof(value)
+        with self._lock:
+            self._discard(key)
+            if self.maxBytes is not None and size > self.maxBytes:
+                return
+            self._entries[key] = value
+            self._sizes[key] = size
+            self._bytes += size
+            while ((self.maxEntries is not None
+                    and len(self._entries) > self.maxEntries)
+                   or (self.maxBytes is not None
+                       and self._bytes > self.maxBytes)):
+                oldest = next(iter(self._entries))
+                self._discard(oldest)
+
+    def discard(self, key):
+        """Removes an entry from the cache if it exists
+        @params key: The key of the entry"""
+        with self._lock:
+            self._discard(key)
+
+    def discardWhere(self, predicate):
+        """Removes every entry matching the given predicate
+        @params predicate: Function receiving a key and a value"""
+        with self._lock:
+            for key, value in list(self._entries.items()):
+                if predicate(key, value):
+                    self._discard(key)
+
+    def clear(self):
+        """Removes all the entries of the cache"""
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self._bytes = 0
+
+    def getStats(self):
+        """Returns the usage statistics of the cache
+
+        @returns A dictionary with hits, misses, entries and bytes"""
+        with self._lock:
+            return {"hits": self.hits,
+                    "misses": self.misses,
+                    "entries": len(self._entries),
+                    "bytes": self._bytes}
+
+    def _discard(self, key):
+        if key in self._entries:
+            del self._entries[key]
+            self._bytes -= self._sizes.pop(key)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def _indexKind(indexClass):
+    """Returns vertex or edge for the index class names of any backend"""
+    if str(indexClass).lower().startswith("vert"):
+        return "vertex"
+    return "edge"
+
+
+def _unwrap(element):
+    """Returns the backend element behind a cached element"""
+    if isinstance(element, CachedElement):
+        return element.element
+    return element
+
+
+def _loadedKeys(element):
+    """Returns the keys retrieved by the projection a backend element
+    was loaded with, or None if it was loaded whole"""
+    if not hasattr(element, "getLoadedKeys"):
+        return None
+    try:
+        return element.getLoadedKeys()
+    except NotImplementedError:
+        return None
+
+
+def _propertiesOf(element):
+    """Returns a copy of the properties of a backend element"""
+    if hasattr(element, "getProperties"):
+        try:
+            return dict(element.getProperties())
+        except NotImplementedError:
+            pass
+    return dict((key, element.getProperty(key))
+                for key in element.getPropertyKeys())
+
+
+class CachingGraph(Graph):
+    """A graph wrapping any other Graph implementation and
+    caching property maps, edge labels and endpoints, adjacency
+    lists and index lookups in memory. Only identifiers and plain
+    values are cached, so the size of the cache is bounded by
+    maxBytes. Writes made through the wrapper invalidate the
+    affected entries. Writes made by other clients are not
+    visible until the entries are evicted or invalidated with
+    one of the invalidate methods"""
+
+    def __init__(self, graph, maxEntries=DEFAULT_MAX_ENTRIES, maxBytes=None):
+        """Constructor
+        @params graph: The Graph object to be wrapped
+        @params maxEntries: Maximum number of cached entries, or None
+        @params maxBytes: Maximum approximate cache size in bytes, or None"""
+        self.graph = graph
+        self.cache = LRUCache(maxEntries, maxBytes)
+        # Number of writes made through the wrapper. The backend
+        # elements held by the cached elements are only read if no
+        # write was made since they were retrieved
+        self._writes = 0
+        self._writesLock = threading.Lock()
+
+    def _written(self, kind, _id):
+        """Discards the entries made stale by a write on an element"""
+        with self._writesLock:
+            self._writes += 1
+        self.cache.discard(("properties", kind, _id))
+        self._invalidateIndexed(kind, _id)
+
+    def _wrap(self, cls, element, version, _id=None):
+        """Wraps a backend element retrieved when the write count
+        was version, caching what it holds"""
+        wrapper = cls(self, element, _id, version)
+        wrapper._remember()
+        return wrapper
+
+    def addVertex(self, _id=None):
+        """Adds a new vertex to the graph
+        @params _id: Node unique identifier
+
+        @returns The created Vertex or None"""
+        version = self._writes
+        vertex = self.graph.addVertex(_id)
+        if vertex is None:
+            return None
+        return CachedVertex(self, vertex, None, version)
+
+    def getVertex(self, _id, properties=None):
+        """Retrieves an existing vertex from the cache or,
+        if it is not cached, from the wrapped graph
+        @params _id: Node unique identifier
+        @params properties: Optional list of the property keys to
+                            retrieve on a cache miss, or False for none
+
+        @returns The requested Vertex or None"""
+        if self.cache.get(("properties", "vertex", _id)) is not None:
+            return CachedVertex(self, None, _id)
+        version = self._writes
+        vertex = _project(self.graph.getVertex, properties, _id)
+        if vertex is None:
+            return None
+        return self._wrap(CachedVertex, vertex, version, _id)
+
+    def getVertices(self, properties=None):
+        """Returns an iterator with all the vertices
+        @params properties: Optional list of the property keys to
+                            retrieve, or False to retrieve none"""
+        version = self._writes
+        for vertex in _project(self.graph.getVertices, properties):
+            yield CachedVertex(self, vertex, None, version)
+
+    def getVerticesById(self, ids, properties=None):
+        """Retrieves several vertices, requesting the ones that
+        are not cached with a single multi-get on the wrapped graph
+        @params ids: Iterable of node unique identifiers
+        @params properties: Optional list of the property keys to
+                            retrieve on a cache miss, or False for none
+
+        @returns A list with the requested Vertex objects in input
+        order, with None for the missing ones"""
+        return self._getCachedById(CachedVertex, self.graph.getVerticesById,
+                                   ids, properties)
+
+    def removeVertex(self, vertex):
+        """Removes the given vertex
+        @params vertex: Node to be removed"""
+        _id = vertex.getId()
+        # Backends removing the edges of the vertex remove them too
+        edgeIds = [edge.getId()
+                   for edge in _unwrap(vertex).getBothEdges()]
+        self.graph.removeVertex(_unwrap(vertex))
+        self.invalidateVertex(_id)
+        # Drops the adjacency lists of the neighbours listing them
+        for edgeId in edgeIds:
+            self.invalidateEdge(edgeId)
+
+    def addEdge(self, outVertex, inVertex, label):
+        """Creates a new edge
+        @params outVertex: Edge origin Vertex
+        @params inVertex: Edge target vertex
+        @params label: Edge label
+
+        @returns The created Edge object"""
+        version = self._writes
+        edge = self.graph.addEdge(_unwrap(outVertex), _unwrap(inVertex),
+                                  label)
+        self._invalidateAdjacency(outVertex.getId())
+        self._invalidateAdjacency(inVertex.getId())
+        return CachedEdge(self, edge, None, version)
+
+    def getEdge(self, _id, properties=None):
+        """Retrieves an existing edge from the cache or,
+        if it is not cached, from the wrapped graph
+        @params _id: Edge unique identifier
+        @params properties: Optional list of the property keys to
+                            retrieve on a cache miss, or False for none
+
+        @returns The requested Edge or None"""
+        if self.cache.get(("properties", "edge", _id)) is not None:
+            return CachedEdge(self, None, _id)
+        version = self._writes
+        edge = _project(self.graph.getEdge, properties, _id)
+        if edge is None:
+            return None
+        return self._wrap(CachedEdge, edge, version, _id)
+
+    def getEdges(self, properties=None):
+        """Returns an iterator with all the edges
+        @params properties: Optional list of the property keys to
+                            retrieve, or False to retrieve none"""
+        version = self._writes
+        for edge in _project(self.graph.getEdges, properties):
+            yield CachedEdge(self, edge, None, version)
+
+    def getEdgesById(self, ids, properties=None):
+        """Retrieves several edges, requesting the ones that are
+        not cached with a single multi-get on the wrapped graph
+        @params ids: Iterable of edge unique identifiers
+        @params properties: Optional list of the property keys to
+                            retrieve on a cache miss, or False for none
+
+        @returns A list with the requested Edge objects in input
+        order, with None for the missing ones"""
+        return self._getCachedById(CachedEdge, self.graph.getEdgesById, ids,
+                                   properties)
+
+    def _getCachedById(self, cls, get, ids, properties=None):
+        """Returns the cached elements of the given identifiers in
+        input order, retrieving the ones not cached at once"""
+        ids = list(ids)
+        cached = [self.cache.get(("properties", cls._kind, _id)) is not None
+                  for _id in ids]
+        missing = [_id for _id, hit in zip(ids, cached) if not hit]
+        fetched = {}
+        if missing:
+            version = self._writes
+            for _id, element in zip(missing,
+                                    _project(get, properties, missing)):
+                if element is not None:
+                    fetched[_id] = self._wrap(cls, element, version, _id)
+        return [cls(self, None, _id) if hit else fetched.get(_id)
+                for _id, hit in zip(ids, cached)]
+
+    def removeEdge(self, edge):
+        """Removes the given edge
+        @params edge: The edge to be removed"""
+        _id = edge.getId()
+        self.graph.removeEdge(_unwrap(edge))
+        self.invalidateEdge(_id)
+
+    def clear(self):
+        """Removes all data in the wrapped graph and in the cache"""
+        self.graph.clear()
+        self.invalidateAll()
+
+    def shutdown(self):
+        """Shuts down the wrapped graph"""
+        self.invalidateAll()
+        self.graph.shutdown()
+
+    def invalidateVertex(self, _id):
+        """Removes the properties and the adjacency lists of a
+        vertex from the cache. Use it when the vertex is changed
+        by another client
+        @params _id: Node unique identifier"""
+        self._written("vertex", _id)
+        self._invalidateAdjacency(_id)
+
+    def invalidateEdge(self, _id):
+        """Removes the properties of an edge, its label, its
+        endpoints and every adjacency list containing it from the
+        cache. Use it when the edge is changed by another client
+        @params _id: Edge unique identifier"""
+        self._written("edge", _id)
+        self.cache.discard(("label", _id))
+        self.cache.discard(("endpoints", _id))
+        self.cache.discardWhere(lambda key, value: key[0] == "adjacency"
+                                and _id in value)
+
+    def invalidateAll(self):
+        """Removes every entry from the cache"""
+        self.cache.clear()
+
+    def getCacheStats(self):
+        """Returns the usage statistics of the cache
+
+        @returns A dictionary with hits, misses, entries and bytes"""
+        return self.cache.getStats()
+
+    def _invalidateIndexed(self, kind, _id):
+        """Removes the cached index lookups containing an element"""
+        def matches(key, value):
+            return (key[0] == "index" and _indexKind(key[2]) == kind
+                    and _id in value)
+        self.cache.discardWhere(matches)
+
+    def _invalidateAdjacency(self, _id):
+        self.cache.discardWhere(lambda key, value: key[0] == "adjacency"
+                                and key[1] == _id)
+
+    def __str__(self):
+        return "CachingGraph: %s" % self.graph
+
+
+class CachingIndexableGraph(CachingGraph):
+    """A caching graph wrapping an indexable graph. Index
+    lookups are cached by index, key and value"""
+
+    def createManualIndex(self, indexName, indexClass):
+        """Creates an index manually managed
+        @params name: The index name
+        @params indexClass: vertex or edge
+
+        @returns The created Index"""
+        self.invalidateIndex(indexName)
+        return CachedIndex(self,
+                           self.graph.createManualIndex(indexName, indexClass))
+
+    def createAutomaticIndex(self, indexName, indexClass, *args, **kwargs):
+        """Creates an index automatically managed by the backend
+        @params name: The index name
+        @params indexClass: vertex or edge
+
+        @returns The created Index"""
+        self.invalidateIndex(indexName)
+        index = self.graph.createAutomaticIndex(indexName, indexClass,
+                                                *args, **kwargs)
+        return CachedIndex(self, index)
+
+    def getIndex(self, indexName, indexClass):
+        """Retrieves an index with a given index name and class
+        @params indexName: The index name
+        @params indexClass: vertex or edge
+
+        @return The Index object or None"""
+        index = self.graph.getIndex(indexName, indexClass)
+        if index is None:
+            return None
+        return CachedIndex(self, index)
+
+    def getIndices(self):
+        """Returns a generator function over all the existing indexes
+
+        @returns A generator function over all the Index objects"""
+        for index in self.graph.getIndices():
+            yield CachedIndex(self, index)
+
+    def dropIndex(self, indexName, *args):
+        """Removes an index and its cached lookups
+        @params indexName: The index name"""
+        self.graph.dropIndex(indexName, *args)
+        self.invalidateIndex(indexName)
+
+    def invalidateIndex(self, indexName, key=None, value=None):
+        """Removes the cached lookups of an index. If key or
+        value are provided only the matching lookups are removed
+        @params indexName: The index name
+        @params key: Optional index key
+        @params value: Optional index value"""
+        def matches(cacheKey, cacheValue):
+            if cacheKey[0] != "index" or cacheKey[1] != indexName:
+                return False
+            if key is not None and cacheKey[3] != key:
+                return False
+            if value is not None and cacheKey[4] != value:
+                return False
+            return True
+        self.cache.discardWhere(matches)
+
+
+class CachedElement(object):
+    """An element served by a CachingGraph. Its property map is
+    kept in the cache of the graph. The backend element it wraps
+    is retrieved when a write or an uncached read needs it"""
+
+    _kind = None
+
+    def __init__(self, graph, element=None, _id=None, version=None):
+        """Constructor
+        @params graph: The CachingGraph the element belongs to
+        @params element: The backend element being wrapped, or None
+                         to retrieve it when it is needed
+        @params _id: The element identifier, if already known
+        @params version: Write count of the graph when the backend
+                         element was retrieved"""
+        self.graph = graph
+        self._element = element
+        self._id = _id
+        self._version = version
+
+    def _fetch(self):
+        raise NotImplementedError("Method has to be implemented")
+
+    def _current(self):
+        """Returns a whole backend element retrieved after the last
+        write made through the graph"""
+        if (self._element is None or self._version != self.graph._writes
+                or _loadedKeys(self._element) is not None):
+            version = self.graph._writes
+            self._element = self._fetch()
+            self._version = version
+        return self._element
+
+    def _remember(self):
+        """Caches the properties of a whole and current backend
+        element"""
+        if (self._version == self.graph._writes
+                and _loadedKeys(self._element) is None):
+            self.graph.cache.put(("properties", self._kind, self.getId()),
+                                 _propertiesOf(self._element))
+
+    @property
+    def element(self):
+        """The backend element being wrapped"""
+        if self._element is None:
+            self._version = self.graph._writes
+            self._element = self._fetch()
+        return self._element
+
+    def getId(self):
+        """Returns the unique identifier of the element
+
+        @returns The unique identifier of the element"""
+        if self._id is None:
+            self._id = self._element.getId()
+        return self._id
+
+    def _getProperties(self):
+        cacheKey = ("properties", self._kind, self.getId())
+        properties = self.graph.cache.get(cacheKey)
+        if properties is None:
+            properties = _propertiesOf(self._current())
+            self.graph.cache.put(cacheKey, properties)
+        return properties
+
+    def getProperties(self):
+        """Returns all the properties of the element, fetching
+        them from the backend only if they are not cached
+
+        @returns A dictionary with the properties of the element"""
+        return dict(self._getProperties())
+
+    def getLoadedKeys(self):
+        """Returns the keys of the properties retrieved with the
+        backend element by a projection
+
+        @returns A set of keys, or None if all were retrieved"""
+        if self._element is None or self._version != self.graph._writes:
+            return None
+        return _loadedKeys(self._element)
+
+    def getProperty(self, key):
+        """Gets the value of the property for the given key. The
+        properties loaded by a projection are read from the backend
+        element, the rest from the cached property map
+        @params key: The key which value is being retrieved
+
+        @returns The value of the property with the given key"""
+        loadedKeys = self.getLoadedKeys()
+        if loadedKeys is not None and key in loadedKeys:
+            return self._element.getProperty(key)
+        return self._getProperties().get(key)
+
+    def getPropertyKeys(self):
+        """Returns a set with the property keys of the element
+
+        @returns Set of property keys"""
+        return self._getProperties().keys()
+
+    def setProperty(self, key, value):
+        """Sets the property of the element to the given value
+        @params key: The property key to set
+        @params value: The value to set"""
+        self.element.setProperty(key, value)
+        self.graph._written(self._kind, self.getId())
+
+    def removeProperty(self, key):
+        """Removes the value of the property for the given key
+        @params key: The key which value is being removed"""
+        self.element.removeProperty(key)
+        self.graph._written(self._kind, self.getId())
+
+    def __eq__(self, other):
+        return (isinstance(other, CachedElement)
+                and self._kind == other._kind
+                and self.getId() == other.getId())
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash((self._kind, self.getId()))
+
+
+class CachedVertex(CachedElement):
+    """A vertex served by a CachingGraph. Adjacency lists are
+    cached per direction and label as lists of edge identifiers"""
+
+    _kind = "vertex"
+
+    def _fetch(self):
+        return self.graph.graph.getVertex(self.getId())
+
+    def _getEdges(self, direction, label, properties):
+        cacheKey = ("adjacency", self.getId(), direction, label)
+        ids = self.graph.cache.get(cacheKey)
+        if ids is not None:
+            for _id in ids:
+                yield CachedEdge(self.graph, None, _id)
+            return
+        if direction == "out":
+            get = self.element.getOutEdges
+        elif direction == "in":
+            get = self.element.getInEdges
+        else:
+            get = self.element.getBothEdges
+        version = self.graph._writes
+        edges = [self.graph._wrap(CachedEdge, edge, version)
+                 for edge in _project(get, properties, label)]
+        self.graph.cache.put(cacheKey, [edge.getId() for edge in edges])
+        for edge in edges:
+            yield edge
+
+    def getOutEdges(self, label=None, properties=None):
+        """Gets all the outgoing edges of the node. If label
+        parameter is provided, it only returns the edges of
+        the given label
+        @params label: Optional parameter to filter the edges
+        @params properties: Optional list of the property keys of
+                            the edges to retrieve on a cache miss
+
+        @returns A generator function with the outgoing edges"""
+        return self._getEdges("out", label, properties)
+
+    def getInEdges(self, label=None, properties=None):
+        """Gets all the incoming edges of the node. If label
+        parameter is provided, it only returns the edges of
+        the given label
+        @params label: Optional parameter to filter the edges
+        @params properties: Optional list of the property keys of
+                            the edges to retrieve on a cache miss
+
+        @returns A generator function with the incoming edges"""
+        return self._getEdges("in", label, properties)
+
+    def getBothEdges(self, label=None, properties=None):
+        """Gets all the edges of the node. If label
+        parameter is provided, it only returns the edges of
+        the given label
+        @params label: Optional parameter to filter the edges
+        @params properties: Optional list of the property keys of
+                            the edges to retrieve on a cache miss
+
+        @returns A generator function with the edges"""
+        return self._getEdges("both", label, properties)
+
+    def __str__(self):
+        return "Vertex %s: %s" % (self.getId(), self.getProperties())
+
+
+class CachedEdge(CachedElement):
+    """An edge served by a CachingGraph. Its label and the
+    identifiers of its vertices are cached so they can be
+    resolved through the cached vertices"""
+
+    _kind = "edge"
+
+    def _fetch(self):
+        return self.graph.graph.getEdge(self.getId())
+
+    def _remember(self):
+        super(CachedEdge, self)._remember()
+        self.graph.cache.put(("label", self.getId()),
+                             self._element.getLabel())
+
+    def _getEndpoints(self):
+        cacheKey = ("endpoints", self.getId())
+        endpoints = self.graph.cache.get(cacheKey)
+        if endpoints is None:
+            element = self.element
+            try:
+                if not hasattr(element, "getOutVertexId"):
+                    raise NotImplementedError()
+                endpoints = (element.getOutVertexId(),
+                             element.getInVertexId())
+            except NotImplementedError:
+                endpoints = (element.getOutVertex().getId(),
+                             element.getInVertex().getId())
+            self.graph.cache.put(cacheKey, endpoints)
+        return endpoints
+
+    def getOutVertex(self):
+        """Returns the origin Vertex of the relationship
+
+        @returns The origin Vertex"""
+        return self.graph.getVertex(self._getEndpoints()[0])
+
+    def getInVertex(self):
+        """Returns the target Vertex of the relationship
+
+        @returns The target Vertex"""
+        return self.graph.getVertex(self._getEndpoints()[1])
+
+    def getOutVertexId(self):
+        """Returns the identifier of the origin Vertex
+
+        @returns The origin Vertex identifier"""
+        return self._getEndpoints()[0]
+
+    def getInVertexId(self):
+        """Returns the identifier of the target Vertex
+
+        @returns The target Vertex identifier"""
+        return self._getEndpoints()[1]
+
+    def getLabel(self):
+        """Returns the label of the relationship
+
+        @returns The edge label"""
+        label = self.graph.cache.get(("label", self.getId()))
+        if label is None:
+            label = self.element.getLabel()
+            self.graph.cache.put(("label", self.getId()), label)
+        return label
+
+    def __str__(self):
+        return "Edge %s: %s" % (self.getId(), self.getProperties())
+
+
+class CachedIndex(object):
+    """An index served by a CachingIndexableGraph. Lookups
+    are cached by key and value and invalidated by the writes
+    made through this object"""
+
+    def __init__(self, graph, index):
+        """Constructor
+        @params graph: The CachingIndexableGraph the index belongs to
+        @params index: The backend index being wrapped"""
+        self.graph = graph
+        self.index = index
+        self.indexName = index.getIndexName()
+        self.indexClass = index.getIndexClass()
+
+    def _isVertexIndex(self):
+        return _indexKind(self.indexClass) == "vertex"
+
+    def count(self, key, value):
+        """Returns the number of elements indexed for a
+        given key-value pair
+        @params key: Index key string
+        @params value: Index value string
+
+        @returns The number of elements indexed"""
+        cached = self.graph.cache.get(("index", self.indexName,
+                                       self.indexClass, key, value))
+        if cached is not None:
+            return len(cached)
+        return self.index.count(key, value)
+
+    def getIndexName(self):
+        """Returns the name of the index
+
+        @returns The name of the index"""
+        return self.indexName
+
+    def getIndexClass(self):
+        """Returns the index class (vertex or edge)
+
+        @returns The index class"""
+        return self.indexClass
+
+    def getIndexType(self):
+        """Returns the index type (automatic or manual)
+
+        @returns The index type"""
+        return self.index.getIndexType()
+
+    def put(self, key, value, element):
+        """Puts an element in an index under a given
+        key-value pair
+        @params key: Index key string
+        @params value: Index value string
+        @params element: Vertex or Edge element to be indexed"""
+        self.index.put(key, value, _unwrap(element))
+        self.graph.invalidateIndex(self.indexName, key, value)
+
+    def get(self, key, value, properties=None):
+        """Gets the elements indexed under a given key-value
+        pair, from the cache when possible
+        @params key: Index key string
+        @params value: Index value string
+        @params properties: Optional list of the property keys to
+                            retrieve on a cache miss, or False for none
+        @returns A generator of Vertex or Edge objects"""
+        cacheKey = ("index", self.indexName, self.indexClass, key, value)
+        cls = CachedVertex if self._isVertexIndex() else CachedEdge
+        ids = self.graph.cache.get(cacheKey)
+        if ids is not None:
+            for _id in ids:
+                yield cls(self.graph, None, _id)
+            return
+        version = self.graph._writes
+        elements = [self.graph._wrap(cls, element, version)
+                    for element in _project(self.index.get, properties,
+                                            key, value)]
+        self.graph.cache.put(cacheKey, [element.getId()
+                                        for element in elements])
+        for element in elements:
+            yield element
+
+    def remove(self, key, value, element):
+        """Removes an element from an index under a given
+        key-value pair
+        @params key: Index key string
+        @params value: Index value string
+        @params element: Vertex or Edge element to be removed"""
+        self.index.remove(key, value, _unwrap(element))
+        self.graph.invalidateIndex(self.indexName, key, value)
+
+    def __str__(self):
+        return "Index: %s (%s, %s)" % (self.indexName,
+                                       self.indexClass,
+                                       self.getIndexType())
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+
+#####################################################################
+# Property codecs translating Python values into the values stored  #
+# by a graph backend and back.                                      #
+#                                                                   #
+# File: pyblueprints/codec.py                                       #
+#####################################################################
+
+import array
+import base64
+import sys
+import zlib
+
+
+# Prefix of the strings holding values encoded by CompactCodec
+MARKER = u"\x00pyb:"
+
+_NATIVE = (bool, int, long, float, str, unicode)
+_INT32 = (-2 ** 31, 2 ** 31 - 1)
+
+
+class PropertyCodec(object):
+    """An abstract class defining how property values are
+    encoded before being sent to the backend and decoded
+    when they are read"""
+
+    def encode(self, value):
+        """Encodes a value to be stored
+        @params value: The Python value
+
+        @returns The value to be sent to the backend"""
+        raise NotImplementedError("Method has to be implemented")
+
+    def decode(self, value):
+        """Decodes a stored value
+        @params value: The value read from the backend
+
+        @returns The Python value"""
+        raise NotImplementedError("Method has to be implemented")
+
+
+class StringCodec(PropertyCodec):
+    """Stores every value as a unicode string. It was the
+    behaviour of setProperties before codecs were introduced"""
+
+    def encode(self, value):
+        return unicode(value)
+
+    def decode(self, value):
+        return value
+
+
+class NativeCodec(PropertyCodec):
+    """Stores numbers, booleans and strings with their own type
+    and homogeneous sequences of them as arrays. None is passed
+    through. Any other value raises TypeError, since the backend
+    could not store it in a way it can be decoded"""
+
+    def encode(self, value):
+        if value is None or isinstance(value, _NATIVE):
+            return value
+        if isinstance(value, array.array):
+            return value.tolist()
+        if isinstance(value, (list, tuple)) and _homogeneous(value):
+            return list(value)
+        raise TypeError("Unable to store a %s property value: %r" %
+                        (type(value).__name__, value))
+
+    def decode(self, value):
+        return value
+
+
+class CompactCodec(NativeCodec):
+    """Extends NativeCodec packing numeric sequences of at least
+    minLength items as binary arrays and compressing strings of
+    at least minLength characters. Packed values are stored as
+    base64 strings and decoded into array.array objects, which
+    keep the numbers in a single buffer instead of one Python
+    object per item"""
+
+    def __init__(self, minLength=64):
+        """Constructor
+        @params minLength: Minimum size of the values to be packed"""
+        self.minLength = minLength
+
+    def encode(self, value):
+        if isinstance(value, array.array) and value.typecode in "id":
+            return self._pack(value)
+        if (isinstance(value, (list, tuple)) and len(value) >= self.minLength
+                and _homogeneous(value)):
+            typecode = _numericTypecode(value)
+            if typecode is not None:
+                return self._pack(array.array(typecode, value))
+        if isinstance(value, (str, unicode)) and len(value) >= self.minLength:
+            if isinstance(value, unicode):
+                typecode, data = "u", value.encode("utf-8")
+            else:
+                typecode, data = "s", value
+            compressed = zlib.compress(data)
+            if len(compressed) * 4 / 3 < len(data):
+                return u"%sz%s:%s" % (MARKER, typecode,
+                                      base64.b64encode(compressed))
+        return super(CompactCodec, self).encode(value)
+
+    def _pack(self, values):
+        if sys.byteorder == "big":
+            values = array.array(values.typecode, values)
+            values.byteswap()
+        return u"%sa%s:%s" % (MARKER, values.typecode,
+                              base64.b64encode(values.tostring()))
+
+    def decode(self, value):
+        if not isinstance(value, unicode) or not value.startswith(MARKER):
+            return value
+        kind = value[len(MARKER)]
+        typecode = value[len(MARKER) + 1]
+        data = base64.b64decode(value[len(MARKER) + 3:])
+        if kind == "a":
+            values = array.array(str(typecode))
+            values.fromstring(data)
+            if sys.byteorder == "big":
+                values.byteswap()
+            return values
+        data = zlib.decompress(data)
+        if typecode == "u":
+            return data.decode("utf-8")
+        return data
+
+
+def _homogeneous(values):
+    """Checks that a sequence can be stored as a backend array:
+    every item is a number, a boolean or a string, all of them
+    of the same kind"""
+    kinds = set()
+    for item in values:
+        if isinstance(item, bool):
+            kinds.add(bool)
+        elif isinstance(item, (int, long, float)):
+            kinds.add(float)
+        elif isinstance(item, (str, unicode)):
+            kinds.add(unicode)
+        else:
+            return False
+    return len(kinds) <= 1
+
+
+def _numericTypecode(values):
+    """Returns the array typecode able to hold the given numbers
+    without losing precision, or None"""
+    if not values or isinstance(values[0], bool):
+        return None
+    if all(isinstance(item, (int, long)) for item in values):
+        if _INT32[0] <= min(values) and max(values) <= _INT32[1]:
+            return "i"
+        return None
+    return "d"
@@ -0,0 +1,371 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+
+#####################################################################
+# A set of classes implementing Blueprints API over plain Python    #
+# dictionaries. Used to hold local copies of remote graphs.         #
+#                                                                   #
+# File: pyblueprints/memory.py                                      #
+#####################################################################
+
+import itertools
+
+from base import Graph, _labels
+
+
+class ReadOnlyGraphError(Exception):
+
+    def __init__(self, operation, *args, **kwargs):
+        self.operation = operation
+
+    def __str__(self):
+        return "Unable to %s: the graph is read only" % self.operation
+
+
+class DuplicateIdError(Exception):
+
+    def __init__(self, _id, *args, **kwargs):
+        self.id = _id
+
+    def __str__(self):
+        return "The identifier %s is already in use" % self.id
+
+
+class MemoryGraph(Graph):
+    """A graph stored in memory. Vertices and edges keep the
+    identifiers they are created with, so it can hold copies
+    of other graphs"""
+
+    def __init__(self, readOnly=False):
+        """Constructor
+        @params readOnly: If True every write raises ReadOnlyGraphError"""
+        self.readOnly = readOnly
+        self.vertices = {}
+        self.edges = {}
+        self._ids = itertools.count(1)
+
+    def _checkWritable(self, operation):
+        if self.readOnly:
+            raise ReadOnlyGraphError(operation)
+
+    def _newId(self, existing):
+        _id = next(self._ids)
+        while _id in existing:
+            _id = next(self._ids)
+        return _id
+
+    def addVertex(self, _id=None, properties=None):
+        """Adds a new vertex to the graph
+        @params _id: Node unique identifier. Generated if None
+        @params properties: Optional dictionary of initial properties
+
+        @returns The created Vertex, or raises DuplicateIdError if
+        the identifier belongs to another vertex"""
+        self._checkWritable("add a vertex")
+        if _id is None:
+            _id = self._newId(self.vertices)
+        elif _id in self.vertices:
+            raise DuplicateIdError(_id)
+        vertex = Vertex(self, _id, properties)
+        self.vertices[_id] = vertex
+        return vertex
+
+    def getVertex(self, _id, properties=None):
+        """Retrieves an existing vertex from the graph
+        @params _id: Node unique identifier
+        @params properties: Ignored, the properties are in memory
+
+        @returns The requested Vertex or None"""
+        return self.vertices.get(_id)
+
+    def getVertices(self, properties=None):
+        """Returns an iterator with all the vertices
+        @params properties: Ignored, the properties are in memory"""
+        return iter(list(self.vertices.values()))
+
+    def getVerticesById(self, ids, properties=None):
+        """Retrieves several vertices at once
+        @params ids: Iterable of node unique identifiers
+        @params properties: Ignored, the properties are in memory
+
+        @returns A list with the requested Vertex objects in input
+        order, with None for the missing ones"""
+        return [self.vertices.get(_id) for _id in ids]
+
+    def removeVertex(self, vertex):
+        """Removes the given vertex and all its edges
+        @params vertex: Node to be removed"""
+        self._checkWritable("remove a vertex")
+        vertex = self.vertices.pop(vertex.getId())
+        for edge in list(vertex._outEdges.values()) + \
+                list(vertex._inEdges.values()):
+            self._removeEdge(edge)
+
+    def addEdge(self, outVertex, inVertex, label, _id=None, properties=None):
+        """Creates a new edge
+        @params outVertex: Edge origin Vertex
+        @params inVertex: Edge target vertex
+        @params label: Edge label
+        @params _id: Edge unique identifier. Generated if None
+        @params properties: Optional dictionary of initial properties
+
+        @returns The created Edge object, or raises DuplicateIdError
+        if the identifier belongs to another edge"""
+        self._checkWritable("add an edge")
+        if _id is None:
+            _id = self._newId(self.edges)
+        elif _id in self.edges:
+            raise DuplicateIdError(_id)
+        outVertex = self.vertices[outVertex.getId()]
+        inVertex = self.vertices[inVertex.getId()]
+        edge = Edge(self, _id, outVertex, inVertex, label, properties)
+        self.edges[_id] = edge
+        outVertex._outEdges[_id] = edge
+        inVertex._inEdges[_id] = edge
+        return edge
+
+    def getEdge(self, _id, properties=None):
+        """Retrieves an existing edge from the graph
+        @params _id: Edge unique identifier
+        @params properties: Ignored, the properties are in memory
+
+        @returns The requested Edge or None"""
+        return self.edges.get(_id)
+
+    def getEdges(self, properties=None):
+        """Returns an iterator with all the edges
+        @params properties: Ignored, the properties are in memory"""
+        return iter(list(self.edges.values()))
+
+    def getEdgesById(self, ids, properties=None):
+        """Retrieves several edges at once
+        @params ids: Iterable of edge unique identifiers
+        @params properties: Ignored, the properties are in memory
+
+        @returns A list with the requested Edge objects in input
+        order, with None for the missing ones"""
+        return [self.edges.get(_id) for _id in ids]
+
+    def removeEdge(self, edge):
+        """Removes the given edge
+        @params edge: The edge to be removed"""
+        self._checkWritable("remove an edge")
+        self._removeEdge(self.edges[edge.getId()])
+
+    def _removeEdge(self, edge):
+        self.edges.pop(edge.getId(), None)
+        edge.outVertex._outEdges.pop(edge.getId(), None)
+        edge.inVertex._inEdges.pop(edge.getId(), None)
+
+    def getModifiedElements(self, key, since=None):
+        """Retrieves the elements whose timestamp property is
+        greater than or equal to a given value
+        @params key: The property holding the modification timestamp
+        @params since: Lower bound of the timestamp, or None for all
+
+        @returns A tuple with an iterator of vertices and an
+        iterator of edges"""
+        def modified(elements):
+            return [element for element in elements
+                    if since is None or (key in element._properties and
+                                         element._properties[key] >= since)]
+        return (iter(modified(self.vertices.values())),
+                iter(modified(self.edges.values())))
+
+    def expandFrontier(self, ids, direction="out", label=None):
+        """Retrieves the edges adjacent to a whole set of vertices
+        @params ids: Iterable of vertex unique identifiers
+        @params direction: out, in or both
+        @params label: Optional label, or list of labels, to filter
+                       the edges
+
+        @returns A dictionary mapping each vertex identifier to a
+        list of (Edge, neighbour identifier) tuples"""
+        labels = _labels(label)
+        frontier = {}
+        for _id in ids:
+            vertex = self.vertices.get(_id)
+            edges = []
+            if vertex is not None:
+                if direction in ("out", "both"):
+                    edges.extend((edge, edge.inVertex.getId())
+                                 for edge in vertex._outEdges.values()
+                                 if labels is None or edge.label in labels)
+                if direction in ("in", "both"):
+                    # A self-loop is both an out and an in edge, it is
+                    # listed once as getBothEdges does
+                    edges.extend((edge, edge.outVertex.getId())
+                                 for edgeId, edge in vertex._inEdges.items()
+                                 if (labels is None or edge.label in labels)
+                                 and not (direction == "both"
+                                          and edgeId in vertex._outEdges))
+            frontier[_id] = edges
+        return frontier
+
+    def clear(self):
+        """Removes all data in the graph"""
+        self._checkWritable("clear the graph")
+        self.vertices = {}
+        self.edges = {}
+
+    def shutdown(self):
+        """Nothing to be done for an in memory graph"""
+        pass
+
+    def __str__(self):
+        return "MemoryGraph: %s vertices, %s edges" % (len(self.vertices),
+                                                      len(self.edges))
+
+
+class Element(object):
+    """An class defining an Element object composed
+    by a collection of key/value properties stored
+    in memory"""
+
+    def __init__(self, graph, _id, properties=None):
+        """Constructor
+        @params graph: The MemoryGraph the element belongs to
+        @params _id: The element unique identifier
+        @params properties: Optional dictionary of initial properties"""
+        self.graph = graph
+        self._id = _id
+        self._properties = dict(properties or {})
+
+    def getProperty(self, key):
+        """Gets the value of the property for the given key
+        @params key: The key which value is being retrieved
+
+        @returns The value of the property with the given key"""
+        return self._properties.get(key)
+
+    def getPropertyKeys(self):
+        """Returns a set with the property keys of the element
+
+        @returns Set of property keys"""
+        return self._properties.keys()
+
+    def getProperties(self):
+        """Returns all the properties of the element at once
+
+        @returns A dictionary with the properties of the element"""
+        return dict(self._properties)
+
+    def setProperty(self, key, value):
+        """Sets the property of the element to the given value
+        @params key: The property key to set
+        @params value: The value to set"""
+        self.graph._checkWritable("set a property")
+        self._properties[key] = value
+
+    def getId(self):
+        """Returns the unique identifier of the element
+
+        @returns The unique identifier of the element"""
+        return self._id
+
+    def getLoadedKeys(self):
+        """Every property is held in memory
+
+        @returns None"""
+        return None
+
+    def removeProperty(self, key):
+        """Removes the value of the property for the given key
+        @params key: The key which value is being removed"""
+        self.graph._checkWritable("remove a property")
+        self._properties.pop(key, None)
+
+
+class Vertex(Element):
+    """A class defining a Vertex object representing
+    a node of the graph with a set of properties"""
+
+    def __init__(self, graph, _id, properties=None):
+        super(Vertex, self).__init__(graph, _id, properties)
+        self._outEdges = {}
+        self._inEdges = {}
+
+    def _filter(self, edges, label):
+        for edge in list(edges.values()):
+            if label is None or edge.label == label:
+                yield edge
+
+    def getOutEdges(self, label=None, properties=None):
+        """Gets all the outgoing edges of the node. If label
+        parameter is provided, it only returns the edges of
+        the given label
+        @params label: Optional parameter to filter the edges
+        @params properties: Ignored, the properties are in memory
+
+        @returns A generator function with the outgoing edges"""
+        return self._filter(self._outEdges, label)
+
+    def getInEdges(self, label=None, properties=None):
+        """Gets all the incoming edges of the node. If label
+        parameter is provided, it only returns the edges of
+        the given label
+        @params label: Optional parameter to filter the edges
+        @params properties: Ignored, the properties are in memory
+
+        @returns A generator function with the incoming edges"""
+        return self._filter(self._inEdges, label)
+
+    def getBothEdges(self, label=None, properties=None):
+        """Gets all the edges of the node. If label
+        parameter is provided, it only returns the edges of
+        the given label
+        @params label: Optional parameter to filter the edges
+        @params properties: Ignored, the properties are in memory
+
+        @returns A generator function with the edges"""
+        edges = dict(self._outEdges)
+        edges.update(self._inEdges)
+        return self._filter(edges, label)
+
+    def __str__(self):
+        return "Vertex %s: %s" % (self._id, self._properties)
+
+
+class Edge(Element):
+    """A class defining a Edge object representing
+    a relationship of the graph with a set of properties"""
+
+    def __init__(self, graph, _id, outVertex, inVertex, label,
+                 properties=None):
+        super(Edge, self).__init__(graph, _id, properties)
+        self.outVertex = outVertex
+        self.inVertex = inVertex
+        self.label = label
+
+    def getOutVertex(self):
+        """Returns the origin Vertex of the relationship
+
+        @returns The origin Vertex"""
+        return self.outVertex
+
+    def getInVertex(self):
+        """Returns the target Vertex of the relationship
+
+        @returns The target Vertex"""
+        return self.inVertex
+
+    def getOutVertexId(self):
+        """Returns the identifier of the origin Vertex
+
+        @returns The origin Vertex identifier"""
+        return self.outVertex.getId()
+
+    def getInVertexId(self):
+        """Returns the identifier of the target Vertex
+
+        @returns The target Vertex identifier"""
+        return self.inVertex.getId()
+
+    def getLabel(self):
+        """Returns the label of the relationship
+
+        @returns The edge label"""
+        return self.label
+
+    def __str__(self):
+        return "Edge %s: %s" % (self._id, self._properties)
@@ -0,0 +1,532 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+
+#####################################################################
+# A local replica of a remote graph. Reads are served from memory,  #
+# writes go through to the remote graph and are applied locally.    #
+#                                                                   #
+# File: pyblueprints/mirror.py                                      #
+#####################################################################
+
+import threading
+import time
+
+from base import Graph
+from memory import MemoryGraph
+from algorithms import _readProperties
+
+
+def _endpointIds(edge):
+    """Returns the identifiers of the vertices of an edge, without
+    retrieving the vertices when the backend allows it"""
+    if hasattr(edge, "getOutVertexId"):
+        try:
+            return edge.getOutVertexId(), edge.getInVertexId()
+        except NotImplementedError:
+            pass
+    return edge.getOutVertex().getId(), edge.getInVertex().getId()
+
+
+def _unwrap(element):
+    """Returns the local element behind a mirrored element"""
+    if isinstance(element, MirrorElement):
+        return element._local()
+    return element
+
+
+class MirrorGraph(Graph):
+    """A graph keeping an in memory copy of a remote graph. The
+    copy is bulk loaded on creation and kept up to date either by
+    polling the elements modified since the last refresh, when a
+    timestamp property is maintained by the writers, or by reloading
+    the whole graph. Reads never reach the remote graph unless the
+    copy is older than maxLag seconds. Once start is called the
+    copy is only refreshed by the background thread, and reads of
+    a copy older than maxLag wake it up and are served the copy
+    they find, whose age is given by getStaleness"""
+
+    def __init__(self, remote, timestampKey=None, refreshInterval=None,
+                 maxLag=None, resyncInterval=None):
+        """Constructor
+        @params remote: The Graph object to be mirrored
+        @params timestampKey: Optional property holding the modification
+                              timestamp of the elements
+        @params refreshInterval: Seconds between background refreshes
+                                 once start is called
+        @params maxLag: Maximum staleness, in seconds, tolerated by reads
+                        before a refresh is forced. None to never force it.
+                        A refresh is not forced again until maxLag seconds
+                        after the last one finished
+        @params resyncInterval: Seconds between whole reloads when polling
+                                by timestamp, to catch removed elements.
+                                None to never reload"""
+        self.remote = remote
+        self.timestampKey = timestampKey
+        self.refreshInterval = refreshInterval
+        self.maxLag = maxLag
+        self.resyncInterval = resyncInterval
+        self.lastError = None
+        self._lock = threading.RLock()
+        self._stopEvent = threading.Event()
+        self._wakeEvent = threading.Event()
+        self._thread = None
+        # Number of refreshes made, and when the last one finished
+        self._refreshes = 0
+        self._lastFinished = None
+        self.resync()
+
+    def resync(self):
+        """Reloads the whole remote graph and replaces the local
+        copy. The remote iterators retrieve the elements in chunks"""
+        with self._lock:
+            started = time.time()
+            local = MemoryGraph()
+            since = None
+            for vertex in self.remote.getVertices():
+                properties = _readProperties(vertex, None)
+                local.addVertex(vertex.getId(), properties)
+                since = self._newest(since, properties)
+            for edge in self.remote.getEdges():
+                outId, inId = _endpointIds(edge)
+                outVertex = local.getVertex(outId)
+                inVertex = local.getVertex(inId)
+                if outVertex is not None and inVertex is not None:
+                    properties = _readProperties(edge, None)
+                    local.addEdge(outVertex, inVertex, edge.getLabel(),
+                                  edge.getId(), properties)
+                    since = self._newest(since, properties)
+            self.local = local
+            self._since = since
+            self._lastSync = started
+            self._lastResync = started
+            self._refreshed()
+
+    def refresh(self):
+        """Brings the local copy up to date. Only the elements
+        modified since the last refresh are retrieved when a
+        timestamp property is configured and the remote graph
+        supports it. Otherwise the whole graph is reloaded"""
+        if self.timestampKey is None or (
+                self.resyncInterval is not None
+                and time.time() - self._lastResync >= self.resyncInterval):
+            return self.resync()
+        if not hasattr(self.remote, "getModifiedElements"):
+            return self.resync()
+        with self._lock:
+            started = time.time()
+            try:
+                # Elements written at the newest timestamp already seen
+                # may have been missed, so the bound is inclusive.
+                # Applying an element again leaves the copy unchanged
+                vertices, edges = self.remote.getModifiedElements(
+                    self.timestampKey, self._since)
+            except NotImplementedError:
+                return self.resync()
+            since = self._since
+            for vertex in vertices:
+                properties = _readProperties(vertex, None)
+                self._applyVertex(vertex.getId(), properties)
+                since = self._newest(since, properties)
+            for edge in edges:
+                properties = _readProperties(edge, None)
+                self._applyEdge(edge, properties)
+                since = self._newest(since, properties)
+            self._since = since
+            self._lastSync = started
+            self._refreshed()
+
+    def _refreshed(self):
+        self._refreshes += 1
+        self._lastFinished = time.time()
+
+    def _newest(self, since, properties):
+        if self.timestampKey is None or self.timestampKey not in properties:
+            return since
+        timestamp = properties[self.timestampKey]
+        if since is None or timestamp > since:
+            return timestamp
+        return since
+
+    def _applyVertex(self, _id, properties):
+        vertex = self.local.getVertex(_id)
+        if vertex is None:
+            return self.local.addVertex(_id, properties)
+        for key in list(vertex.getPropertyKeys()):
+            if key not in properties:
+                vertex.removeProperty(key)
+        for key, value in properties.items():
+            vertex.setProperty(key, value)
+        return vertex
+
+    def _applyEdge(self, edge, properties):
+        local = self.local.getEdge(edge.getId())
+        if local is not None:
+            for key in list(local.getPropertyKeys()):
+                if key not in properties:
+                    local.removeProperty(key)
+            for key, value in properties.items():
+                local.setProperty(key, value)
+            return local
+        vertices = []
+        for _id in _endpointIds(edge):
+            vertex = self.local.getVertex(_id)
+            if vertex is None:
+                remoteVertex = self.remote.getVertex(_id)
+                if remoteVertex is None:
+                    return None
+                vertex = self._applyVertex(_id,
+                                           _readProperties(remoteVertex, None))
+            vertices.append(vertex)
+        return self.local.addEdge(vertices[0], vertices[1], edge.getLabel(),
+                                  edge.getId(), properties)
+
+    def getStaleness(self):
+        """Returns the age of the local copy, measured from the
+        beginning of the last successful refresh
+
+        @returns The staleness in seconds"""
+        return time.time() - self._lastSync
+
+    def _ensureFresh(self):
+        if self.maxLag is None or self.getStaleness() <= self.maxLag:
+            return
+        if self._thread is not None:
+            self._wakeEvent.set()
+            return
+        refreshes = self._refreshes
+        with self._lock:
+            # Readers waiting for the refresh of another one do not
+            # refresh again, and neither do readers arriving right
+            # after a refresh that took longer than maxLag
+            if self._refreshes != refreshes or \
+                    time.time() - self._lastFinished < self.maxLag:
+                return
+            self.refresh()
+
+    def start(self):
+        """Starts refreshing the local copy in a background thread
+        every refreshInterval seconds"""
+        if self.refreshInterval is None:
+            raise ValueError("refreshInterval is required to start")
+        if self._thread is not None:
+            return
+        self._stopEvent.clear()
+        self._wakeEvent.clear()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stops the background refreshes"""
+        if self._thread is None:
+            return
+        self._stopEvent.set()
+        self._wakeEvent.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while True:
+            # Woken up early by stale reads and by stop
+            self._wakeEvent.wait(self.refreshInterval)
+            self._wakeEvent.clear()
+            if self._stopEvent.is_set():
+                break
+            try:
+                self.refresh()
+                self.lastError = None
+            except Exception as e:
+                # Keep serving the last good copy until the next attempt
+                self.lastError = e
+
+    def addVertex(self, _id=None):
+        """Adds a new vertex to the remote graph and to the copy
+        @params _id: Node unique identifier
+
+        @returns The created Vertex or None"""
+        with self._lock:
+            vertex = self.remote.addVertex(_id)
+            if vertex is None:
+                return None
+            local = self._applyVertex(vertex.getId(),
+                                      _readProperties(vertex, None))
+        return MirrorVertex(self, local, vertex)
+
+    def getVertex(self, _id, properties=None):
+        """Retrieves an existing vertex from the local copy
+        @params _id: Node unique identifier
+        @params properties: Ignored, the copy holds every property
+
+        @returns The requested Vertex or None"""
+        self._ensureFresh()
+        vertex = self.local.getVertex(_id)
+        if vertex is None:
+            return None
+        return MirrorVertex(self, vertex)
+
+    def getVertices(self, properties=None):
+        """Returns an iterator with all the vertices of the copy
+        @params properties: Ignored, the copy holds every property"""
+        self._ensureFresh()
+        for vertex in self.local.getVertices():
+            yield MirrorVertex(self, vertex)
+
+    def getVerticesById(self, ids, properties=None):
+        """Retrieves several vertices from the local copy
+        @params ids: Iterable of node unique identifiers
+        @params properties: Ignored, the copy holds every property
+
+        @returns A list with the requested Vertex objects in input
+        order, with None for the missing ones"""
+        self._ensureFresh()
+        return [MirrorVertex(self, vertex) if vertex is not None else None
+                for vertex in self.local.getVerticesById(ids)]
+
+    def removeVertex(self, vertex):
+        """Removes the given vertex from the remote graph and the copy
+        @params vertex: Node to be removed"""
+        with self._lock:
+            self.remote.removeVertex(vertex._remote())
+            local = self.local.getVertex(vertex.getId())
+            if local is not None:
+                self.local.removeVertex(local)
+
+    def addEdge(self, outVertex, inVertex, label):
+        """Creates a new edge in the remote graph and in the copy
+        @params outVertex: Edge origin Vertex
+        @params inVertex: Edge target vertex
+        @params label: Edge label
+
+        @returns The created Edge object"""
+        with self._lock:
+            edge = self.remote.addEdge(outVertex._remote(),
+                                       inVertex._remote(), label)
+            local = self.local.addEdge(_unwrap(outVertex), _unwrap(inVertex),
+                                       label, edge.getId(),
+                                       _readProperties(edge, None))
+        return MirrorEdge(self, local, edge)
+
+    def getEdge(self, _id, properties=None):
+        """Retrieves an existing edge from the local copy
+        @params _id: Edge unique identifier
+        @params properties: Ignored, the copy holds every property
+
+        @returns The requested Edge or None"""
+        self._ensureFresh()
+        edge = self.local.getEdge(_id)
+        if edge is None:
+            return None
+        return MirrorEdge(self, edge)
+
+    def getEdges(self, properties=None):
+        """Returns an iterator with all the edges of the copy
+        @params properties: Ignored, the copy holds every property"""
+        self._ensureFresh()
+        for edge in self.local.getEdges():
+            yield MirrorEdge(self, edge)
+
+    def getEdgesById(self, ids, properties=None):
+        """Retrieves several edges from the local copy
+        @params ids: Iterable of edge unique identifiers
+        @params properties: Ignored, the copy holds every property
+
+        @returns A list with the requested Edge objects in input
+        order, with None for the missing ones"""
+        self._ensureFresh()
+        return [MirrorEdge(self, edge) if edge is not None else None
+                for edge in self.local.getEdgesById(ids)]
+
+    def removeEdge(self, edge):
+        """Removes the given edge from the remote graph and the copy
+        @params edge: The edge to be removed"""
+        with self._lock:
+            self.remote.removeEdge(edge._remote())
+            local = self.local.getEdge(edge.getId())
+            if local is not None:
+                self.local.removeEdge(local)
+
+    def expandFrontier(self, ids, direction="out", label=None):
+        """Retrieves the edges adjacent to a whole set of vertices
+        from the local copy
+        @params ids: Iterable of vertex unique identifiers
+        @params direction: out, in or both
+        @params label: Optional label, or list of labels, to filter
+                       the edges
+
+        @returns A dictionary mapping each vertex identifier to a
+        list of (Edge, neighbour identifier) tuples"""
+        self._ensureFresh()
+        frontier = self.local.expandFrontier(ids, direction, label)
+        for _id, edges in frontier.items():
+            frontier[_id] = [(MirrorEdge(self, edge), neighbour)
+                             for edge, neighbour in edges]
+        return frontier
+
+    def clear(self):
+        """Removes all data in the remote graph and in the copy"""
+        with self._lock:
+            self.remote.clear()
+            self.local = MemoryGraph()
+
+    def shutdown(self):
+        """Stops the background refreshes and shuts down the
+        remote graph"""
+        self.stop()
+        self.remote.shutdown()
+
+    def __str__(self):
+        return "MirrorGraph: %s" % self.remote
+
+
+class MirrorElement(object):
+    """An element of a MirrorGraph. Reads are served by the local
+    copy and writes are sent to the remote element first"""
+
+    def __init__(self, graph, local, remote=None):
+        """Constructor
+        @params graph: The MirrorGraph the element belongs to
+        @params local: The element of the local copy
+        @params remote: The remote element, if already retrieved"""
+        self.graph = graph
+        self._id = local.getId()
+        self._localElement = local
+        self._remoteElement = remote
+
+    def _local(self):
+        # The copy is replaced on every whole reload
+        return self._lookup(self.graph.local) or self._localElement
+
+    def _remote(self):
+        if self._remoteElement is None:
+            self._remoteElement = self._lookup(self.graph.remote)
+        return self._remoteElement
+
+    def getId(self):
+        """Returns the unique identifier of the element
+
+        @returns The unique identifier of the element"""
+        return self._id
+
+    def getLoadedKeys(self):
+        """Every property is held by the local copy
+
+        @returns None"""
+        return None
+
+    def getProperty(self, key):
+        """Gets the value of the property for the given key
+        @params key: The key which value is being retrieved
+
+        @returns The value of the property with the given key"""
+        return self._local().getProperty(key)
+
+    def getPropertyKeys(self):
+        """Returns a set with the property keys of the element
+
+        @returns Set of property keys"""
+        return self._local().getPropertyKeys()
+
+    def getProperties(self):
+        """Returns all the properties of the element at once
+
+        @returns A dictionary with the properties of the element"""
+        return self._local().getProperties()
+
+    def setProperty(self, key, value):
+        """Sets the property of the element to the given value
+        @params key: The property key to set
+        @params value: The value to set"""
+        with self.graph._lock:
+            self._remote().setProperty(key, value)
+            self._local().setProperty(key, value)
+
+    def removeProperty(self, key):
+        """Removes the value of the property for the given key
+        @params key: The key which value is being removed"""
+        with self.graph._lock:
+            self._remote().removeProperty(key)
+            self._local().removeProperty(key)
+
+
+class MirrorVertex(MirrorElement):
+    """A vertex of a MirrorGraph"""
+
+    def _lookup(self, graph):
+        return graph.getVertex(self._id)
+
+    def _wrap(self, edges):
+        for edge in edges:
+            yield MirrorEdge(self.graph, edge)
+
+    def getOutEdges(self, label=None, properties=None):
+        """Gets all the outgoing edges of the node. If label
+        parameter is provided, it only returns the edges of
+        the given label
+        @params label: Optional parameter to filter the edges
+        @params properties: Ignored, the copy holds every property
+
+        @returns A generator function with the outgoing edges"""
+        return self._wrap(self._local().getOutEdges(label))
+
+    def getInEdges(self, label=None, properties=None):
+        """Gets all the incoming edges of the node. If label
+        parameter is provided, it only returns the edges of
+        the given label
+        @params label: Optional parameter to filter the edges
+        @params properties: Ignored, the copy holds every property
+
+        @returns A generator function with the incoming edges"""
+        return self._wrap(self._local().getInEdges(label))
+
+    def getBothEdges(self, label=None, properties=None):
+        """Gets all the edges of the node. If label
+        parameter is provided, it only returns the edges of
+        the given label
+        @params label: Optional parameter to filter the edges
+        @params properties: Ignored, the copy holds every property
+
+        @returns A generator function with the edges"""
+        return self._wrap(self._local().getBothEdges(label))
+
+    def __str__(self):
+        return "Vertex %s: %s" % (self._id, self.getProperties())
+
+
+class MirrorEdge(MirrorElement):
+    """An edge of a MirrorGraph"""
+
+    def _lookup(self, graph):
+        return graph.getEdge(self._id)
+
+    def getOutVertex(self):
+        """Returns the origin Vertex of the relationship
+
+        @returns The origin Vertex"""
+        return MirrorVertex(self.graph, self._local().getOutVertex())
+
+    def getInVertex(self):
+        """Returns the target Vertex of the relationship
+
+        @returns The target Vertex"""
+        return MirrorVertex(self.graph, self._local().getInVertex())
+
+    def getOutVertexId(self):
+        """Returns the identifier of the origin Vertex
+
+        @returns The origin Vertex identifier"""
+        return self._local().getOutVertexId()
+
+    def getInVertexId(self):
+        """Returns the identifier of the target Vertex
+
+        @returns The target Vertex identifier"""
+        return self._local().getInVertexId()
+
+    def getLabel(self):
+        """Returns the label of the relationship
+
+        @returns The edge label"""
+        return self._local().getLabel()
+
+    def __str__(self):
+        return "Edge %s: %s" % (self._id, self.getProperties())
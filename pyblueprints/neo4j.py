@@ -7,8 +7,19 @@
 # File: pyblueprints/neo4j.py                                       #
 #####################################################################
 
+import json
+import re
+import sys
+import threading
+import time
+import urllib
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
+
 from neo4jrestclient import client 
-from base import Graph
+from base import Graph, _labels
+from codec import NativeCodec
+from pipeline import _chunks
 
 
 class Neo4jDatabaseConnectionError(Exception):
@@ -22,7 +33,12 @@ class Neo4jDatabaseConnectionError(Exception):
 
 class Neo4jGraph(Graph):
 
-    def __init__(self, host):
+    def __init__(self, host, codec=None):
+        """Constructor
+        @params host: The URL of the Neo4j REST API
+        @params codec: Optional PropertyCodec used by the elements of
+                       the graph. Defaults to a NativeCodec"""
+        self.codec = codec or NativeCodec()
         try:
             self.neograph = client.GraphDatabase(host)
         except client.NotFoundError:
@@ -37,22 +53,55 @@ class Neo4jGraph(Graph):
 
         @returns The created Vertex or None"""
         node = self.neograph.nodes.create(_id=_id)
-        return Vertex(node)
+        return Vertex(node, self.codec)
 
-    def getVertex(self, _id):
+    def getVertex(self, _id, properties=None):
         """Retrieves an existing vertex from the graph
         @params _id: Node unique identifier
+        @params properties: Optional list of the property keys to
+                            retrieve, or False to retrieve none
 
         @returns The requested Vertex or None"""
+        if properties is not None:
+            return self.getVerticesById([_id], properties)[0]
         try:
             node = self.neograph.nodes.get(_id)
         except client.NotFoundError:
             return None
-        return Vertex(node)
-
-    def getVertices(self):
-        """Returns an iterator with all the vertices"""
-        raise NotImplementedError("Method has to be implemented")
+        return Vertex(node, self.codec)
+
+    def getVertices(self, properties=None):
+        """Returns an iterator with all the vertices, retrieved
+        in pages of batchSize vertices
+        @params properties: Optional list of the property keys to
+                            retrieve, or False to retrieve none"""
+        if properties is not None:
+            query = "START n=node(*) RETURN %s ORDER BY ID(n)" % \
+                _columns("n", properties)
+            for row in self._cypherPages(query):
+                yield self._projectedVertex(row, properties)
+            return
+        for row in self._cypherPages("START n=node(*) RETURN n "
+                                     "ORDER BY ID(n)"):
+            yield Vertex(self._node(row[0]), self.codec)
+
+    def getVerticesById(self, ids, properties=None):
+        """Retrieves several vertices with one batch request
+        per batchSize identifiers
+        @params ids: Iterable of node unique identifiers
+        @params properties: Optional list of the property keys to
+                            retrieve, or False to retrieve none
+
+        @returns A list with the requested Vertex objects in input
+        order, with None for the missing ones"""
+        if properties is not None:
+            query = "START n=node({id}) RETURN %s" % _columns("n",
+                                                               properties)
+            return [self._projectedVertex(row, properties) if row else None
+                    for row in self._cypherById(query, ids)]
+        bodies = self._batchGet(["/node/%s" % _id for _id in ids])
+        return [Vertex(self._node(body), self.codec) if body else None
+                for body in bodies]
 
     def removeVertex(self, vertex):
         """Removes the given vertex
@@ -69,28 +118,268 @@ class Neo4jGraph(Graph):
         n1 = outVertex.neoelement
         n2 = inVertex.neoelement
         edge = n1.relationships.create(label, n2)
-        return Edge(edge)
+        return Edge(edge, self.codec)
 
-    def getEdge(self, _id):
+    def getEdge(self, _id, properties=None):
         """Retrieves an existing edge from the graph
         @params _id: Edge unique identifier
+        @params properties: Optional list of the property keys to
+                            retrieve, or False to retrieve none
 
         @returns The requested Edge or None"""
+        if properties is not None:
+            return self.getEdgesById([_id], properties)[0]
         try:
             edge = self.neograph.relationships.get(_id)
         except client.NotFoundError:
             return None
-        return Edge(edge)
-
-    def getEdges(self):
-        """Returns an iterator with all the vertices"""
-        raise NotImplementedError("Method has to be implemented")
+        return Edge(edge, self.codec)
+
+    def getEdges(self, properties=None):
+        """Returns an iterator with all the edges, retrieved
+        in pages of batchSize edges
+        @params properties: Optional list of the property keys to
+                            retrieve, or False to retrieve none"""
+        if properties is not None:
+            query = "START r=relationship(*) RETURN %s ORDER BY ID(r)" % \
+                _columns("r", properties, True)
+            for row in self._cypherPages(query):
+                yield self._projectedEdge(row, properties)
+            return
+        for row in self._cypherPages("START r=relationship(*) RETURN r "
+                                     "ORDER BY ID(r)"):
+            yield Edge(self._relationship(row[0]), self.codec)
+
+    def getEdgesById(self, ids, properties=None):
+        """Retrieves several edges with one batch request
+        per batchSize identifiers
+        @params ids: Iterable of edge unique identifiers
+        @params properties: Optional list of the property keys to
+                            retrieve, or False to retrieve none
+
+        @returns A list with the requested Edge objects in input
+        order, with None for the missing ones"""
+        if properties is not None:
+            query = "START r=relationship({id}) RETURN %s" % \
+                _columns("r", properties, True)
+            return [self._projectedEdge(row, properties) if row else None
+                    for row in self._cypherById(query, ids)]
+        bodies = self._batchGet(["/relationship/%s" % _id for _id in ids])
+        return [Edge(self._relationship(body), self.codec) if body else None
+                for body in bodies]
+
+    def getModifiedElements(self, key, since=None):
+        """Retrieves the elements whose timestamp property is
+        greater than or equal to a given value with paged Cypher
+        queries
+        @params key: The property holding the modification timestamp
+        @params since: Lower bound of the timestamp, or None for all
+
+        @returns A tuple with an iterator of vertices and an
+        iterator of edges"""
+        if since is None:
+            return self.getVertices(), self.getEdges()
+        vertices = ("START n=node(*) WHERE n.%s? >= {since} RETURN n "
+                    "ORDER BY ID(n)" % _quote(key))
+        edges = ("START r=relationship(*) WHERE r.%s? >= {since} "
+                 "RETURN r ORDER BY ID(r)" % _quote(key))
+        params = {"since": since}
+        return ((Vertex(self._node(row[0]), self.codec)
+                 for row in self._cypherPages(vertices, params)),
+                (Edge(self._relationship(row[0]), self.codec)
+                 for row in self._cypherPages(edges, params)))
 
     def removeEdge(self, edge):
         """Removes the given edge
         @params edge: The edge to be removed"""
         edge.neoelement.delete()
 
+    def expandFrontier(self, ids, direction="out", label=None):
+        """Retrieves the edges adjacent to a whole set of vertices
+        using one batch request per batchSize vertices. Several labels
+        are retrieved with a single request per vertex
+        @params ids: Iterable of vertex unique identifiers
+        @params direction: out, in or both
+        @params label: Optional label, or list of labels, to filter
+                       the edges
+
+        @returns A dictionary mapping each vertex identifier to a
+        list of (Edge, neighbour identifier) tuples"""
+        ids = list(ids)
+        relationships = {"out": "out", "in": "in", "both": "all"}[direction]
+        labels = _labels(label)
+        if labels is not None:
+            relationships = "%s/%s" % (relationships, "&".join(
+                urllib.quote(name, safe="") for name in labels))
+        paths = ["/node/%s/relationships/%s" % (_id, relationships)
+                 for _id in ids]
+        frontier = {}
+        for _id, body in zip(ids, self._batchGet(paths)):
+            edges = []
+            for relationship in body or []:
+                start = _urlId(relationship["start"])
+                end = _urlId(relationship["end"])
+                if direction == "in" or (direction == "both"
+                                         and end == int(_id)):
+                    neighbour = start
+                else:
+                    neighbour = end
+                edge = Edge(self._relationship(relationship), self.codec)
+                edges.append((edge, neighbour))
+            frontier[_id] = edges
+        return frontier
+
+    def _batchGet(self, paths):
+        """Sends GET requests for the given paths through the batch
+        endpoint
+        @params paths: List of paths relative to the database URL
+
+        @returns A list with the decoded body of each response, or
+        None for the paths that could not be retrieved"""
+        return self._batchRequests([{"method": "GET", "to": path}
+                                    for path in paths])
+
+    def _cypherById(self, query, ids):
+        """Runs a Cypher query once per identifier, as the {id}
+        parameter, through the batch endpoint
+        @params query: The Cypher query
+        @params ids: Iterable of identifiers
+
+        @returns A list with the first row of each query, or None
+        for the identifiers not found"""
+        operations = []
+        for _id in ids:
+            try:
+                _id = int(_id)
+            except (TypeError, ValueError):
+                pass
+            operations.append({"method": "POST", "to": "/cypher",
+                               "body": {"query": query,
+                                        "params": {"id": _id}}})
+        rows = []
+        for body in self._batchRequests(operations):
+            rows.append(body["data"][0] if body and body["data"] else None)
+        return rows
+
+    def _batchRequests(self, operations):
+        """Sends operations through the batch endpoint, batchSize
+        operations per request and up to workers requests at a time.
+        Neo4j rejects a whole batch if any of its operations fails, so
+        failed chunks are split until the failing operations are
+        isolated
+        @params operations: List of dictionaries with the method, the
+                            path and, optionally, the body of each one
+
+        @returns A list with the decoded body of each response, or
+        None for the operations that failed"""
+        chunks = [operations[start:start + self.batchSize]
+                  for start in range(0, len(operations), self.batchSize)]
+        if len(chunks) < 2 or self.workers < 2:
+            bodies = [self._batchChunk(chunk) for chunk in chunks]
+        else:
+            pool = ThreadPool(min(self.workers, len(chunks)))
+            try:
+                bodies = pool.map(self._batchChunk, chunks)
+            finally:
+                pool.close()
+                pool.join()
+        results = []
+        for chunk in bodies:
+            results.extend(chunk)
+        return results
+
+    def _batchChunk(self, operations):
+        if not operations:
+            return []
+        batch = [dict(operation, id=i)
+                 for i, operation in enumerate(operations)]
+        request = client.Request(**self.neograph._auth)
+        response, content = request.post(self.neograph._batch, data=batch)
+        if response.status == 200:
+            bodies = {}
+            for result in json.loads(content):
+                bodies[result["id"]] = result.get("body")
+            return [bodies.get(i) for i in range(len(operations))]
+        elif not _failedOperation(response, content):
+            raise client.StatusException(response.status,
+                                         "Batch request failed")
+        elif len(operations) == 1:
+            return [None]
+        middle = len(operations) // 2
+        return self._batchChunk(operations[:middle]) + \
+               self._batchChunk(operations[middle:])
+
+    def _cypher(self, query, params=None):
+        """Runs a Cypher query through the REST endpoint
+        @params query: The Cypher query
+        @params params: Optional dictionary of query parameters
+
+        @returns The list of result rows"""
+        return _cypher(self.neograph.url, self.neograph._auth, query, params)
+
+    def _cypherPages(self, query, params=None, limit=None):
+        """Runs a Cypher query in pages of batchSize rows
+        @params query: The Cypher query, which must be ordered
+        @params params: Optional dictionary of query parameters
+        @params limit: Optional maximum number of rows
+
+        @returns A generator of result rows"""
+        skip = 0
+        while limit is None or skip < limit:
+            size = self.batchSize
+            if limit is not None:
+                size = min(size, limit - skip)
+            rows = self._cypher("%s SKIP %d LIMIT %d" % (query, skip, size),
+                                params)
+            for row in rows:
+                yield row
+            if len(rows) < size:
+                break
+            skip += size
+
+    def compileTraversal(self, steps):
+        """Compiles traversal steps into a single Cypher query. A
+        limit step ends the query, and so does a dedup step not
+        followed by one. The steps after it are left for another stage
+        @params steps: List of pipeline.Step objects
+
+        @returns A tuple with the CypherStage running the query and
+        the number of steps it covers"""
+        count = 0
+        for step in steps:
+            if step.name not in CypherStage.supported:
+                break
+            # Only the last dedup of a stage spans its chunks
+            if count and steps[count - 1].name == "dedup" \
+                    and step.name != "limit":
+                break
+            count += 1
+            if step.name == "limit":
+                break
+        if not count:
+            return None, 0
+        return CypherStage(self, steps[:count]), count
+
+    def _projectedVertex(self, row, properties):
+        return _projectedVertex(self.neograph.url, self.neograph._auth,
+                                self.codec, row, properties)
+
+    def _projectedEdge(self, row, properties):
+        return _projectedEdge(self.neograph.url, self.neograph._auth,
+                              self.codec, row, properties)
+
+    def _node(self, data):
+        """Builds a client node from its REST representation
+        without requesting it again"""
+        return client.Node(data["self"], update_dict=data,
+                           auth=self.neograph._auth)
+
+    def _relationship(self, data):
+        """Builds a client relationship from its REST representation
+        without requesting it again"""
+        return client.Relationship(data["self"], update_dict=data,
+                                   auth=self.neograph._auth)
+
     def clear(self):
         """Removes all data in the graph database"""
         raise NotImplementedError("Method has to be implemented")
@@ -100,41 +389,334 @@ class Neo4jGraph(Graph):
         raise NotImplementedError("Method has to be implemented")
 
 
+class CypherStage(object):
+    """Runs a run of pipeline steps as one Cypher query per chunk of
+    batchSize traversers, read in pages of batchSize rows. Consecutive
+    hops are fused into a single MATCH pattern and consecutive has
+    steps into a single WHERE clause. As in any Cypher pattern, a
+    relationship is not followed twice by the hops of the same MATCH.
+    A dedup step can only be followed by a limit step, so that both
+    are also applied across the chunks"""
+
+    supported = ("out", "in", "both", "has", "dedup", "limit")
+
+    _arrows = {"out": ("-", "->"), "in": ("<-", "-"), "both": ("-", "-")}
+    _operators = {"eq": "=", "ne": "<>", "gt": ">", "gte": ">=", "lt": "<",
+                  "lte": "<="}
+
+    def __init__(self, graph, steps):
+        """Constructor
+        @params graph: The Neo4jGraph to be traversed
+        @params steps: List of pipeline.Step objects"""
+        self.graph = graph
+        self.steps = steps
+        self.limit = None
+        self.params = {}
+        self.query = self._compile(steps)
+
+    def _compile(self, steps):
+        clauses = ["START n0=node({ids})"]
+        patterns = []
+        conditions = []
+        current = 0
+
+        def flush():
+            if patterns:
+                clauses.append("MATCH %s" % ", ".join(patterns))
+            if conditions:
+                clauses.append("WHERE %s" % " AND ".join(conditions))
+            del patterns[:]
+            del conditions[:]
+
+        for step in steps:
+            if step.name in self._arrows:
+                if conditions:
+                    flush()
+                    clauses.append("WITH n%d" % current)
+                left, right = self._arrows[step.name]
+                relationship = ""
+                if step.label:
+                    relationship = "[:%s]" % _quote(step.label)
+                patterns.append("n%d%s%s%sn%d" % (current, left,
+                                                  relationship, right,
+                                                  current + 1))
+                current += 1
+            elif step.name == "has":
+                conditions.append(self._condition(current, step))
+            elif step.name == "dedup":
+                flush()
+                clauses.append("WITH DISTINCT n%d" % current)
+            elif step.name == "limit":
+                self.limit = step.count
+        flush()
+        clauses.append("RETURN n%d ORDER BY ID(n%d)" % (current, current))
+        return " ".join(clauses)
+
+    def _condition(self, current, step):
+        if step.op == "exists":
+            return "has(n%d.%s)" % (current, _quote(step.key))
+        name = "p%d" % len(self.params)
+        self.params[name] = self.graph.codec.encode(step.value)
+        return "n%d.%s! %s {%s}" % (current, _quote(step.key),
+                                    self._operators[step.op], name)
+
+    def run(self, traversers):
+        """Runs the query from the vertices of the traversers
+        @params traversers: Iterator of (identifier, Vertex or None)
+
+        @returns A generator of (identifier, Vertex)"""
+        dedup = any(step.name == "dedup" for step in self.steps)
+        seen = set()
+        count = 0
+        for chunk in _chunks(traversers, self.graph.batchSize):
+            # Rows already seen do not count towards the limit
+            limit = None
+            if self.limit is not None and not dedup:
+                limit = self.limit - count
+            ids = [_id for _id, element in chunk]
+            for row in self._rows(ids, limit):
+                vertex = Vertex(self.graph._node(row[0]), self.graph.codec)
+                if dedup:
+                    if vertex.getId() in seen:
+                        continue
+                    seen.add(vertex.getId())
+                yield vertex.getId(), vertex
+                count += 1
+                if count == self.limit:
+                    return
+
+    def _rows(self, ids, limit):
+        """Runs the query from the given vertices. Neo4j rejects the
+        whole query if one of them is missing, so they are then looked
+        up and the query runs again without the missing ones, which
+        are dropped as the other stages do
+        @params ids: List of vertex unique identifiers
+        @params limit: Optional maximum number of rows
+
+        @returns A generator of result rows"""
+        if not ids:
+            return
+        pages = self.graph._cypherPages(self.query, dict(self.params,
+                                                         ids=ids), limit)
+        try:
+            first = next(pages)
+        except StopIteration:
+            return
+        except client.StatusException:
+            vertices = self.graph.getVerticesById(ids, False)
+            found = [_id for _id, vertex in zip(ids, vertices)
+                     if vertex is not None]
+            if len(found) == len(ids):
+                raise
+            for row in self._rows(found, limit):
+                yield row
+            return
+        yield first
+        for row in pages:
+            yield row
+
+    def __str__(self):
+        return "Cypher: %s\n    %s" % (", ".join(str(step)
+                                                 for step in self.steps),
+                                       self.query)
+
+
+def _urlId(url):
+    """Extracts the identifier of a node or relationship
+    from its REST URL"""
+    return int(url.rstrip("/").split("/")[-1])
+
+
+def _quote(name):
+    """Quotes a label, property key or index name to be used in a
+    Cypher query, doubling the backticks it contains"""
+    return "`%s`" % name.replace("`", "``")
+
+
+def _failedOperation(response, content):
+    """Tells whether a batch was rejected because one of its
+    operations failed, for instance a missing node, rather than
+    because of the server"""
+    if response.status != 500:
+        return False
+    try:
+        body = json.loads(content)
+    except ValueError:
+        return False
+    return (isinstance(body, dict) and
+            body.get("exception") == "BatchOperationFailedException")
+
+
+def _root(url, resource):
+    """Extracts the database URL from the REST URL of a node,
+    relationship or index"""
+    return url[:url.rindex("/%s/" % resource) + 1]
+
+
+def _cypher(root, auth, query, params=None):
+    """Runs a Cypher query through the REST endpoint
+    @params root: The database URL
+    @params auth: Authentication options of the client
+    @params query: The Cypher query
+    @params params: Optional dictionary of query parameters
+
+    @returns The list of result rows"""
+    request = client.Request(**auth)
+    response, content = request.post("%scypher" % root,
+                                     data={"query": query,
+                                           "params": params or {}})
+    if response.status != 200:
+        raise client.StatusException(response.status,
+                                     "Invalid Cypher query: %s" % query)
+    return json.loads(content)["data"]
+
+
+def _columns(variable, properties, edge=False):
+    """Returns the Cypher columns of a projection: the identifier,
+    the endpoints and the type of edges, and the projected values"""
+    columns = ["ID(%s)" % variable]
+    if edge:
+        columns.extend(["ID(startNode(%s))" % variable,
+                        "ID(endNode(%s))" % variable, "type(%s)" % variable])
+    for key in properties or []:
+        columns.append("%s.%s?" % (variable, _quote(key)))
+    return ", ".join(columns)
+
+
+def _projectedData(row, properties):
+    return dict((key, value) for key, value in zip(properties or [], row)
+                if value is not None)
+
+
+def _projectedVertex(root, auth, codec, row, properties):
+    """Builds a Vertex from a row of a projection without any
+    other request. The client node gets the URLs Neo4j would have
+    sent with the whole node"""
+    url = "%snode/%s" % (root, row[0])
+    data = {"self": url, "data": _projectedData(row[1:], properties),
+            "property": "%s/properties/{key}" % url,
+            "properties": "%s/properties" % url,
+            "extensions": {},
+            "create_relationship": "%s/relationships" % url,
+            "traverse": "%s/traverse/{returnType}" % url,
+            "paged_traverse": "%s/paged/traverse/{returnType}"
+                              "{?pageSize,leaseTime}" % url}
+    for direction, path in (("all", "all"), ("outgoing", "out"),
+                            ("incoming", "in")):
+        data["%s_relationships" % direction] = "%s/relationships/%s" % (
+            url, path)
+        data["%s_typed_relationships" % direction] = \
+            "%s/relationships/%s/{-list|&|types}" % (url, path)
+    node = client.Node(url, update_dict=data, auth=auth)
+    return Vertex(node, codec, properties or [])
+
+
+def _projectedEdge(root, auth, codec, row, properties):
+    """Builds an Edge from a row of a projection without any
+    other request"""
+    url = "%srelationship/%s" % (root, row[0])
+    data = {"self": url, "data": _projectedData(row[4:], properties),
+            "start": "%snode/%s" % (root, row[1]),
+            "end": "%snode/%s" % (root, row[2]),
+            "type": row[3],
+            "property": "%s/properties/{key}" % url,
+            "properties": "%s/properties" % url,
+            "extensions": {}}
+    relationship = client.Relationship(url, update_dict=data, auth=auth)
+    return Edge(relationship, codec, properties or [])
+
+
 class Element(object):
     """An class defining an Element object composed
     by a collection of key/value properties for the
     Neo4j database"""
 
-    def __init__(self, neoelement):
+    def __init__(self, neoelement, codec=None, loadedKeys=None):
         """Constructor
-        @params neolement: The Neo4j element to be transformed"""
+        @params neolement: The Neo4j element to be transformed
+        @params codec: Optional PropertyCodec for the property values
+        @params loadedKeys: Keys of the properties retrieved with a
+                            projection, or None if all of them were"""
         self.neoelement = neoelement
+        self.codec = codec or NativeCodec()
+        self.loadedKeys = None
+        if loadedKeys is not None:
+            self.loadedKeys = set(loadedKeys)
+
+    def getLoadedKeys(self):
+        """Returns the keys of the properties retrieved with the
+        element. The rest are requested when they are read
+
+        @returns A set of keys, or None if all were retrieved"""
+        if self.loadedKeys is None:
+            return None
+        return set(self.loadedKeys)
+
+    def _loadProperties(self):
+        """Retrieves all the properties of a projected element"""
+        if self.loadedKeys is not None:
+            self.neoelement.update(extensions=False)
+            self.loadedKeys = None
 
     def getProperty(self, key):
-        """Gets the value of the property for the given key
+        """Gets the value of the property for the given key. The
+        properties loaded by a projection are not requested again
         @params key: The key which value is being retrieved
 
         @returns The value of the property with the given key"""
-        return self.neoelement.get(key)
+        if self.loadedKeys is not None and key in self.loadedKeys:
+            return self.codec.decode(self.neoelement.properties.get(key))
+        value = self.neoelement.get(key)
+        if self.loadedKeys is not None:
+            self.loadedKeys.add(key)
+        return self.codec.decode(value)
 
     def getPropertyKeys(self):
         """Returns a set with the property keys of the element
 
         @returns Set of property keys"""
+        self._loadProperties()
         return self.neoelement.properties.keys()
 
+    def getProperties(self):
+        """Returns all the properties of the element at once
+
+        @returns A dictionary with the properties of the element"""
+        self._loadProperties()
+        return dict((key, self.codec.decode(value))
+                    for key, value in self.neoelement.properties.items())
+
     def setProperty(self, key, value):
         """Sets the property of the element to the given value
         @params key: The property key to set
         @params value: The value to set. """
-        self.neoelement.set(key, value)
+        self.neoelement.set(key, self.codec.encode(value))
+        if self.loadedKeys is not None:
+            self.loadedKeys.add(key)
 
     def setProperties(self, new_dict):
+        """Updates several properties of the element in one request
+        @params new_dict: Dictionary with the properties to set. The
+                          properties set to None are removed"""
+        if not new_dict:
+            return
+        self._loadProperties()
         element_properties = self.neoelement.properties.copy()
         for key, value in new_dict.iteritems():
-            new_dict[key] = unicode(value)
-        element_properties.update(new_dict)
-        self.neoelement.properties = element_properties
+            value = self.codec.encode(value)
+            if value is None:
+                # Neo4j does not store null values
+                element_properties.pop(key, None)
+            else:
+                element_properties[key] = value
+        # The client setter converts every value to a string
+        request = client.Request(**self.neoelement._auth)
+        response, content = request.put(self.neoelement._dic["properties"],
+                                        data=element_properties)
+        if response.status != 204:
+            raise client.StatusException(response.status,
+                                         "Invalid properties sent")
+        self.neoelement._dic["data"] = element_properties
 
     def getId(self):
         """Returns the unique identifier of the element
@@ -145,6 +727,10 @@ class Element(object):
     def removeProperty(self, key):
         """Removes the value of the property for the given key
         @params key: The key which value is being removed"""
+        if self.loadedKeys is not None:
+            # The client removes the key from the loaded properties
+            self.neoelement.properties.setdefault(key, None)
+            self.loadedKeys.add(key)
         self.neoelement.delete(key)
 
 
@@ -152,48 +738,65 @@ class Vertex(Element):
     """An abstract class defining a Vertex object representing
     a node of the graph with a set of properties"""
 
-    def getOutEdges(self, label=None):
+    def getOutEdges(self, label=None, properties=None):
         """Gets all the outgoing edges of the node. If label
         parameter is provided, it only returns the edges of
         the given label
         @params label: Optional parameter to filter the edges
+        @params properties: Optional list of the property keys of
+                            the edges to retrieve, or False for none
 
         @returns A generator function with the outgoing edges"""
-        if label:
-            for edge in self.neoelement.relationships.outgoing(types=[label]):
-                yield Edge(edge)
-        else:
-            for edge in self.neoelement.relationships.outgoing():
-                yield Edge(edge)
+        if properties is not None:
+            return self._projectedEdges("-%s->", label, properties)
+        return self._edges(self.neoelement.relationships.outgoing, label)
 
-    def getInEdges(self, label=None):
+    def getInEdges(self, label=None, properties=None):
         """Gets all the incoming edges of the node. If label
         parameter is provided, it only returns the edges of
         the given label
         @params label: Optional parameter to filter the edges
+        @params properties: Optional list of the property keys of
+                            the edges to retrieve, or False for none
 
         @returns A generator function with the incoming edges"""
-        if label:
-            for edge in self.neoelement.relationships.incoming(types=[label]):
-                yield Edge(edge)
-        else:
-            for edge in self.neoelement.relationships.incoming():
-                yield Edge(edge)
+        if properties is not None:
+            return self._projectedEdges("<-%s-", label, properties)
+        return self._edges(self.neoelement.relationships.incoming, label)
 
-    def getBothEdges(self, label=None):
+    def getBothEdges(self, label=None, properties=None):
         """Gets all the edges of the node. If label
         parameter is provided, it only returns the edges of
         the given label
         @params label: Optional parameter to filter the edges
+        @params properties: Optional list of the property keys of
+                            the edges to retrieve, or False for none
 
         @returns A generator function with the incoming edges"""
+        if properties is not None:
+            return self._projectedEdges("-%s-", label, properties)
+        return self._edges(self.neoelement.relationships.all, label)
+
+    def _edges(self, relationships, label):
         if label:
-            for edge in self.neoelement.relationships.all(types=[label]):
-                yield Edge(edge)
+            for edge in relationships(types=[label]):
+                yield Edge(edge, self.codec)
         else:
-            for edge in self.neoelement.relationships.all():
-                yield Edge(edge)
+            for edge in relationships():
+                yield Edge(edge, self.codec)
 
+    def _projectedEdges(self, arrow, label, properties):
+        """Retrieves the adjacent edges with a single Cypher query
+        returning only the projected properties"""
+        relationship = "[r]"
+        if label:
+            relationship = "[r:%s]" % _quote(label)
+        query = "START n=node({id}) MATCH n%s() RETURN %s ORDER BY ID(r)" % (
+            arrow % relationship, _columns("r", properties, True))
+        root = _root(self.neoelement.url, "node")
+        auth = self.neoelement._auth
+        for row in _cypher(root, auth, query, {"id": self.getId()}):
+            yield _projectedEdge(root, auth, self.codec, row, properties)
 
     def __str__(self):
         return "Vertex %s: %s" % (self.neoelement.id,
@@ -208,13 +811,27 @@ class Edge(Element):
         """Returns the origin Vertex of the relationship
 
         @returns The origin Vertex"""
-        return Vertex(self.neoelement.start)
+        return Vertex(self.neoelement.start, self.codec)
 
     def getInVertex(self):
         """Returns the target Vertex of the relationship
 
         @returns The target Vertex"""
-        return Vertex(self.neoelement.end)
+        return Vertex(self.neoelement.end, self.codec)
+
+    def getOutVertexId(self):
+        """Returns the identifier of the origin Vertex without
+        retrieving the vertex itself
+
+        @returns The origin Vertex identifier"""
+        return _urlId(self.neoelement._dic["start"])
+
+    def getInVertexId(self):
+        """Returns the identifier of the target Vertex without
+        retrieving the vertex itself
+
+        @returns The target Vertex identifier"""
+        return _urlId(self.neoelement._dic["end"])
 
     def getLabel(self):
         """Returns the label of the relationship
@@ -231,7 +848,8 @@ class Index(object):
     """An class containing all the methods needed by an
     Index object"""
 
-    def __init__(self, indexName, indexClass, indexType, indexObject):
+    def __init__(self, indexName, indexClass, indexType, indexObject,
+                 codec=None):
         if indexClass != "vertex" and indexClass != "edge":
             raise NameError("%s is not a valid Index Class" % indexClass)
         self.indexClass = indexClass
@@ -245,6 +863,7 @@ class Index(object):
                             instance""" \
                             % type(indexObject))
         self.neoindex = indexObject
+        self.codec = codec or NativeCodec()
 
     def count(self, key, value):
         """Returns the number of elements indexed for a
@@ -281,20 +900,43 @@ class Index(object):
         @params element: Vertex or Edge element to be indexed"""
         self.neoindex[key][value] = element.neoelement
 
-    def get(self, key, value):
+    def get(self, key, value, properties=None):
         """Gets an element from an index under a given
         key-value pair
         @params key: Index key string
         @params value: Index value string
+        @params properties: Optional list of the property keys to
+                            retrieve, or False to retrieve none
         @returns A generator of Vertex or Edge objects"""
+        if properties is not None:
+            for element in self._projectedGet(key, value, properties):
+                yield element
+            return
         for element in self.neoindex[key][value]:
             if self.indexClass == "vertex":
-                yield Vertex(element)
+                yield Vertex(element, self.codec)
             elif self.indexClass == "edge":
-                yield Edge(element)
+                yield Edge(element, self.codec)
             else:
                 raise TypeError(self.indexClass)
 
+    def _projectedGet(self, key, value, properties):
+        """Looks the key-value pair up with a single Cypher query
+        returning only the projected properties"""
+        root = _root(self.neoindex.url, "index")
+        auth = self.neoindex._auth
+        if self.indexClass == "vertex":
+            query = "START n=node:%s(%s={value}) RETURN %s" % (
+                _quote(self.indexName), _quote(key), _columns("n", properties))
+            build = _projectedVertex
+        else:
+            query = "START r=relationship:%s(%s={value}) RETURN %s" % (
+                _quote(self.indexName), _quote(key),
+                _columns("r", properties, True))
+            build = _projectedEdge
+        for row in _cypher(root, auth, query, {"value": value}):
+            yield build(root, auth, self.codec, row, properties)
+
     def remove(self, key, value, element):
         """Removes an element from an index under a given
         key-value pair
@@ -326,7 +968,7 @@ class Neo4jIndexableGraph(Neo4jGraph):
             index = self.neograph.relationships.indexes.create(indexName)
         else:
             NameError("Unknown Index Class %s" % indexClass)
-        return Index(indexName, indexClass, "manual", index)
+        return Index(indexName, indexClass, "manual", index, self.codec)
 
     def createAutomaticIndex(self, indexName, indexClass):
         """Creates an index automatically managed my Neo4j
@@ -345,13 +987,15 @@ class Neo4jIndexableGraph(Neo4jGraph):
         if indexClass == "vertex":
             try:
                 return Index(indexName, indexClass, "manual",
-                        self.neograph.nodes.indexes.get(indexName))
+                        self.neograph.nodes.indexes.get(indexName),
+                        self.codec)
             except client.NotFoundError:
                 return None
         elif indexClass == "edge":
             try:
                 return Index(indexName, indexClass, "manual",
-                        self.neograph.relationships.indexes.get(indexName))
+                        self.neograph.relationships.indexes.get(indexName),
+                        self.codec)
             except client.NotFoundError:
                 return None
         else:
@@ -364,32 +1008,382 @@ class Neo4jIndexableGraph(Neo4jGraph):
         @returns A generator function over all rhe Index objects"""
         for indexName in self.neograph.nodes.indexes.keys():
             indexObject = self.neograph.nodes.indexes.get(indexName)
-            yield Index(indexName, "vertex", "manual", indexObject)
+            yield Index(indexName, "vertex", "manual", indexObject,
+                        self.codec)
         for indexName in self.neograph.relationships.indexes.keys():
             indexObject = self.neograph.relationships.indexes.get(indexName)
-            yield Index(indexName, "edge", "manual", indexObject)
+            yield Index(indexName, "edge", "manual", indexObject,
+                        self.codec)
 
     def dropIndex(self, indexName, indexClass):
         index = self.getIndex(indexName, indexClass)
         index.neoindex.delete()
 
 
-class Neo4jTransactionalGraph(Neo4jGraph):
-    """An class containing the specific methods
-    for transacional graphs"""
+class Neo4jTransactionError(Exception):
+
+    def __init__(self, message, *args, **kwargs):
+        self.message = message
+
+    def __str__(self):
+        return self.message
+
+
+class TransactionContexts(object):
+    """Holds the open transactions of every thread, at most one
+    for each graph, keyed by the URL of the graph"""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def _open(self):
+        if not hasattr(self._local, "transactions"):
+            self._local.transactions = {}
+        return self._local.transactions
+
+    def get(self, url):
+        """Returns the transaction of the running thread on a graph,
+        or None
+        @params url: The URL of the graph"""
+        return self._open().get(url)
+
+    def set(self, url, tx):
+        """Sets the transaction of the running thread on a graph
+        @params url: The URL of the graph
+        @params tx: The client transaction, None to remove it"""
+        if tx is None:
+            self._open().pop(url, None)
+        else:
+            self._open()[url] = tx
+
+    def find(self, caller):
+        """Returns the transaction of the running thread on the graph
+        a client method works on, or None. Raises Neo4jTransactionError
+        if several transactions are open and the graph is unknown
+        @params caller: The frame of the client method"""
+        transactions = self._open()
+        if not transactions:
+            return None
+        target = caller.f_locals.get("self")
+        if isinstance(target, client.TransactionOperationProxy):
+            # An element created by a transaction belongs to its graph
+            for tx in transactions.values():
+                if any(operation is target for operation in tx.operations):
+                    return tx
+            return None
+        url = _operationUrl(caller)
+        if url is None:
+            if len(transactions) == 1:
+                return transactions.values()[0]
+            # Running it at once would leave it out of every transaction
+            raise Neo4jTransactionError("Unable to tell which of the open "
+                                        "transactions an operation "
+                                        "belongs to")
+        for root, tx in transactions.items():
+            if url.startswith(root):
+                return tx
+        return None
+
+
+def _operationUrl(caller):
+    """Returns the URL a client method works on, or None if the
+    method has no URL at hand
+    @params caller: The frame of the client method"""
+    target = caller.f_locals.get("self")
+    state = getattr(target, "__dict__", None) or {}
+    for name in ("url", "_node", "_relationship"):
+        value = state.get(name)
+        if isinstance(value, client.Base):
+            value = value.url
+        if isinstance(value, basestring):
+            return value
+    url = caller.f_locals.get("url")
+    if isinstance(url, basestring):
+        return url
+    return None
+
+
+# Open transactions of every thread
+_transactions = TransactionContexts()
+
+# The client looks the current transaction up in a module global, so
+# a transaction started by one thread captures the operations of all
+# of them, on every graph. Not every client method an element calls
+# takes a tx argument, so the lookup of the client is replaced, for
+# the whole process, by one in the transactions of the running thread,
+# picking the transaction of the graph the operation is made on. It is
+# only replaced once a Neo4jTransactionalGraph is created, and a thread
+# without open transactions, or a call with an explicit tx, gets the
+# transaction the client would have returned
+_clientTransaction = client.Transaction.get_transaction
+
+
+def _contextTransaction(tx=None):
+    if not tx:
+        current = _transactions.find(sys._getframe(1))
+        if current is not None:
+            return current
+    return _clientTransaction(tx)
+
+
+def _installTransactionLookup():
+    """Replaces the transaction lookup of the client, once"""
+    client.Transaction.get_transaction = staticmethod(_contextTransaction)
 
-    _transaction = False
-    _txObj = None
+
+class Neo4jTransactionalGraph(Neo4jGraph):
+    """An class containing the specific methods for transacional
+    graphs. Every thread has its own transaction on each graph, so
+    a graph can be shared by concurrent writers and a thread can
+    have transactions open on several graphs. Only one transaction
+    can be open by a thread on each graph. Creating one replaces the
+    transaction lookup of neo4jrestclient in the whole process"""
+
+    def __init__(self, host, codec=None, groupCommitWindow=None,
+                 maxGroupOperations=None):
+        """Constructor
+        @params host: The URL of the Neo4j REST API
+        @params codec: Optional PropertyCodec used by the elements
+        @params groupCommitWindow: Optional number of seconds a commit
+                                   waits for commits of other threads to
+                                   be sent with it in a single request
+        @params maxGroupOperations: Operations that make a group be sent
+                                    before the end of the window.
+                                    Defaults to batchSize"""
+        super(Neo4jTransactionalGraph, self).__init__(host, codec)
+        _installTransactionLookup()
+        self.committer = None
+        if groupCommitWindow:
+            self.committer = GroupCommitter(self, groupCommitWindow,
+                                            maxGroupOperations or
+                                            self.batchSize)
 
     def startTransaction(self):
-        self._txObj = self.neograph.transaction(commit=False)
-        self._transaction = True
-
-    def stopTransaction(self):
-        self._txObj.commit()
-        self._txObj.__exit__(None, None, None)
-        self._txObj = None
-        self._transaction = False
+        """Starts a transaction of the running thread on the graph.
+        Operations are sent when the transaction is stopped"""
+        if _transactions.get(self.neograph.url) is not None:
+            raise Neo4jTransactionError("A transaction is already open")
+        # The group committer refreshes the elements from the results
+        # of the batch instead of getting them again one by one
+        _transactions.set(self.neograph.url,
+                          client.Transaction(self.neograph, None, {},
+                                             commit=False,
+                                             update=self.committer is None))
+
+    def stopTransaction(self, success=True):
+        """Stops the transaction of the running thread on the graph
+        @params success: Commits the operations if True, discards
+                         them otherwise"""
+        tx = _transactions.get(self.neograph.url)
+        if tx is None:
+            raise Neo4jTransactionError("No transaction is open")
+        _transactions.set(self.neograph.url, None)
+        if not success or not tx.operations:
+            return
+        if self.committer is not None:
+            self.committer.commit(tx)
+        else:
+            tx.commit()
+
+    def isInTransaction(self):
+        """Returns True if the running thread has an open
+        transaction on the graph"""
+        return _transactions.get(self.neograph.url) is not None
+
+    @contextmanager
+    def transaction(self):
+        """Context manager committing the operations of its block,
+        or discarding them if it raises an exception
+
+        >>> with graph.transaction():
+        ...     vertex = graph.addVertex()"""
+        self.startTransaction()
+        try:
+            yield
+        except BaseException:
+            self.stopTransaction(False)
+            raise
+        self.stopTransaction()
+
+
+class GroupCommitter(object):
+    """Merges the transactions committed by several threads within
+    a time window into a single batch request. If the server rejects
+    the merged request because one of its operations failed, every
+    transaction is sent again on its own, so each caller gets the
+    outcome of its own transaction. Any other error is raised to every
+    caller, as the request may have been applied"""
+
+    def __init__(self, graph, window, maxOperations):
+        """Constructor
+        @params graph: The Neo4jTransactionalGraph
+        @params window: Seconds the first commit of a group waits
+        @params maxOperations: Operations that make a group be sent
+                               before the end of the window"""
+        self.graph = graph
+        self.window = window
+        self.maxOperations = maxOperations
+        self._condition = threading.Condition()
+        self._pending = []
+        self._operations = 0
+        self._leading = False
+
+    def commit(self, tx):
+        """Commits a transaction with the ones committed by other
+        threads in the same window. Blocks until it is committed
+        @params tx: The client transaction
+
+        @returns True, or raises the error of the transaction"""
+        commit = _PendingCommit(tx)
+        with self._condition:
+            self._pending.append(commit)
+            self._operations += len(tx.operations)
+            leader = not self._leading
+            self._leading = True
+            self._condition.notify_all()
+            if leader:
+                deadline = time.time() + self.window
+                while self._operations < self.maxOperations:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                group = self._pending
+                self._pending = []
+                self._operations = 0
+                self._leading = False
+        if leader:
+            self._send(group)
+        commit.done.wait()
+        if commit.error is not None:
+            raise commit.error
+        return True
+
+    def _send(self, group):
+        results = None
+        error = None
+        if len(group) > 1:
+            try:
+                results = self._merged([commit.tx for commit in group])
+            except Exception as e:
+                error = e
+        for position, commit in enumerate(group):
+            if error is not None:
+                commit.error = error
+                commit.done.set()
+                continue
+            try:
+                if results is not None:
+                    txResults = results[position]
+                else:
+                    txResults = commit.tx._batch()
+                operations = list(commit.tx.operations)
+                # The client commit reads the results already received
+                # instead of sending the transaction again
+                commit.tx._batch = lambda txResults=txResults: txResults
+                commit.tx.commit()
+                _refresh(self.graph.neograph.url, operations, txResults)
+            except Exception as e:
+                commit.error = e
+            commit.done.set()
+
+    def _merged(self, transactions):
+        """Sends the operations of several transactions in one batch
+        request, renumbering them, and returns the results of each
+        transaction with their original numbers, or None if the batch
+        was rejected because of one of its operations"""
+        operations = []
+        offsets = []
+        for tx in transactions:
+            offset = len(operations)
+            offsets.append(offset)
+            for operation in tx.operations:
+                operations.append(_renumber(operation(), offset))
+        request = client.Request(**self.graph.neograph._auth)
+        response, content = request.post(self.graph.neograph._batch,
+                                         data=operations)
+        if _failedOperation(response, content):
+            return None
+        if response.status != 200:
+            raise client.TransactionException(response.status)
+        results = json.loads(content)
+        grouped = []
+        for tx, offset in zip(transactions, offsets):
+            chunk = []
+            for result in results[offset:offset + len(tx.operations)]:
+                result = dict(result, id=result["id"] - offset)
+                chunk.append(result)
+            grouped.append(tx._results_list_to_dict(chunk))
+        return grouped
+
+
+def _refresh(root, operations, results):
+    """Updates the elements changed by the operations of a committed
+    transaction from the operations and their batch results
+    @params root: The URL of the graph
+    @params operations: The operations of the transaction
+    @params results: The results of the transaction, by operation"""
+    for operation in operations:
+        element = operation.get_object()
+        if not isinstance(element, client.Base) or not element.url:
+            continue
+        sent = operation()
+        result = results.get(sent["id"], {})
+        body = result.get("body")
+        if isinstance(body, dict) and body.get("self") == element.url:
+            element._dic.update(body)
+            continue
+        path = "/%s" % element.url.replace(root, "")
+        properties = "%s/properties" % path
+        data = element._dic.setdefault("data", {})
+        if sent["to"] == path:
+            if sent["method"] == client.TX_DELETE:
+                element.url = None
+                element._dic = {}
+        elif sent["to"].rstrip("/") == properties:
+            if sent["method"] == client.TX_PUT:
+                data.clear()
+                data.update(sent.get("body") or {})
+            elif sent["method"] == client.TX_DELETE:
+                data.clear()
+        elif sent["to"].startswith(properties + "/"):
+            key = urllib.unquote(sent["to"][len(properties) + 1:])
+            key = key.decode("utf-8")
+            if sent["method"] == client.TX_PUT:
+                data[key] = sent.get("body")
+            elif sent["method"] == client.TX_DELETE:
+                data.pop(key, None)
+
+
+class _PendingCommit(object):
+
+    def __init__(self, tx):
+        self.tx = tx
+        self.error = None
+        self.done = threading.Event()
+
+
+_REFERENCE = re.compile(r"^\{(\d+)\}")
+
+
+def _renumber(operation, offset):
+    """Shifts the number of a batch operation, and its references
+    to other operations of the same batch, by offset"""
+    def shift(value):
+        if not isinstance(value, basestring):
+            return value
+        return _REFERENCE.sub(lambda match: "{%d}" % (int(match.group(1)) +
+                                                      offset), value)
+    operation = dict(operation, id=operation["id"] + offset,
+                     to=shift(operation["to"]))
+    body = operation.get("body")
+    if isinstance(body, dict):
+        body = dict(body)
+        for key in ("to", "uri"):
+            if key in body:
+                body[key] = shift(body[key])
+        operation["body"] = body
+    return operation
 
 
 class Neo4jTransactionalIndexableGraph(Neo4jTransactionalGraph, Neo4jIndexableGraph):
@@ -0,0 +1,841 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+
+#####################################################################
+# A graph sharded over several graph instances. Every vertex lives  #
+# in one partition and its identifier encodes that partition.       #
+#                                                                   #
+# File: pyblueprints/partition.py                                   #
+#####################################################################
+
+import hashlib
+import json
+import threading
+import time
+import uuid
+from Queue import Empty, Full, Queue
+
+from base import Graph, _project
+from algorithms import _loadedKeys, _readProperties
+
+
+# Internal properties, hidden from the users of the graph
+KEY_PROPERTY = "_pb_key"
+PROXY_PROPERTY = "_pb_proxy"
+PROXIES_PROPERTY = "_pb_proxies"
+SHADOW_PROPERTY = "_pb_edge"
+INDEX_PROPERTY = "_pb_index"
+_INTERNAL = (KEY_PROPERTY, PROXY_PROPERTY, PROXIES_PROPERTY, SHADOW_PROPERTY,
+             INDEX_PROPERTY)
+
+
+def jumpHash(key, partitions):
+    """Jump consistent hash of Lamping and Veach. When a partition
+    is added only 1/partitions of the keys change their partition
+    @params key: The placement key of the vertex
+    @params partitions: Number of partitions
+
+    @returns The partition number"""
+    h = int(hashlib.md5(unicode(key).encode("utf-8")).hexdigest()[:16], 16)
+    b, j = -1, 0
+    while j < partitions:
+        b = j
+        h = (h * 2862933555777941757 + 1) % 2 ** 64
+        j = int((b + 1) * (float(1 << 31) / float((h >> 33) + 1)))
+    return b
+
+
+def _visible(properties):
+    return dict((key, value) for key, value in properties.items()
+                if key not in _INTERNAL)
+
+
+def _entries(element, key):
+    """Reads an internal list property. Its entries are stored as
+    JSON strings, since backends only store homogeneous lists"""
+    properties = _readProperties(element, [key])
+    return [json.loads(entry) for entry in properties.get(key) or []]
+
+
+def _setEntries(element, key, entries):
+    element.setProperty(key, [json.dumps(entry) for entry in entries])
+
+
+def _internal(properties, key):
+    """Adds an internal key to a projection, the partitioned
+    elements read it to follow proxies and shadow edges"""
+    if properties is None:
+        return None
+    return list(properties or []) + [key]
+
+
+class PartitionedGraph(Graph):
+    """A graph spread over several graphs. Vertices are placed by a
+    partition function and their identifiers are (partition, local
+    identifier) tuples. An edge is stored in the partition of its
+    origin vertex; when the target lives elsewhere the edge points to
+    a proxy vertex and a shadow edge is stored in the partition of the
+    target so incoming edges can be listed locally"""
+
+    # Maximum number of items read from the partitions and not yet
+    # consumed by the caller of a parallel listing
+    scatterBuffer = 1000
+
+    def __init__(self, graphs, partitionFunction=jumpHash,
+                 rebalanceRate=100):
+        """Constructor
+        @params graphs: List of Graph objects, one per partition
+        @params partitionFunction: Function receiving a placement key and
+                                   the number of partitions and returning
+                                   the partition of a new vertex
+        @params rebalanceRate: Maximum number of vertices moved per second
+                               by the background rebalance"""
+        self.graphs = list(graphs)
+        self.partitionFunction = partitionFunction
+        self.rebalanceRate = rebalanceRate
+        self._lock = threading.RLock()
+        self._rebalanceThread = None
+
+    def _element(self, partition, element):
+        """Wraps a backend element, following the proxies"""
+        if element is None:
+            return None
+        properties = _readProperties(element, [PROXY_PROPERTY])
+        if PROXY_PROPERTY in properties:
+            return self.getVertex(tuple(properties[PROXY_PROPERTY]))
+        return PartitionedVertex(self, partition, element)
+
+    def _scatter(self, function):
+        """Calls function on every partition in parallel and yields the
+        items of the returned iterators as soon as they arrive
+        @params function: Function receiving a partition number and its
+                          graph and returning an iterator"""
+        queue = Queue(maxsize=self.scatterBuffer)
+        done = object()
+        # Set when the caller stops reading, so the producers end
+        stop = threading.Event()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    queue.put(item, timeout=0.1)
+                    return True
+                except Full:
+                    pass
+            return False
+
+        def produce(partition, graph):
+            try:
+                for item in function(partition, graph):
+                    if not put((item, None)):
+                        return
+            except Exception as e:
+                put((None, e))
+                return
+            put((done, None))
+
+        for partition, graph in enumerate(list(self.graphs)):
+            thread = threading.Thread(target=produce, args=(partition, graph))
+            thread.daemon = True
+            thread.start()
+        pending = len(self.graphs)
+        try:
+            while pending:
+                item, error = queue.get()
+                if error is not None:
+                    raise error
+                if item is done:
+                    pending -= 1
+                else:
+                    yield item
+        finally:
+            stop.set()
+            while True:
+                try:
+                    queue.get_nowait()
+                except Empty:
+                    break
+
+    def addVertex(self, _id=None):
+        """Adds a new vertex in the partition chosen by the
+        partition function
+        @params _id: Placement key of the vertex. Random if None
+
+        @returns The created Vertex"""
+        key = _id if _id is not None else uuid.uuid4().hex
+        partition = self.partitionFunction(key, len(self.graphs))
+        vertex = self.graphs[partition].addVertex(_id)
+        vertex.setProperty(KEY_PROPERTY, key)
+        return PartitionedVertex(self, partition, vertex)
+
+    def getVertex(self, _id, properties=None):
+        """Retrieves an existing vertex from its partition
+        @params _id: A (partition, local identifier) tuple
+        @params properties: Optional list of the property keys to
+                            retrieve, or False to retrieve none
+
+        @returns The requested Vertex or None"""
+        partition, localId = _id
+        if partition >= len(self.graphs):
+            return None
+        return self._element(partition,
+                             _project(self.graphs[partition].getVertex,
+                                      _internal(properties, PROXY_PROPERTY),
+                                      localId))
+
+    def getVertices(self, properties=None):
+        """Returns an iterator with the vertices of all the partitions,
+        retrieved in parallel
+        @params properties: Optional list of the property keys to
+                            retrieve, or False to retrieve none"""
+        projection = _internal(properties, PROXY_PROPERTY)
+
+        def vertices(partition, graph):
+            for vertex in _project(graph.getVertices, projection):
+                properties = _readProperties(vertex, [PROXY_PROPERTY])
+                if PROXY_PROPERTY not in properties:
+                    yield PartitionedVertex(self, partition, vertex)
+        return self._scatter(vertices)
+
+    def getVerticesById(self, ids, properties=None):
+        """Retrieves several vertices with one multi-get per
+        partition, all of them sent in parallel
+        @params ids: Iterable of (partition, local identifier) tuples
+        @params properties: Optional list of the property keys to
+                            retrieve, or False to retrieve none
+
+        @returns A list with the requested Vertex objects in input
+        order, with None for the missing ones"""
+        projection = _internal(properties, PROXY_PROPERTY)
+        return self._gatherById(ids, lambda graph, localIds:
+                                _project(graph.getVerticesById, projection,
+                                         localIds),
+                                self._element)
+
+    def _gatherById(self, ids, get, wrap):
+        """Groups the identifiers by partition, fetches each group
+        with get and returns the wrapped elements in input order"""
+        ids = list(ids)
+        groups = {}
+        for position, (partition, localId) in enumerate(ids):
+            if partition < len(self.graphs):
+                groups.setdefault(partition, []).append((position, localId))
+
+        def fetch(partition, graph):
+            group = groups.get(partition)
+            if not group:
+                return []
+            elements = get(graph, [localId for position, localId in group])
+            return [(position, wrap(partition, element))
+                    for (position, localId), element in zip(group, elements)
+                    if element is not None]
+        results = [None] * len(ids)
+        for position, element in self._scatter(fetch):
+            results[position] = element
+        return results
+
+    def removeVertex(self, vertex):
+        """Removes the given vertex, its edges and its proxies
+        @params vertex: Node to be removed"""
+        for edge in list(vertex.getBothEdges()):
+            self.removeEdge(edge)
+        self._removeProxies(vertex)
+        self.graphs[vertex.partition].removeVertex(vertex.element)
+
+    def _proxy(self, partition, vertex):
+        """Returns the proxy of a vertex in another partition,
+        creating it if needed. The proxies of a vertex are listed in
+        one of its properties, so every PartitionedGraph over the
+        same partitions finds them"""
+        with self._lock:
+            graph = self.graphs[partition]
+            entries = _entries(vertex.element, PROXIES_PROPERTY)
+            for entryPartition, localId in entries:
+                if entryPartition == partition:
+                    proxy = graph.getVertex(localId)
+                    if proxy is not None:
+                        return proxy
+            proxy = graph.addVertex()
+            proxy.setProperty(PROXY_PROPERTY, list(vertex.getId()))
+            entries = [entry for entry in entries if entry[0] != partition]
+            entries.append([partition, proxy.getId()])
+            _setEntries(vertex.element, PROXIES_PROPERTY, entries)
+            return proxy
+
+    def _removeProxies(self, vertex):
+        """Removes the proxies of a vertex from the other partitions.
+        They have no edges left once the edges of the vertex are gone"""
+        for partition, localId in _entries(vertex.element, PROXIES_PROPERTY):
+            if partition >= len(self.graphs):
+                continue
+            graph = self.graphs[partition]
+            proxy = graph.getVertex(localId)
+            if proxy is not None:
+                graph.removeVertex(proxy)
+
+    def addEdge(self, outVertex, inVertex, label):
+        """Creates a new edge in the partition of its origin
+        @params outVertex: Edge origin Vertex
+        @params inVertex: Edge target vertex
+        @params label: Edge label
+
+        @returns The created Edge object"""
+        outPartition = outVertex.partition
+        inPartition = inVertex.partition
+        graph = self.graphs[outPartition]
+        if outPartition == inPartition:
+            edge = graph.addEdge(outVertex.element, inVertex.element, label)
+            return PartitionedEdge(self, outPartition, edge)
+        edge = graph.addEdge(outVertex.element,
+                             self._proxy(outPartition, inVertex), label)
+        result = PartitionedEdge(self, outPartition, edge)
+        shadow = self.graphs[inPartition].addEdge(
+            self._proxy(inPartition, outVertex), inVertex.element, label)
+        shadow.setProperty(SHADOW_PROPERTY, list(result.getId()))
+        return result
+
+    def getEdge(self, _id, properties=None):
+        """Retrieves an existing edge from its partition
+        @params _id: A (partition, local identifier) tuple
+        @params properties: Optional list of the property keys to
+                            retrieve, or False to retrieve none
+
+        @returns The requested Edge or None"""
+        partition, localId = _id
+        if partition >= len(self.graphs):
+            return None
+        edge = _project(self.graphs[partition].getEdge,
+                        _internal(properties, SHADOW_PROPERTY), localId)
+        if edge is None:
+            return None
+        return PartitionedEdge(self, partition, edge)
+
+    def getEdges(self, properties=None):
+        """Returns an iterator with the edges of all the partitions,
+        retrieved in parallel
+        @params properties: Optional list of the property keys to
+                            retrieve, or False to retrieve none"""
+        projection = _internal(properties, SHADOW_PROPERTY)
+
+        def edges(partition, graph):
+            for edge in _project(graph.getEdges, projection):
+                if SHADOW_PROPERTY not in _readProperties(edge,
+                                                          [SHADOW_PROPERTY]):
+                    yield PartitionedEdge(self, partition, edge)
+        return self._scatter(edges)
+
+    def getEdgesById(self, ids, properties=None):
+        """Retrieves several edges with one multi-get per
+        partition, all of them sent in parallel
+        @params ids: Iterable of (partition, local identifier) tuples
+        @params properties: Optional list of the property keys to
+                            retrieve, or False to retrieve none
+
+        @returns A list with the requested Edge objects in input
+        order, with None for the missing ones"""
+        projection = _internal(properties, SHADOW_PROPERTY)
+        return self._gatherById(ids, lambda graph, localIds:
+                                _project(graph.getEdgesById, projection,
+                                         localIds),
+                                lambda partition, edge:
+                                PartitionedEdge(self, partition, edge))
+
+    def removeEdge(self, edge):
+        """Removes the given edge and its shadow, if any
+        @params edge: The edge to be removed"""
+        edge = edge._primary()
+        _id = edge.getId()
+        outId = edge.getOutVertex().getId()
+        inVertex = edge.getInVertex()
+        if inVertex.partition != outId[0]:
+            for shadow in inVertex.element.getInEdges(edge.getLabel()):
+                properties = _readProperties(shadow, None)
+                if tuple(properties.get(SHADOW_PROPERTY) or ()) == _id:
+                    self.graphs[inVertex.partition].removeEdge(shadow)
+        self.graphs[edge.partition].removeEdge(edge.element)
+
+    def addPartition(self, graph):
+        """Adds a new partition and starts moving, in a background
+        thread and at most rebalanceRate vertices per second, the
+        vertices that the partition function now places in it
+        @params graph: The Graph object of the new partition"""
+        with self._lock:
+            self.graphs.append(graph)
+        self.waitRebalance()
+        self._rebalanceThread = threading.Thread(target=self.rebalance)
+        self._rebalanceThread.daemon = True
+        self._rebalanceThread.start()
+
+    def waitRebalance(self):
+        """Blocks until the running rebalance, if any, finishes"""
+        if self._rebalanceThread is not None:
+            self._rebalanceThread.join()
+            self._rebalanceThread = None
+
+    def rebalance(self):
+        """Moves every vertex whose placement key is mapped to another
+        partition by the partition function. The old vertex is kept as
+        a proxy, so getVertex with its identifier returns the moved
+        vertex, which has a new identifier. Moved edges are created
+        again and get new identifiers too"""
+        partitions = len(self.graphs)
+        for partition, graph in enumerate(list(self.graphs)):
+            for vertex in list(graph.getVertices()):
+                properties = _readProperties(vertex, None)
+                if PROXY_PROPERTY in properties or \
+                        KEY_PROPERTY not in properties:
+                    continue
+                target = self.partitionFunction(properties[KEY_PROPERTY],
+                                                partitions)
+                if target != partition:
+                    self._move(PartitionedVertex(self, partition, vertex),
+                               target, properties)
+                    if self.rebalanceRate:
+                        time.sleep(1.0 / self.rebalanceRate)
+
+    def _move(self, vertex, target, properties):
+        moved = PartitionedVertex(self, target,
+                                  self.graphs[target].addVertex())
+        for key, value in properties.items():
+            if key != PROXIES_PROPERTY:
+                moved.element.setProperty(key, value)
+        for edge in list(vertex.getOutEdges()):
+            inVertex = edge.getInVertex()
+            if inVertex == vertex:
+                inVertex = moved
+            self._copyEdge(edge, moved, inVertex)
+        for edge in list(vertex.getInEdges()):
+            self._copyEdge(edge, edge.getOutVertex(), moved)
+        # The edges to the old proxies were copied to new ones
+        self._removeProxies(vertex)
+        self._reindex("vertex", vertex, moved,
+                      _entries(vertex.element, INDEX_PROPERTY))
+        for key in properties:
+            vertex.element.removeProperty(key)
+        vertex.element.setProperty(PROXY_PROPERTY, list(moved.getId()))
+        # The old vertex forwards its identifier and is removed along
+        # with the moved vertex
+        entries = _entries(moved.element, PROXIES_PROPERTY)
+        entries.append([vertex.partition, vertex.element.getId()])
+        _setEntries(moved.element, PROXIES_PROPERTY, entries)
+        return moved
+
+    def _copyEdge(self, edge, outVertex, inVertex):
+        edge = edge._primary()
+        properties = edge.getProperties()
+        label = edge.getLabel()
+        entries = _entries(edge.element, INDEX_PROPERTY)
+        copy = self.addEdge(outVertex, inVertex, label)
+        for key, value in properties.items():
+            copy.setProperty(key, value)
+        self._reindex("edge", edge, copy, entries)
+        self.removeEdge(edge)
+
+    def _backendIndex(self, partition, indexName, indexClass):
+        """Returns the index of a partition, creating it in the
+        partitions added after the index"""
+        graph = self.graphs[partition]
+        index = graph.getIndex(indexName, indexClass)
+        if index is None:
+            index = graph.createManualIndex(indexName, indexClass)
+        return index
+
+    def _reindex(self, indexClass, old, new, entries):
+        """Moves the index entries of an element to its copy
+        @params indexClass: vertex or edge
+        @params old: The PartitionedElement being replaced
+        @params new: Its copy
+        @params entries: List of [index name, key, value] entries"""
+        if not entries:
+            return
+        for indexName, key, value in entries:
+            index = self.graphs[old.partition].getIndex(indexName, indexClass)
+            if index is not None:
+                index.remove(key, value, old.element)
+            self._backendIndex(new.partition, indexName,
+                               indexClass).put(key, value, new.element)
+        _setEntries(new.element, INDEX_PROPERTY, entries)
+
+    def clear(self):
+        """Removes all data in every partition"""
+        for graph in self.graphs:
+            graph.clear()
+
+    def shutdown(self):
+        """Shuts down every partition"""
+        self.waitRebalance()
+        for graph in self.graphs:
+            graph.shutdown()
+
+    def __str__(self):
+        return "PartitionedGraph: %s partitions" % len(self.graphs)
+
+
+class PartitionedIndexableGraph(PartitionedGraph):
+    """A partitioned graph over indexable graphs. Every index
+    exists in all the partitions and lookups are sent to all of
+    them in parallel"""
+
+    def createManualIndex(self, indexName, indexClass):
+        """Creates an index manually managed in every partition
+        @params name: The index name
+        @params indexClass: vertex or edge
+
+        @returns The created Index"""
+        return PartitionedIndex(self, [graph.createManualIndex(indexName,
+                                                               indexClass)
+                                       for graph in self.graphs])
+
+    def createAutomaticIndex(self, indexName, indexClass):
+        """Creates an automatic index in every partition
+        @params name: The index name
+        @params indexClass: vertex or edge
+
+        @returns The created Index"""
+        return PartitionedIndex(self,
+                                [graph.createAutomaticIndex(indexName,
+                                                            indexClass)
+                                 for graph in self.graphs])
+
+    def getIndex(self, indexName, indexClass):
+        """Retrieves an index with a given index name and class
+        @params indexName: The index name
+        @params indexClass: vertex or edge
+
+        @return The Index object or None"""
+        indexes = [graph.getIndex(indexName, indexClass)
+                   for graph in self.graphs]
+        if indexes[0] is None:
+            return None
+        # Missing in the partitions added after the index
+        return PartitionedIndex(self, indexes)
+
+    def getIndices(self):
+        """Returns a generator function over the indexes of the
+        first partition, which exist in all of them
+
+        @returns A generator function over all the Index objects"""
+        for index in self.graphs[0].getIndices():
+            yield self.getIndex(index.getIndexName(), index.getIndexClass())
+
+    def dropIndex(self, indexName, *args):
+        """Removes an index from every partition
+        @params indexName: The index name"""
+        for graph in self.graphs:
+            # Partitions added later only have the indexes they used
+            if args and graph.getIndex(indexName, *args) is None:
+                continue
+            graph.dropIndex(indexName, *args)
+
+
+class PartitionedElement(object):
+    """An element stored in one of the partitions"""
+
+    def __init__(self, graph, partition, element):
+        """Constructor
+        @params graph: The PartitionedGraph the element belongs to
+        @params partition: Number of the partition storing the element
+        @params element: The backend element"""
+        self.graph = graph
+        self.partition = partition
+        self.element = element
+
+    def getId(self):
+        """Returns the unique identifier of the element
+
+        @returns A (partition, local identifier) tuple"""
+        return (self.partition, self.element.getId())
+
+    def _backend(self):
+        """The backend element holding the properties"""
+        return self.element
+
+    def getLoadedKeys(self):
+        """Returns the keys of the properties retrieved with the
+        element by a projection
+
+        @returns A set of keys, or None if all were retrieved"""
+        loadedKeys = _loadedKeys(self._backend())
+        if loadedKeys is None:
+            return None
+        return loadedKeys - set(_INTERNAL)
+
+    def getProperty(self, key):
+        """Gets the value of the property for the given key
+        @params key: The key which value is being retrieved
+
+        @returns The value of the property with the given key"""
+        loadedKeys = self.getLoadedKeys()
+        if loadedKeys is not None and key in loadedKeys:
+            return self._backend().getProperty(key)
+        return self.getProperties().get(key)
+
+    def getPropertyKeys(self):
+        """Returns a set with the property keys of the element
+
+        @returns Set of property keys"""
+        return self.getProperties().keys()
+
+    def getProperties(self):
+        """Returns all the properties of the element at once
+
+        @returns A dictionary with the properties of the element"""
+        return _visible(_readProperties(self.element, None))
+
+    def setProperty(self, key, value):
+        """Sets the property of the element to the given value
+        @params key: The property key to set
+        @params value: The value to set"""
+        self.element.setProperty(key, value)
+
+    def removeProperty(self, key):
+        """Removes the value of the property for the given key
+        @params key: The key which value is being removed"""
+        self.element.removeProperty(key)
+
+    def __eq__(self, other):
+        return (isinstance(other, PartitionedElement)
+                and self.__class__ == other.__class__
+                and self.getId() == other.getId())
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash(self.getId())
+
+
+class PartitionedVertex(PartitionedElement):
+    """A vertex stored in one of the partitions"""
+
+    def _wrap(self, edges):
+        for edge in edges:
+            yield PartitionedEdge(self.graph, self.partition, edge)
+
+    def getOutEdges(self, label=None, properties=None):
+        """Gets all the outgoing edges of the node. If label
+        parameter is provided, it only returns the edges of
+        the given label
+        @params label: Optional parameter to filter the edges
+        @params properties: Optional list of the property keys of
+                            the edges to retrieve, or False for none
+
+        @returns A generator function with the outgoing edges"""
+        return self._wrap(_project(self.element.getOutEdges,
+                                   _internal(properties, SHADOW_PROPERTY),
+                                   label))
+
+    def getInEdges(self, label=None, properties=None):
+        """Gets all the incoming edges of the node, including the
+        ones coming from other partitions. If label parameter is
+        provided, it only returns the edges of the given label
+        @params label: Optional parameter to filter the edges
+        @params properties: Optional list of the property keys of
+                            the edges to retrieve, or False for none
+
+        @returns A generator function with the incoming edges"""
+        return self._wrap(_project(self.element.getInEdges,
+                                   _internal(properties, SHADOW_PROPERTY),
+                                   label))
+
+    def getBothEdges(self, label=None, properties=None):
+        """Gets all the edges of the node. If label
+        parameter is provided, it only returns the edges of
+        the given label
+        @params label: Optional parameter to filter the edges
+        @params properties: Optional list of the property keys of
+                            the edges to retrieve, or False for none
+
+        @returns A generator function with the edges"""
+        for edge in self.getOutEdges(label, properties):
+            yield edge
+        for edge in self.getInEdges(label, properties):
+            if edge.getOutVertex() != self:
+                yield edge
+
+    def __str__(self):
+        return "Vertex %s: %s" % (self.getId(), self.getProperties())
+
+
+class PartitionedEdge(PartitionedElement):
+    """An edge stored in the partition of its origin vertex, or
+    the shadow of such an edge in the partition of its target"""
+
+    def _shadowOf(self):
+        _id = _readProperties(self.element,
+                              [SHADOW_PROPERTY]).get(SHADOW_PROPERTY)
+        if _id is None:
+            return None
+        return tuple(_id)
+
+    def _primary(self):
+        _id = self._shadowOf()
+        if _id is None:
+            return self
+        return self.graph.getEdge(_id)
+
+    def getId(self):
+        """Returns the unique identifier of the edge
+
+        @returns A (partition, local identifier) tuple"""
+        return self._shadowOf() or (self.partition, self.element.getId())
+
+    def _backend(self):
+        return self._primary().element
+
+    def getProperties(self):
+        """Returns all the properties of the edge at once
+
+        @returns A dictionary with the properties of the edge"""
+        primary = self._primary()
+        return _visible(_readProperties(primary.element, None))
+
+    def setProperty(self, key, value):
+        """Sets the property of the edge to the given value
+        @params key: The property key to set
+        @params value: The value to set"""
+        self._primary().element.setProperty(key, value)
+
+    def removeProperty(self, key):
+        """Removes the value of the property for the given key
+        @params key: The key which value is being removed"""
+        self._primary().element.removeProperty(key)
+
+    def getOutVertex(self):
+        """Returns the origin Vertex of the relationship
+
+        @returns The origin Vertex"""
+        return self.graph._element(self.partition,
+                                   self.element.getOutVertex())
+
+    def getInVertex(self):
+        """Returns the target Vertex of the relationship
+
+        @returns The target Vertex"""
+        return self.graph._element(self.partition,
+                                   self.element.getInVertex())
+
+    def getLabel(self):
+        """Returns the label of the relationship
+
+        @returns The edge label"""
+        return self.element.getLabel()
+
+    def __str__(self):
+        return "Edge %s: %s" % (self.getId(), self.getProperties())
+
+
+class PartitionedIndex(object):
+    """An index existing in every partition. Lookups are sent
+    to all the partitions in parallel"""
+
+    def __init__(self, graph, indexes):
+        """Constructor
+        @params graph: The PartitionedIndexableGraph of the index
+        @params indexes: The backend indexes, one per partition"""
+        self.graph = graph
+        self.indexes = indexes
+
+    def _isVertexIndex(self):
+        return str(self.getIndexClass()).lower().startswith("vert")
+
+    def _index(self, partition):
+        """Returns the backend index of a partition, creating it in
+        the partitions added after the index"""
+        with self.graph._lock:
+            while partition >= len(self.indexes):
+                self.indexes.append(None)
+            if self.indexes[partition] is None:
+                self.indexes[partition] = self.graph._backendIndex(
+                    partition, self.getIndexName(), self.getIndexClass())
+            return self.indexes[partition]
+
+    def count(self, key, value):
+        """Returns the number of elements indexed for a
+        given key-value pair in all the partitions
+        @params key: Index key string
+        @params value: Index value string
+
+        @returns The number of elements indexed"""
+        return sum(self.graph._scatter(
+            lambda partition, graph: [self._index(partition).count(key,
+                                                                   value)]))
+
+    def getIndexName(self):
+        """Returns the name of the index
+
+        @returns The name of the index"""
+        return self.indexes[0].getIndexName()
+
+    def getIndexClass(self):
+        """Returns the index class (vertex or edge)
+
+        @returns The index class"""
+        return self.indexes[0].getIndexClass()
+
+    def getIndexType(self):
+        """Returns the index type (automatic or manual)
+
+        @returns The index type"""
+        return self.indexes[0].getIndexType()
+
+    def put(self, key, value, element):
+        """Puts an element in the index of its partition. The entry is
+        also listed in the element, so a rebalance can move it
+        @params key: Index key string
+        @params value: Index value string
+        @params element: Vertex or Edge element to be indexed"""
+        if isinstance(element, PartitionedEdge):
+            element = element._primary()
+        self._index(element.partition).put(key, value, element.element)
+        entry = [self.getIndexName(), key, value]
+        entries = _entries(element.element, INDEX_PROPERTY)
+        if entry not in entries:
+            _setEntries(element.element, INDEX_PROPERTY, entries + [entry])
+
+    def get(self, key, value, properties=None):
+        """Gets the elements indexed under a given key-value pair
+        in every partition, as soon as each partition answers
+        @params key: Index key string
+        @params value: Index value string
+        @params properties: Optional list of the property keys to
+                            retrieve, or False to retrieve none
+        @returns A generator of Vertex or Edge objects"""
+        if self._isVertexIndex():
+            cls = PartitionedVertex
+            projection = _internal(properties, PROXY_PROPERTY)
+        else:
+            cls = PartitionedEdge
+            projection = _internal(properties, SHADOW_PROPERTY)
+
+        def lookup(partition, graph):
+            for element in _project(self._index(partition).get, projection,
+                                    key, value):
+                if cls is PartitionedVertex:
+                    # Entries written before a move point at the proxy
+                    # left behind
+                    vertex = self.graph._element(partition, element)
+                    if vertex is not None:
+                        yield vertex
+                else:
+                    yield cls(self.graph, partition, element)
+        return self.graph._scatter(lookup)
+
+    def remove(self, key, value, element):
+        """Removes an element from the index of its partition
+        @params key: Index key string
+        @params value: Index value string
+        @params element: Vertex or Edge element to be removed"""
+        if isinstance(element, PartitionedEdge):
+            element = element._primary()
+        self._index(element.partition).remove(key, value, element.element)
+        entry = [self.getIndexName(), key, value]
+        entries = _entries(element.element, INDEX_PROPERTY)
+        if entry in entries:
+            entries.remove(entry)
+            _setEntries(element.element, INDEX_PROPERTY, entries)
+
+    def __str__(self):
+        return "Index: %s (%s, %s)" % (self.getIndexName(),
+                                       self.getIndexClass(),
+                                       self.getIndexType())
@@ -0,0 +1,358 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+
+#####################################################################
+# A lazily evaluated traversal pipeline over any Blueprints graph.  #
+# Steps are compiled into stages: backends able to run several      #
+# steps in a single request do so, the rest are evaluated one       #
+# frontier of vertices at a time.                                   #
+#                                                                   #
+# File: pyblueprints/pipeline.py                                    #
+#####################################################################
+
+import itertools
+import operator
+
+from algorithms import DEFAULT_WORKERS, FrontierExpander, _readProperties
+
+
+# Comparisons accepted by the has step
+OPERATORS = {"eq": operator.eq, "ne": operator.ne, "gt": operator.gt,
+             "gte": operator.ge, "lt": operator.lt, "lte": operator.le}
+
+_SYMBOLS = {"eq": "=", "ne": "!=", "gt": ">", "gte": ">=", "lt": "<",
+            "lte": "<="}
+_HOPS = ("out", "in", "both")
+
+
+class Step(object):
+    """A step of a pipeline. Backends compiling pipelines read
+    its name and the attributes used by that kind of step"""
+
+    def __init__(self, name, label=None, key=None, op=None, value=None,
+                 count=None):
+        """Constructor
+        @params name: out, in, both, has, dedup, limit or values
+        @params label: Edge label followed by out, in and both steps
+        @params key: Property key of has and values steps
+        @params op: Comparison of has steps, one of OPERATORS or exists
+        @params value: Value compared by has steps
+        @params count: Number of elements let through by limit steps"""
+        self.name = name
+        self.label = label
+        self.key = key
+        self.op = op
+        self.value = value
+        self.count = count
+
+    def matches(self, properties):
+        """Evaluates a has step over the properties of a vertex.
+        Vertices without the property never match
+        @params properties: Dictionary of properties of the vertex
+
+        @returns True if the vertex passes the step"""
+        if self.key not in properties:
+            return False
+        if self.op == "exists":
+            return True
+        return OPERATORS[self.op](properties[self.key], self.value)
+
+    def __str__(self):
+        if self.name in _HOPS:
+            return "%s(%s)" % (self.name, self.label or "")
+        if self.name == "has":
+            if self.op == "exists":
+                return "has(%s)" % self.key
+            return "has(%s %s %r)" % (self.key, _SYMBOLS[self.op],
+                                      self.value)
+        if self.name == "limit":
+            return "limit(%s)" % self.count
+        if self.name == "values":
+            return "values(%s)" % self.key
+        return self.name
+
+
+class Pipeline(object):
+    """A lazily evaluated traversal. Every step returns a new
+    Pipeline and nothing is requested until it is iterated.
+    Results are streamed: vertices, or property values after a
+    values step
+
+    >>> graph.v(1).out('knows').has('age', gt=30).values('name')"""
+
+    def __init__(self, graph, starts, steps=None):
+        """Constructor
+        @params graph: The Graph to be traversed
+        @params starts: List of Vertex objects or vertex identifiers
+        @params steps: Optional list of Step objects"""
+        self.graph = graph
+        self.starts = list(starts)
+        self.steps = list(steps or [])
+
+    def _add(self, step):
+        if self.steps and self.steps[-1].name == "values":
+            raise ValueError("values has to be the last step")
+        return Pipeline(self.graph, self.starts, self.steps + [step])
+
+    def out(self, label=None):
+        """Moves to the vertices at the end of the outgoing edges
+        @params label: Optional parameter to filter the edges"""
+        return self._add(Step("out", label=label))
+
+    def in_(self, label=None):
+        """Moves to the vertices at the origin of the incoming edges
+        @params label: Optional parameter to filter the edges"""
+        return self._add(Step("in", label=label))
+
+    def both(self, label=None):
+        """Moves to the vertices adjacent in both directions
+        @params label: Optional parameter to filter the edges"""
+        return self._add(Step("both", label=label))
+
+    def has(self, key, *value, **comparisons):
+        """Keeps the vertices whose property matches. has(key) checks
+        that the property exists, has(key, value) compares it for
+        equality and keyword arguments like gt=30 use the other
+        comparisons of OPERATORS
+        @params key: The property key
+        @params value: Optional value the property must be equal to
+        @params comparisons: Operator names mapped to values"""
+        if len(value) > 1:
+            raise TypeError("has takes at most one value")
+        for op in comparisons:
+            if op not in OPERATORS:
+                raise ValueError("Unknown comparison %s" % op)
+        if value:
+            comparisons["eq"] = value[0]
+        pipeline = self
+        if not comparisons:
+            return pipeline._add(Step("has", key=key, op="exists"))
+        for op in sorted(comparisons):
+            pipeline = pipeline._add(Step("has", key=key, op=op,
+                                          value=comparisons[op]))
+        return pipeline
+
+    def dedup(self):
+        """Lets every vertex through only once"""
+        return self._add(Step("dedup"))
+
+    def limit(self, count):
+        """Stops the traversal after count vertices
+        @params count: Maximum number of vertices"""
+        return self._add(Step("limit", count=count))
+
+    def values(self, key):
+        """Emits the value of a property instead of the vertices.
+        Vertices without the property are skipped
+        @params key: The property key"""
+        return self._add(Step("values", key=key))
+
+    def plan(self):
+        """Compiles the steps into stages. Each run of steps the
+        graph can execute in a single request becomes one stage,
+        the rest are grouped into frontier stages
+
+        @returns A list of stages, each one with a run method
+        receiving and returning iterators of traversers"""
+        steps = self.steps
+        key = None
+        if steps and steps[-1].name == "values":
+            key = steps[-1].key
+            steps = steps[:-1]
+        stages = []
+        pending = []
+        while steps:
+            stage, count = self._compile(steps)
+            if count:
+                if pending:
+                    stages.append(FrontierStage(self.graph, pending))
+                    pending = []
+                stages.append(stage)
+            else:
+                pending.append(steps[0])
+                count = 1
+            steps = steps[count:]
+        if pending:
+            stages.append(FrontierStage(self.graph, pending))
+        stages.append(FetchStage(self.graph, key))
+        return stages
+
+    def _compile(self, steps):
+        if not hasattr(self.graph, "compileTraversal"):
+            return None, 0
+        try:
+            return self.graph.compileTraversal(steps)
+        except NotImplementedError:
+            return None, 0
+
+    def explain(self):
+        """Describes the execution plan
+
+        @returns A string with one line per stage"""
+        return "\n".join(str(stage) for stage in self.plan())
+
+    def __iter__(self):
+        traversers = []
+        for start in self.starts:
+            if hasattr(start, "getId"):
+                traversers.append((start.getId(), start))
+            else:
+                traversers.append((start, None))
+        traversers = iter(traversers)
+        for stage in self.plan():
+            traversers = stage.run(traversers)
+        return traversers
+
+    def toList(self):
+        """Runs the traversal
+
+        @returns A list with all the results"""
+        return list(self)
+
+    def __str__(self):
+        return "Pipeline: %s" % ".".join(str(step) for step in self.steps)
+
+
+def _chunks(iterator, size):
+    iterator = iter(iterator)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _fetch(expander, traversers, properties=None):
+    """Completes the traversers with their Vertex objects using a
+    single multi-get and drops the missing vertices. Only the
+    properties of the projection are retrieved, if there is one"""
+    missing = [_id for _id, element in traversers if element is None]
+    if not missing:
+        return traversers
+    fetched = dict(zip(missing, expander.fetchVertices(missing,
+                                                       properties)))
+    completed = []
+    for _id, element in traversers:
+        if element is None:
+            element = fetched.get(_id)
+        if element is not None:
+            completed.append((_id, element))
+    return completed
+
+
+class FrontierStage(object):
+    """Evaluates steps over chunks of batchSize traversers. Hops
+    expand the whole chunk with a single expandFrontier call and
+    consecutive has steps are fused into one multi-get"""
+
+    def __init__(self, graph, steps):
+        """Constructor
+        @params graph: The Graph to be traversed
+        @params steps: List of Step objects"""
+        self.graph = graph
+        self.steps = steps
+        self.groups = []
+        for step in steps:
+            if (step.name == "has" and self.groups
+                    and self.groups[-1][0].name == "has"):
+                self.groups[-1].append(step)
+            else:
+                self.groups.append([step])
+
+    def run(self, traversers):
+        """Applies the steps to a stream of traversers
+        @params traversers: Iterator of (identifier, Vertex or None)
+
+        @returns A generator of (identifier, Vertex or None)"""
+        batchSize = getattr(self.graph, "batchSize", 500)
+        workers = getattr(self.graph, "workers", DEFAULT_WORKERS)
+        seen = [set() for group in self.groups]
+        counts = [0] * len(self.groups)
+        with FrontierExpander(self.graph, workers) as expander:
+            for chunk in _chunks(traversers, batchSize):
+                exhausted = False
+                for position, group in enumerate(self.groups):
+                    name = group[0].name
+                    if name in _HOPS:
+                        chunk = self._hop(expander, chunk, group[0])
+                    elif name == "has":
+                        keys = [step.key for step in group]
+                        chunk = [(_id, element) for _id, element
+                                 in _fetch(expander, chunk, keys)
+                                 if self._matches(element, group)]
+                    elif name == "dedup":
+                        unique = []
+                        for _id, element in chunk:
+                            if _id not in seen[position]:
+                                seen[position].add(_id)
+                                unique.append((_id, element))
+                        chunk = unique
+                    elif name == "limit":
+                        left = group[0].count - counts[position]
+                        chunk = chunk[:left]
+                        counts[position] += len(chunk)
+                        exhausted = exhausted or len(chunk) == left
+                for traverser in chunk:
+                    yield traverser
+                # Nothing else gets through a limit already reached
+                if exhausted:
+                    return
+
+    def _hop(self, expander, chunk, step):
+        ids = [_id for _id, element in chunk]
+        expanded = expander.expand(set(ids), step.name, step.label)
+        hopped = []
+        for _id in ids:
+            for edge, neighbour in expanded.get(_id, []):
+                hopped.append((neighbour, None))
+        return hopped
+
+    def _matches(self, element, group):
+        properties = _readProperties(element, [step.key for step in group])
+        for step in group:
+            if not step.matches(properties):
+                return False
+        return True
+
+    def __str__(self):
+        return "Frontier: %s" % " | ".join(
+            " & ".join(str(step) for step in group)
+            for group in self.groups)
+
+
+class FetchStage(object):
+    """Last stage of every plan. It retrieves, one multi-get per
+    chunk, the vertices not loaded by the previous stages and emits
+    them or the values of one of their properties"""
+
+    def __init__(self, graph, key=None):
+        """Constructor
+        @params graph: The traversed Graph
+        @params key: Optional property key to emit instead of vertices"""
+        self.graph = graph
+        self.key = key
+
+    def run(self, traversers):
+        """Emits the results of the pipeline
+        @params traversers: Iterator of (identifier, Vertex or None)
+
+        @returns A generator of Vertex objects or property values"""
+        batchSize = getattr(self.graph, "batchSize", 500)
+        workers = getattr(self.graph, "workers", DEFAULT_WORKERS)
+        projection = None
+        if self.key is not None:
+            projection = [self.key]
+        with FrontierExpander(self.graph, workers) as expander:
+            for chunk in _chunks(traversers, batchSize):
+                for _id, element in _fetch(expander, chunk, projection):
+                    if self.key is None:
+                        yield element
+                        continue
+                    properties = _readProperties(element, [self.key])
+                    if self.key in properties:
+                        yield properties[self.key]
+
+    def __str__(self):
+        if self.key is None:
+            return "Fetch: vertices"
+        return "Fetch: values(%s)" % self.key
@@ -6,8 +6,20 @@
 # This test has been performed with a default neo4j-community-1.6 distribution#
 ###############################################################################
 
+import array
+import json
+import threading
+import time
 import unittest
+from neo4jrestclient.request import Request
 from pyblueprints.neo4j import *
+from pyblueprints.cache import CachingGraph, CachingIndexableGraph
+from pyblueprints import algorithms
+from pyblueprints.memory import MemoryGraph, ReadOnlyGraphError, \
+    DuplicateIdError
+from pyblueprints.mirror import MirrorGraph
+from pyblueprints.partition import PartitionedGraph, PartitionedIndexableGraph
+from pyblueprints.codec import NativeCodec, CompactCodec, StringCodec
 
 HOST = 'http://localhost:7474/db/data'
 
@@ -78,6 +90,20 @@ class RequestServerTestSuite(unittest.TestCase):
         vertex = graph.getVertex(vertex_id)
         self.assertNotIn('name', vertex.getPropertyKeys())
 
+    def testTypedProperties(self):
+        graph= Neo4jGraph(HOST, codec=CompactCodec(minLength=4))
+        vertex = graph.addVertex()
+        vertex.setProperties({'age': 30, 'active': True,
+                              'tags': ['a', 'b'],
+                              'features': [0.5, 1.5, 2.5, 3.5]})
+        vertex = graph.getVertex(vertex.getId())
+        self.assertEqual(vertex.getProperty('age'), 30)
+        self.assertEqual(vertex.getProperty('active'), True)
+        self.assertEqual(vertex.getProperty('tags'), ['a', 'b'])
+        features = vertex.getProperties()['features']
+        self.assertIsInstance(features, array.array)
+        self.assertEqual(list(features), [0.5, 1.5, 2.5, 3.5])
+
     def testEdgeMethods(self):
         graph= Neo4jGraph(HOST)
         v1 = graph.addVertex()
@@ -93,6 +119,68 @@ class RequestServerTestSuite(unittest.TestCase):
         self.assertEqual(inVertex.getId(), _id2)
         self.assertEqual(edge.getLabel(), 'myLabel')
 
+    def testGetVerticesEdges(self):
+        graph= Neo4jGraph(HOST)
+        v1 = graph.addVertex()
+        v2 = graph.addVertex()
+        edge = graph.addEdge(v1, v2, 'myLabel')
+        ids = [vertex.getId() for vertex in graph.getVertices()]
+        self.assertIn(v1.getId(), ids)
+        self.assertIn(v2.getId(), ids)
+        edges = [e for e in graph.getEdges() if e.getId() == edge.getId()]
+        self.assertEqual(edges[0].getOutVertexId(), v1.getId())
+        self.assertEqual(edges[0].getInVertexId(), v2.getId())
+
+    def testGetElementsById(self):
+        graph= Neo4jGraph(HOST)
+        graph.batchSize = 2
+        vertices = [graph.addVertex() for i in range(5)]
+        edge = graph.addEdge(vertices[0], vertices[1], 'myLabel')
+        graph.removeVertex(vertices[4])
+        ids = [vertex.getId() for vertex in reversed(vertices)]
+        found = graph.getVerticesById(ids)
+        self.assertIsNone(found[0])
+        self.assertEqual([vertex.getId() for vertex in found[1:]], ids[1:])
+        edges = graph.getEdgesById([edge.getId(), -1])
+        self.assertEqual(edges[0].getId(), edge.getId())
+        self.assertIsNone(edges[1])
+
+    def testPropertyProjection(self):
+        graph= Neo4jGraph(HOST)
+        v1 = graph.addVertex()
+        v2 = graph.addVertex()
+        v1.setProperties({'name': 'paquito', 'age': 40})
+        edge = graph.addEdge(v1, v2, 'knows')
+        edge.setProperty('since', 2010)
+        vertex = graph.getVertex(v1.getId(), properties=['name'])
+        self.assertEqual(vertex.getLoadedKeys(), set(['name']))
+        self.assertEqual(vertex.getProperty('name'), 'paquito')
+        self.assertEqual(vertex.getProperty('age'), 40)
+        self.assertEqual(vertex.getProperties(), {'name': 'paquito',
+                                                  'age': 40})
+        self.assertIsNone(vertex.getLoadedKeys())
+        found = graph.getVerticesById([v2.getId(), v1.getId()],
+                                      properties=False)
+        self.assertEqual([v.getId() for v in found], [v2.getId(), v1.getId()])
+        self.assertEqual(found[1].getLoadedKeys(), set())
+        edges = list(v1.getOutEdges('knows', properties=['since']))
+        self.assertEqual(edges[0].getId(), edge.getId())
+        self.assertEqual(edges[0].getInVertexId(), v2.getId())
+        self.assertEqual(edges[0].getProperty('since'), 2010)
+
+    def testPipeline(self):
+        graph= Neo4jGraph(HOST)
+        v1 = graph.addVertex()
+        v2 = graph.addVertex()
+        v3 = graph.addVertex()
+        v2.setProperties({'name': 'paquito', 'age': 40})
+        v3.setProperties({'name': 'pablito', 'age': 20})
+        graph.addEdge(v1, v2, 'knows')
+        graph.addEdge(v1, v3, 'knows')
+        pipeline = graph.v(v1.getId()).out('knows').has('age', gt=30)
+        self.assertIn('Cypher', pipeline.explain())
+        self.assertEqual(pipeline.values('name').toList(), ['paquito'])
+
     def testAddRemoveManualIndex(self):
         graph= Neo4jIndexableGraph(HOST)
         index = graph.createManualIndex('myManualIndex', 'vertex')
@@ -152,6 +240,37 @@ class RequestServerTestSuite(unittest.TestCase):
         self.assertEqual(type(v.getId()), int)
         graph.stopTransaction()
 
+    def testThreadTransactions(self):
+        graph= Neo4jTransactionalGraph(HOST, groupCommitWindow=0.1)
+        vertices = {}
+        errors = []
+
+        def write(name):
+            # Failures are raised in the thread, so they are collected
+            try:
+                with graph.transaction():
+                    vertex = graph.addVertex()
+                    self.assertRaises(AttributeError, vertex.getId)
+                with graph.transaction():
+                    vertex.setProperty('name', name)
+                vertices[name] = vertex.getId()
+            except Exception as e:
+                errors.append(e)
+        threads = [threading.Thread(target=write, args=('v%s' % i,))
+                   for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(vertices), 4)
+        self.assertFalse(graph.isInTransaction())
+        for name, _id in vertices.items():
+            self.assertEqual(graph.getVertex(_id).getProperty('name'), name)
+        graph.startTransaction()
+        self.assertRaises(Neo4jTransactionError, graph.startTransaction)
+        graph.stopTransaction(False)
+
     def testTransactionalIndexableMethods(self):
         graph= Neo4jTransactionalIndexableGraph(HOST)
         graph.startTransaction()
@@ -179,5 +298,950 @@ class RequestServerTestSuite(unittest.TestCase):
         self.assertEqual(type(v.getId()), int)
         graph.stopTransaction()
 
+
+class CachingGraphTestSuite(unittest.TestCase):
+
+    def testCachedVertexProperties(self):
+        graph = CachingGraph(Neo4jGraph(HOST))
+        vertex = graph.addVertex()
+        _id = vertex.getId()
+        vertex.setProperty('name', 'paquito')
+        vertex = graph.getVertex(_id)
+        self.assertEqual(vertex.getProperty('name'), 'paquito')
+        hits = graph.getCacheStats()['hits']
+        vertex = graph.getVertex(_id)
+        self.assertEqual(vertex.getProperty('name'), 'paquito')
+        self.assertTrue(graph.getCacheStats()['hits'] > hits)
+        vertex.setProperty('name', 'pablito')
+        self.assertEqual(graph.getVertex(_id).getProperty('name'), 'pablito')
+        graph.removeVertex(vertex)
+        self.assertIsNone(graph.getVertex(_id))
+
+    def testCachedAdjacencyInvalidation(self):
+        graph = CachingGraph(Neo4jGraph(HOST))
+        v1 = graph.addVertex()
+        v2 = graph.addVertex()
+        self.assertEqual(list(v1.getOutEdges('myLabel')), [])
+        edge = graph.addEdge(v1, v2, 'myLabel')
+        edges = list(v1.getOutEdges('myLabel'))
+        self.assertEqual(len(edges), 1)
+        self.assertEqual(edges[0].getInVertex().getId(), v2.getId())
+        graph.removeEdge(edge)
+        self.assertEqual(list(v1.getOutEdges('myLabel')), [])
+
+    def testCachedIndex(self):
+        graph = CachingIndexableGraph(Neo4jIndexableGraph(HOST))
+        index = graph.createManualIndex('myManualIndex', 'vertex')
+        vertex = graph.addVertex()
+        index.put('key1', 'value1', vertex)
+        self.assertEqual(index.count('key1', 'value1'), 1)
+        self.assertEqual(list(index.get('key1', 'value1'))[0].getId(),
+                         vertex.getId())
+        index.remove('key1', 'value1', vertex)
+        self.assertEqual(list(index.get('key1', 'value1')), [])
+        graph.dropIndex('myManualIndex', 'vertex')
+
+
+class AlgorithmsTestSuite(unittest.TestCase):
+
+    def setUp(self):
+        self.graph = Neo4jGraph(HOST)
+        self.vertices = [self.graph.addVertex() for i in range(5)]
+        self.ids = [vertex.getId() for vertex in self.vertices]
+        for i, j in [(0, 1), (1, 2), (2, 3), (0, 4), (4, 3)]:
+            self.graph.addEdge(self.vertices[i], self.vertices[j], 'myLabel')
+
+    def testExpandFrontier(self):
+        frontier = self.graph.expandFrontier(self.ids[:2], 'out', 'myLabel')
+        neighbours = [neighbour for edge, neighbour in frontier[self.ids[0]]]
+        self.assertEqual(sorted(neighbours),
+                         sorted([self.ids[1], self.ids[4]]))
+        self.assertIsInstance(frontier[self.ids[1]][0][0], Edge)
+        frontier = self.graph.expandFrontier([self.ids[3]], 'in')
+        self.assertEqual(len(frontier[self.ids[3]]), 2)
+
+    def testBfs(self):
+        reached = dict(algorithms.bfs(self.graph, self.vertices[0],
+                                      label='myLabel'))
+        self.assertEqual(reached[self.ids[0]], 0)
+        self.assertEqual(reached[self.ids[4]], 1)
+        self.assertEqual(reached[self.ids[3]], 2)
+        reached = algorithms.kHop(self.graph, self.ids[0], 1)
+        self.assertNotIn(self.ids[3], reached)
+
+    def testShortestPath(self):
+        path = algorithms.shortestPath(self.graph, self.ids[0], self.ids[3])
+        self.assertEqual(path, [self.ids[0], self.ids[4], self.ids[3]])
+        path = algorithms.shortestPath(self.graph, self.ids[3], self.ids[0])
+        self.assertIsNone(path)
+
+    def testConnectedComponents(self):
+        isolated = self.graph.addVertex().getId()
+        components = algorithms.connectedComponents(self.graph,
+                                                    self.ids + [isolated])
+        self.assertEqual(components, [set(self.ids), set([isolated])])
+
+    def testSubgraph(self):
+        self.vertices[0].setProperty('name', 'paquito')
+        self.vertices[0].setProperty('blob', 'large value')
+        local = algorithms.subgraph(self.graph, self.ids[0], depth=1,
+                                    properties=['name'])
+        self.assertIsInstance(local, MemoryGraph)
+        self.assertEqual(sorted(vertex.getId()
+                                for vertex in local.getVertices()),
+                         sorted([self.ids[0], self.ids[1], self.ids[4]]))
+        vertex = local.getVertex(self.ids[0])
+        self.assertEqual(vertex.getProperties(), {'name': 'paquito'})
+        self.assertEqual(len(list(vertex.getOutEdges('myLabel'))), 2)
+        self.assertRaises(ReadOnlyGraphError, vertex.setProperty, 'k', 'v')
+
+
+class MemoryGraphTestSuite(unittest.TestCase):
+
+    def testAddRemoveElements(self):
+        graph = MemoryGraph()
+        v1 = graph.addVertex()
+        v2 = graph.addVertex('myId', {'name': 'paquito'})
+        self.assertEqual(graph.getVertex('myId').getProperty('name'),
+                         'paquito')
+        edge = graph.addEdge(v1, v2, 'myLabel')
+        self.assertEqual(edge.getOutVertex().getId(), v1.getId())
+        self.assertRaises(DuplicateIdError, graph.addVertex, 'myId')
+        self.assertRaises(DuplicateIdError, graph.addEdge, v2, v1,
+                          'otherLabel', edge.getId())
+        self.assertEqual(graph.getVertex('myId').getProperty('name'),
+                         'paquito')
+        self.assertEqual(list(v2.getInEdges('myLabel'))[0].getId(),
+                         edge.getId())
+        self.assertEqual(list(v2.getInEdges('otherLabel')), [])
+        graph.removeVertex(v1)
+        self.assertIsNone(graph.getEdge(edge.getId()))
+        self.assertEqual(list(v2.getBothEdges()), [])
+
+    def testGetElementsById(self):
+        graph = MemoryGraph()
+        v1 = graph.addVertex()
+        v2 = graph.addVertex()
+        edge = graph.addEdge(v1, v2, 'myLabel')
+        self.assertEqual(graph.getVerticesById([v2.getId(), 'missing',
+                                                v1.getId()]),
+                         [v2, None, v1])
+        cached = CachingGraph(graph).getEdgesById(['missing', edge.getId()])
+        self.assertIsNone(cached[0])
+        self.assertEqual(cached[1].getId(), edge.getId())
+
+    def testSubgraphLabels(self):
+        graph = MemoryGraph()
+        v1, v2, v3, v4, v5 = [graph.addVertex() for i in range(5)]
+        graph.addEdge(v1, v2, 'knows')
+        graph.addEdge(v3, v1, 'likes')
+        graph.addEdge(v1, v4, 'other')
+        graph.addEdge(v5, v3, 'knows')
+        expansions = []
+        expandFrontier = graph.expandFrontier
+
+        def countingExpandFrontier(*args):
+            expansions.append(args)
+            return expandFrontier(*args)
+        graph.expandFrontier = countingExpandFrontier
+        local = algorithms.subgraph(graph, v1, depth=2,
+                                    labels=['knows', 'likes'])
+        # One expansion per level, whatever the labels and directions
+        self.assertEqual(len(expansions), 2)
+        self.assertEqual(sorted(vertex.getId()
+                                for vertex in local.getVertices()),
+                         sorted([v1.getId(), v2.getId(), v3.getId(),
+                                 v5.getId()]))
+        edge = list(local.getVertex(v1.getId()).getInEdges('likes'))[0]
+        self.assertEqual(edge.getOutVertexId(), v3.getId())
+        edge = list(local.getVertex(v3.getId()).getInEdges('knows'))[0]
+        self.assertEqual(edge.getOutVertexId(), v5.getId())
+
+    def testBackendErrors(self):
+        snapshots = SnapshotGraph()
+        v1, v2 = snapshots.addVertex(), snapshots.addVertex()
+        snapshots.addEdge(v1, v2, 'knows')
+        # Graphs without expandFrontier are expanded vertex by vertex
+        self.assertEqual(sorted(algorithms.kHop(snapshots, v1.getId(), 1)),
+                         sorted([v1.getId(), v2.getId()]))
+        graph = MemoryGraph()
+        vertex = graph.addVertex()
+
+        def brokenExpandFrontier(*args):
+            return None.items()
+        graph.expandFrontier = brokenExpandFrontier
+        # A bug in the backend is not taken for a missing method
+        self.assertRaises(AttributeError, algorithms.kHop, graph,
+                          vertex.getId(), 1)
+
+    def testSelfLoops(self):
+        graph = MemoryGraph()
+        vertex = graph.addVertex()
+        loop = graph.addEdge(vertex, vertex, 'myLabel')
+        frontier = graph.expandFrontier([vertex.getId()], 'both')
+        self.assertEqual(frontier[vertex.getId()], [(loop, vertex.getId())])
+        self.assertEqual(len(graph.expandFrontier([vertex.getId()],
+                                                  'in')[vertex.getId()]), 1)
+
+    def testCachedRemoval(self):
+        graph = CachingIndexableGraph(MemoryIndexableGraph())
+        index = graph.createManualIndex('vertices', 'vertex')
+        v1 = graph.addVertex()
+        v2 = graph.addVertex()
+        edge = graph.addEdge(v1, v2, 'myLabel')
+        index.put('key1', 'value1', v1)
+        self.assertEqual(graph.getEdge(edge.getId()).getInVertex(), v2)
+        self.assertEqual(len(list(index.get('key1', 'value1'))), 1)
+        v3 = graph.addVertex()
+        graph.addEdge(v2, v3, 'myLabel')
+        self.assertEqual(len(list(v3.getInEdges())), 1)
+        graph.removeVertex(v1)
+        self.assertIsNone(graph.getEdge(edge.getId()))
+        self.assertEqual(list(v2.getInEdges()), [])
+        # The adjacency of the vertices not linked to it is kept
+        self.assertIn(('adjacency', v3.getId(), 'in', None), graph.cache)
+        # Only a stale cached lookup could still return the vertex
+        graph.graph.getIndex('vertices', 'vertex').entries.clear()
+        self.assertEqual(list(index.get('key1', 'value1')), [])
+
+    def testCachedWrites(self):
+        graph = CachingGraph(SnapshotGraph())
+        vertex = graph.addVertex()
+        vertex.setProperty('name', 'paquito')
+        other = graph.addVertex()
+        edge = graph.addEdge(vertex, other, 'myLabel')
+        self.assertEqual(graph.getVertex(vertex.getId()).getProperty('name'),
+                         'paquito')
+        # Written through another wrapper than the cached one
+        vertex.setProperty('name', 'pablito')
+        self.assertEqual(graph.getVertex(vertex.getId()).getProperty('name'),
+                         'pablito')
+        self.assertEqual(vertex.getProperty('name'), 'pablito')
+        edge.setProperty('weight', 1)
+        adjacent = list(graph.getVertex(vertex.getId()).getOutEdges())[0]
+        self.assertEqual(adjacent.getProperty('weight'), 1)
+        adjacent.setProperty('weight', 2)
+        self.assertEqual(graph.getEdge(edge.getId()).getProperty('weight'), 2)
+        self.assertEqual(edge.getProperty('weight'), 2)
+        # Once cached, reads do not retrieve the elements again
+        for i in range(2):
+            retrievals = graph.graph.retrievals
+            edge = graph.getEdge(edge.getId())
+            self.assertEqual(edge.getLabel(), 'myLabel')
+            self.assertEqual(edge.getInVertex().getProperties(), {})
+            self.assertEqual(edge.getProperty('weight'), 2)
+        self.assertEqual(graph.graph.retrievals, retrievals)
+
+    def testCacheSize(self):
+        blob = 'x' * 1000000
+        backend = MemoryGraph()
+        vertex = backend.addVertex(properties={'blob': blob})
+        graph = CachingGraph(backend, maxBytes=1500000)
+        self.assertEqual(graph.getVertex(vertex.getId()).getProperty('blob'),
+                         blob)
+        stats = graph.getCacheStats()
+        self.assertTrue(len(blob) < stats['bytes'] < 2 * len(blob))
+        backend.addVertex(properties={'blob': blob})
+        for other in backend.getVertices():
+            graph.getVertex(other.getId()).getProperties()
+        # Two blobs do not fit, the oldest one is evicted
+        self.assertEqual(graph.getCacheStats()['entries'], 1)
+
+    def testPropertyProjection(self):
+        graph = MemoryGraph()
+        vertex = graph.addVertex(properties={'name': 'paquito', 'age': 40})
+        projected = graph.getVertex(vertex.getId(), properties=['name'])
+        self.assertIsNone(projected.getLoadedKeys())
+        self.assertEqual(projected.getProperty('age'), 40)
+        cached = CachingGraph(graph).getVerticesById([vertex.getId()],
+                                                     properties=False)
+        self.assertIsNone(cached[0].getLoadedKeys())
+        self.assertEqual(cached[0].getProperty('name'), 'paquito')
+
+    def testReadOnly(self):
+        graph = MemoryGraph()
+        vertex = graph.addVertex()
+        graph.readOnly = True
+        self.assertRaises(ReadOnlyGraphError, graph.addVertex)
+        self.assertRaises(ReadOnlyGraphError, vertex.setProperty, 'k', 'v')
+        self.assertRaises(ReadOnlyGraphError, graph.removeVertex, vertex)
+
+
+class MirrorGraphTestSuite(unittest.TestCase):
+
+    def setUp(self):
+        self.remote = MemoryGraph()
+        self.v1 = self.remote.addVertex(properties={'name': 'paquito'})
+        self.v2 = self.remote.addVertex()
+        self.remote.addEdge(self.v1, self.v2, 'myLabel')
+
+    def testBulkLoadAndRefresh(self):
+        graph = MirrorGraph(self.remote)
+        vertex = graph.getVertex(self.v1.getId())
+        self.assertEqual(vertex.getProperty('name'), 'paquito')
+        edge = list(vertex.getOutEdges('myLabel'))[0]
+        self.assertEqual(edge.getInVertex().getId(), self.v2.getId())
+        v3 = self.remote.addVertex()
+        self.assertIsNone(graph.getVertex(v3.getId()))
+        graph.refresh()
+        self.assertEqual(graph.getVertex(v3.getId()).getId(), v3.getId())
+        self.assertTrue(graph.getStaleness() >= 0)
+
+    def testMaxLag(self):
+        graph = MirrorGraph(self.remote, maxLag=0)
+        v3 = self.remote.addVertex()
+        self.assertEqual(graph.getVertex(v3.getId()).getId(), v3.getId())
+
+    def testWriteThrough(self):
+        graph = MirrorGraph(self.remote)
+        vertex = graph.addVertex()
+        vertex.setProperty('name', 'pablito')
+        remoteVertex = self.remote.getVertex(vertex.getId())
+        self.assertEqual(remoteVertex.getProperty('name'), 'pablito')
+        edge = graph.addEdge(graph.getVertex(self.v1.getId()), vertex,
+                             'myLabel')
+        self.assertIsNotNone(self.remote.getEdge(edge.getId()))
+        graph.removeEdge(edge)
+        self.assertIsNone(self.remote.getEdge(edge.getId()))
+        self.assertIsNone(graph.getEdge(edge.getId()))
+
+    def testConcurrentStaleReads(self):
+        remote = SlowGraph()
+        _id = remote.addVertex().getId()
+        graph = MirrorGraph(remote, maxLag=0.01)
+        time.sleep(0.02)
+        threads = [threading.Thread(target=graph.getVertex, args=(_id,))
+                   for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # A single reload for every stale reader, taking longer than
+        # maxLag, and none for the reads right after it
+        self.assertEqual(remote.loads, 2)
+        graph.getVertex(_id)
+        self.assertEqual(remote.loads, 2)
+
+    def testBackgroundRefresh(self):
+        remote = SlowGraph()
+        graph = MirrorGraph(remote, refreshInterval=60, maxLag=0.01)
+        graph.start()
+        try:
+            time.sleep(0.02)
+            _id = remote.addVertex().getId()
+            # Served the stale copy, the background thread reloads it
+            self.assertIsNone(graph.getVertex(_id))
+            self.assertEqual(remote.loads, 1)
+            for i in range(100):
+                if graph.local.getVertex(_id) is not None:
+                    break
+                time.sleep(0.01)
+            self.assertIsNotNone(graph.local.getVertex(_id))
+        finally:
+            graph.stop()
+
+    def testTimestampBoundary(self):
+        self.v1.setProperty('modified', 1)
+        graph = MirrorGraph(self.remote, timestampKey='modified')
+        # Written after the load with the newest timestamp already seen
+        v3 = self.remote.addVertex(properties={'modified': 1})
+        self.v1.setProperty('name', 'pablito')
+        self.v1.setProperty('modified', 2)
+        graph.refresh()
+        self.assertEqual(graph.getVertex(v3.getId()).getId(), v3.getId())
+        self.assertEqual(graph.getVertex(self.v1.getId()).getProperty('name'),
+                         'pablito')
+        graph.refresh()
+        self.assertEqual(len(list(graph.getVertices())), 3)
+        self.assertEqual(len(list(graph.getEdges())), 1)
+
+
+class SlowGraph(MemoryGraph):
+    """A MemoryGraph counting the slow listings of its vertices"""
+
+    def __init__(self):
+        MemoryGraph.__init__(self)
+        self.loads = 0
+
+    def getVertices(self, properties=None):
+        self.loads += 1
+        time.sleep(0.05)
+        return MemoryGraph.getVertices(self)
+
+
+class MemoryIndex(object):
+    """A manual index over a dictionary, for the offline tests"""
+
+    def __init__(self, indexName, indexClass):
+        self.indexName = indexName
+        self.indexClass = indexClass
+        self.entries = {}
+
+    def count(self, key, value):
+        return len(self.entries.get((key, value), []))
+
+    def getIndexName(self):
+        return self.indexName
+
+    def getIndexClass(self):
+        return self.indexClass
+
+    def getIndexType(self):
+        return 'manual'
+
+    def put(self, key, value, element):
+        self.entries.setdefault((key, value), []).append(element)
+
+    def get(self, key, value):
+        return iter(list(self.entries.get((key, value), [])))
+
+    def remove(self, key, value, element):
+        self.entries.get((key, value), []).remove(element)
+
+
+class MemoryIndexableGraph(MemoryGraph):
+
+    def __init__(self):
+        MemoryGraph.__init__(self)
+        self.indexes = {}
+
+    def createManualIndex(self, indexName, indexClass):
+        index = MemoryIndex(indexName, indexClass)
+        self.indexes[(indexName, indexClass)] = index
+        return index
+
+    def getIndex(self, indexName, indexClass):
+        return self.indexes.get((indexName, indexClass))
+
+
+class SnapshotElement(object):
+    """A detached copy of a memory element, like the elements of
+    remote backends, for the offline tests"""
+
+    def __init__(self, graph, element):
+        self.graph = graph
+        self.element = element
+        self.properties = element.getProperties()
+
+    def getId(self):
+        return self.element.getId()
+
+    def getProperty(self, key):
+        return self.properties.get(key)
+
+    def getPropertyKeys(self):
+        return self.properties.keys()
+
+    def getProperties(self):
+        return dict(self.properties)
+
+    def setProperty(self, key, value):
+        self.element.setProperty(key, value)
+        self.properties[key] = value
+
+    def removeProperty(self, key):
+        self.element.removeProperty(key)
+        self.properties.pop(key, None)
+
+
+class SnapshotVertex(SnapshotElement):
+
+    def _copies(self, edges):
+        return [SnapshotEdge(self.graph, edge) for edge in edges]
+
+    def getOutEdges(self, label=None):
+        return self._copies(self.element.getOutEdges(label))
+
+    def getInEdges(self, label=None):
+        return self._copies(self.element.getInEdges(label))
+
+    def getBothEdges(self, label=None):
+        return self._copies(self.element.getBothEdges(label))
+
+
+class SnapshotEdge(SnapshotElement):
+
+    def getOutVertex(self):
+        return SnapshotVertex(self.graph, self.element.getOutVertex())
+
+    def getInVertex(self):
+        return SnapshotVertex(self.graph, self.element.getInVertex())
+
+    def getLabel(self):
+        return self.element.getLabel()
+
+
+class SnapshotGraph(object):
+    """A MemoryGraph returning a new copy of an element on every
+    retrieval"""
+
+    def __init__(self):
+        self.graph = MemoryGraph()
+        self.retrievals = 0
+
+    def _copy(self, cls, element):
+        self.retrievals += 1
+        return cls(self, element) if element is not None else None
+
+    def addVertex(self, _id=None):
+        return SnapshotVertex(self, self.graph.addVertex(_id))
+
+    def getVertex(self, _id):
+        return self._copy(SnapshotVertex, self.graph.getVertex(_id))
+
+    def removeVertex(self, vertex):
+        self.graph.removeVertex(vertex.element)
+
+    def addEdge(self, outVertex, inVertex, label):
+        return SnapshotEdge(self, self.graph.addEdge(outVertex.element,
+                                                     inVertex.element, label))
+
+    def getEdge(self, _id):
+        return self._copy(SnapshotEdge, self.graph.getEdge(_id))
+
+    def removeEdge(self, edge):
+        self.graph.removeEdge(edge.element)
+
+
+class PartitionedGraphTestSuite(unittest.TestCase):
+
+    def setUp(self):
+        self.graph = PartitionedGraph([MemoryGraph(), MemoryGraph()],
+                                      rebalanceRate=0)
+        self.vertices = [self.graph.addVertex('v%s' % i) for i in range(8)]
+        for v1, v2 in zip(self.vertices, self.vertices[1:]):
+            self.graph.addEdge(v1, v2, 'next').setProperty('weight', 1)
+
+    def testCrossPartitionEdges(self):
+        self.assertEqual(len(set(v.partition for v in self.vertices)), 2)
+        self.assertEqual(len(list(self.graph.getVertices())), 8)
+        # The placement key is the identifier in the partition
+        self.assertRaises(DuplicateIdError, self.graph.addVertex, 'v0')
+        self.assertEqual(len(list(self.graph.getVertices())), 8)
+        self.assertEqual(len(list(self.graph.getEdges())), 7)
+        for v1, v2 in zip(self.vertices, self.vertices[1:]):
+            edge = list(v2.getInEdges('next'))[0]
+            self.assertEqual(edge.getOutVertex(), v1)
+            self.assertEqual(edge.getProperty('weight'), 1)
+            self.assertEqual(list(v1.getOutEdges('next'))[0].getId(),
+                             edge.getId())
+        self.graph.removeVertex(self.vertices[3])
+        self.assertEqual(list(self.vertices[4].getInEdges()), [])
+        self.assertEqual(len(list(self.graph.getEdges())), 5)
+
+    def testProxies(self):
+        def backendVertices():
+            return sum(len(list(graph.getVertices()))
+                       for graph in self.graph.graphs)
+        v1 = [v for v in self.vertices if v.partition == 0][0]
+        v2 = [v for v in self.vertices if v.partition == 1][0]
+        self.graph.addEdge(v1, v2, 'other')
+        count = backendVertices()
+        # Another graph over the same partitions reuses the proxies
+        other = PartitionedGraph(self.graph.graphs)
+        other.addEdge(other.getVertex(v1.getId()),
+                      other.getVertex(v2.getId()), 'other')
+        other.addEdge(other.getVertex(v2.getId()),
+                      other.getVertex(v1.getId()), 'other')
+        self.assertEqual(backendVertices(), count)
+        for vertex in self.vertices:
+            self.graph.removeVertex(vertex)
+        self.assertEqual(backendVertices(), 0)
+
+    def testRebalanceIndexes(self):
+        graph = PartitionedIndexableGraph([MemoryIndexableGraph(),
+                                           MemoryIndexableGraph()],
+                                          rebalanceRate=0)
+        vertices = graph.createManualIndex('vertices', 'vertex')
+        edges = graph.createManualIndex('edges', 'edge')
+        previous = None
+        for i in range(8):
+            vertex = graph.addVertex('v%s' % i)
+            vertex.setProperty('name', i)
+            vertices.put('name', i, vertex)
+            if previous is not None:
+                edges.put('to', i, graph.addEdge(previous, vertex, 'next'))
+            previous = vertex
+        graph.addPartition(MemoryIndexableGraph())
+        graph.waitRebalance()
+        vertices = graph.getIndex('vertices', 'vertex')
+        for i in range(8):
+            found = list(vertices.get('name', i))
+            self.assertEqual([v.getProperty('name') for v in found], [i])
+            self.assertEqual(found[0].partition,
+                             graph.partitionFunction('v%s' % i, 3))
+        for i in range(1, 8):
+            edge, = list(edges.get('to', i))
+            self.assertEqual(edge.getInVertex().getProperty('name'), i)
+
+    def testPartialReads(self):
+        self.graph.scatterBuffer = 1
+        threads = threading.active_count()
+        for i in range(5):
+            vertices = self.graph.getVertices()
+            next(vertices)
+            vertices.close()
+        for i in range(50):
+            if threading.active_count() == threads:
+                break
+            time.sleep(0.1)
+        self.assertEqual(threading.active_count(), threads)
+
+    def testGetElementsById(self):
+        ids = [vertex.getId() for vertex in self.vertices]
+        ids.insert(2, (0, 'missing'))
+        found = self.graph.getVerticesById(ids)
+        self.assertIsNone(found[2])
+        self.assertEqual([vertex.getId() for vertex in found if vertex],
+                         [vertex.getId() for vertex in self.vertices])
+
+    def testRebalance(self):
+        for vertex in self.vertices:
+            vertex.setProperty('name', vertex.getId())
+        self.graph.addPartition(MemoryGraph())
+        self.graph.waitRebalance()
+        self.assertEqual(len(list(self.graph.getVertices())), 8)
+        self.assertEqual(len(list(self.graph.getEdges())), 7)
+        for vertex in self.vertices:
+            moved = self.graph.getVertex(vertex.getId())
+            self.assertEqual(moved.getProperty('name'), vertex.getId())
+        path = algorithms.shortestPath(
+            self.graph, self.graph.getVertex(self.vertices[0].getId()),
+            self.graph.getVertex(self.vertices[-1].getId()))
+        self.assertEqual(len(path), 8)
+
+
+class PipelineTestSuite(unittest.TestCase):
+
+    def setUp(self):
+        self.graph = MemoryGraph()
+        people = [('paquito', 20), ('pablito', 35), ('pepito', 40)]
+        self.vertices = [self.graph.addVertex(name, {'name': name,
+                                                     'age': age})
+                         for name, age in people]
+        self.book = self.graph.addVertex('book', {'name': 'book'})
+        v1, v2, v3 = self.vertices
+        self.graph.addEdge(v1, v2, 'knows')
+        self.graph.addEdge(v1, v3, 'knows')
+        self.graph.addEdge(v2, self.book, 'likes')
+        self.graph.addEdge(v3, self.book, 'likes')
+
+    def testSteps(self):
+        pipeline = self.graph.v('paquito').out('knows').has('age', gt=30)
+        self.assertEqual(sorted(pipeline.values('name')),
+                         ['pablito', 'pepito'])
+        books = pipeline.out('likes')
+        self.assertEqual(len(books.toList()), 2)
+        self.assertEqual(books.dedup().toList(), [self.book])
+        self.assertEqual(len(books.limit(1).toList()), 1)
+        self.assertEqual(self.graph.v(self.book).in_('likes').in_('knows')
+                         .dedup().values('name').toList(), ['paquito'])
+        self.assertEqual(self.graph.v('missing').out().toList(), [])
+
+    def testPlan(self):
+        pipeline = self.graph.v('paquito').out('knows').has('age', gt=30) \
+            .has('name').limit(1).values('name')
+        plan = pipeline.plan()
+        self.assertEqual(len(plan), 2)
+        self.assertEqual(len(plan[0].groups), 3)
+        self.assertIn('values(name)', pipeline.explain())
+        self.assertRaises(ValueError, pipeline.out)
+
+
+class FakeResponse(object):
+
+    def __init__(self, status):
+        self.status = status
+
+
+class FakeRequest(Request):
+    """Replaces the neo4jrestclient requests in the offline tests.
+    Responses are (status, body) tuples, or exceptions to be raised,
+    served in order"""
+
+    requests = []
+    responses = []
+
+    def __init__(self, **kwargs):
+        pass
+
+    def _send(self, method, url, data=None):
+        # Recorded as sent, operations of a transaction change later
+        if data is not None:
+            data = json.loads(self._json_encode(data))
+        FakeRequest.requests.append((method, url, data))
+        response = FakeRequest.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        status, body = response
+        return FakeResponse(status), json.dumps(body)
+
+    def get(self, url):
+        return self._send('GET', url)
+
+    def post(self, url, data=None):
+        return self._send('POST', url, data)
+
+    def put(self, url, data=None):
+        return self._send('PUT', url, data)
+
+    def delete(self, url):
+        return self._send('DELETE', url)
+
+
+class Neo4jOfflineTestSuite(unittest.TestCase):
+    """Neo4j elements over canned REST responses"""
+
+    URL = 'http://localhost:7474/db/data/'
+
+    def setUp(self):
+        self.request = client.Request
+        client.Request = FakeRequest
+        FakeRequest.requests = []
+        FakeRequest.responses = []
+
+    def tearDown(self):
+        client.Request = self.request
+
+    def node(self, _id, data=None):
+        url = '%snode/%s' % (self.URL, _id)
+        return client.Node(url, update_dict={
+            'self': url, 'data': data or {},
+            'property': url + '/properties/{key}',
+            'properties': url + '/properties'})
+
+    def graph(self, cls=Neo4jGraph, url=URL, **kwargs):
+        FakeRequest.responses.append((200, {
+            'node': url + 'node',
+            'node_index': url + 'index/node',
+            'relationship_index': url + 'index/relationship',
+            'extensions_info': url + 'ext', 'extensions': {}}))
+        graph = cls(url, **kwargs)
+        FakeRequest.requests = []
+        return graph
+
+    def testBatchErrors(self):
+        graph = self.graph()
+        graph.batchSize = 4
+        failed = {'exception': 'BatchOperationFailedException'}
+        # The batch is split until the missing node is isolated
+        FakeRequest.responses = [
+            (500, failed),
+            (200, [{'id': 0, 'body': {'self': self.URL + 'node/1'}}]),
+            (500, failed)]
+        vertices = graph.getVerticesById([1, 2])
+        self.assertEqual(vertices[0].getId(), 1)
+        self.assertIsNone(vertices[1])
+        self.assertEqual(len(FakeRequest.requests), 3)
+        for status in (401, 503):
+            FakeRequest.responses = [(status, None)]
+            self.assertRaises(client.StatusException,
+                              graph.getVerticesById, [1, 2])
+        FakeRequest.responses = [(500, {'exception': 'NullPointerException'})]
+        self.assertRaises(client.StatusException, graph.expandFrontier, [1])
+
+    def testExpandLabels(self):
+        graph = self.graph()
+        FakeRequest.responses = [(200, [{'id': 0, 'body': [{
+            'self': self.URL + 'relationship/7',
+            'start': self.URL + 'node/2', 'end': self.URL + 'node/1',
+            'type': 'my label', 'data': {}}]}])]
+        frontier = graph.expandFrontier([1], 'both', ['my label', 'other'])
+        # Every label is retrieved with a single request per vertex
+        method, url, operations = FakeRequest.requests[0]
+        self.assertEqual([operation['to'] for operation in operations],
+                         ['/node/1/relationships/all/my%20label&other'])
+        self.assertEqual([neighbour for edge, neighbour in frontier[1]], [2])
+
+    def testCypherStage(self):
+        graph = self.graph()
+        graph.batchSize = 2
+        failed = {'exception': 'BatchOperationFailedException'}
+        nodes = [{'self': self.URL + 'node/%d' % _id, 'data': {}}
+                 for _id in (4, 5)]
+        # The missing node 2 is dropped instead of failing the query
+        FakeRequest.responses = [
+            (400, {'exception': 'EntityNotFoundException'}),
+            (500, failed),
+            (200, [{'id': 0, 'body': {'data': [[1]]}}]),
+            (500, failed),
+            (200, {'data': [[nodes[0]]]}),
+            (200, {'data': [[nodes[0]], [nodes[1]]]})]
+        pipeline = graph.v(1, 2, 3).out('knows').dedup().limit(2)
+        self.assertEqual([vertex.getId() for vertex in pipeline], [4, 5])
+        self.assertEqual(FakeRequest.responses, [])
+        # One query per chunk of batchSize vertices
+        queries = [data['params']['ids'] for method, url, data
+                   in FakeRequest.requests if url.endswith('cypher')]
+        self.assertEqual(queries, [[1, 2], [1], [3]])
+
+    def testQuotedNames(self):
+        graph = self.graph()
+        stage = graph.v(1).out('my`label').has('a`ge', gt=30).plan()[0]
+        self.assertIn('[:`my``label`]', stage.query)
+        self.assertIn('n1.`a``ge`!', stage.query)
+        FakeRequest.responses = [(200, {'data': []})]
+        list(graph.getVertices(['na`me']))
+        method, url, data = FakeRequest.requests[0]
+        self.assertIn('n.`na``me`?', data['query'])
+
+    def testSetProperties(self):
+        vertex = Vertex(self.node(1, {'name': u'paquito'}))
+        FakeRequest.responses = [(204, None)]
+        vertex.setProperties({'age': 40, 'active': True})
+        self.assertEqual(FakeRequest.requests,
+                         [('PUT', self.URL + 'node/1/properties',
+                           {'name': u'paquito', 'age': 40,
+                            'active': True})])
+        self.assertEqual(vertex.getProperties(), {'name': u'paquito',
+                                                  'age': 40, 'active': True})
+        FakeRequest.responses = [(400, None)]
+        self.assertRaises(client.StatusException, vertex.setProperties,
+                          {'age': 41})
+        self.assertEqual(vertex.getProperties()['age'], 40)
+        FakeRequest.requests = []
+        self.assertRaises(TypeError, vertex.setProperties, {'tags': [1, 'a']})
+        self.assertRaises(TypeError, vertex.setProperty, 'tags', {'a': 1})
+        self.assertEqual(FakeRequest.requests, [])
+        FakeRequest.responses = [(204, None)]
+        vertex.setProperties({'active': None})
+        self.assertEqual(FakeRequest.requests[0][2],
+                         {'name': u'paquito', 'age': 40})
+        self.assertEqual(vertex.getProperties(), {'name': u'paquito',
+                                                  'age': 40})
+
+    def testGraphTransactions(self):
+        first = self.graph(Neo4jTransactionalGraph)
+        second = self.graph(Neo4jTransactionalGraph,
+                            'http://localhost:7475/db/data/')
+        vertex = Vertex(self.node(1, {'name': u'paquito'}))
+        first.startTransaction()
+        second.startTransaction()
+        self.assertRaises(Neo4jTransactionError, second.startTransaction)
+        vertex.setProperty('name', u'paco')
+        second.addVertex()
+        self.assertEqual(FakeRequest.requests, [])
+        first.stopTransaction(False)
+        self.assertFalse(first.isInTransaction())
+        self.assertTrue(second.isInTransaction())
+        # Out of its transaction the first graph is written at once
+        FakeRequest.responses = [(204, None)]
+        vertex.setProperty('name', u'paco')
+        self.assertEqual(FakeRequest.requests,
+                         [('PUT', self.URL + 'node/1/properties/name',
+                           u'paco')])
+        FakeRequest.requests = []
+        FakeRequest.responses = [(200, [{
+            'id': 0, 'location': second.neograph.url + 'node/2',
+            'body': {'self': second.neograph.url + 'node/2', 'data': {}}}])]
+        second.stopTransaction()
+        self.assertEqual(len(FakeRequest.requests), 1)
+        method, url, operations = FakeRequest.requests[0]
+        self.assertEqual(url, second.neograph.url + 'batch')
+        self.assertEqual([operation['to'] for operation in operations],
+                         ['/node'])
+
+    def testAmbiguousTransaction(self):
+        first = self.graph(Neo4jTransactionalGraph)
+        second = self.graph(Neo4jTransactionalGraph,
+                            'http://localhost:7475/db/data/')
+        lookup = lambda: client.Transaction.get_transaction()
+        self.assertIsNone(lookup())
+        first.startTransaction()
+        try:
+            self.assertIsNotNone(lookup())
+            second.startTransaction()
+            # Neither graph can be told from a call without a URL
+            self.assertRaises(Neo4jTransactionError, lookup)
+            second.stopTransaction(False)
+        finally:
+            first.stopTransaction(False)
+
+    def testGroupCommitErrors(self):
+        graph = self.graph(Neo4jTransactionalGraph, groupCommitWindow=5,
+                           maxGroupOperations=2)
+        failed = {'exception': 'BatchOperationFailedException'}
+        vertices = [Vertex(self.node(_id)) for _id in (1, 2)]
+        results = [(200, [{'id': 0, 'from': '/node/%d/properties/name' %
+                           _id}]) for _id in (1, 2)]
+
+        def commit(errors):
+            def write(vertex):
+                try:
+                    with graph.transaction():
+                        vertex.setProperty('name', u'paco')
+                except Exception as e:
+                    errors.append(e)
+            threads = [threading.Thread(target=write, args=(vertex,))
+                       for vertex in vertices]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        # A batch rejected by the server is sent again per transaction
+        FakeRequest.responses = [(500, failed)] + results
+        errors = []
+        commit(errors)
+        self.assertEqual(errors, [])
+        self.assertEqual(len(FakeRequest.requests), 3)
+        # A batch that may have been applied is not sent again
+        FakeRequest.requests = []
+        FakeRequest.responses = [IOError('Connection reset')]
+        errors = []
+        commit(errors)
+        self.assertEqual(len(FakeRequest.requests), 1)
+        self.assertEqual([type(error) for error in errors], [IOError] * 2)
+
+    def testGroupCommitRefresh(self):
+        graph = self.graph(Neo4jTransactionalGraph, groupCommitWindow=0.001)
+        vertex = Vertex(self.node(1, {'name': u'paquito', 'age': 40}))
+        other = Vertex(self.node(2, {'name': u'paco'}))
+        removed = self.node(3)
+        FakeRequest.responses = [(200, [
+            {'id': 0, 'from': '/node/1/properties/'},
+            {'id': 1, 'from': '/node/2/properties/name'},
+            {'id': 2, 'from': '/node/3'}])]
+        with graph.transaction():
+            vertex.setProperty('name', u'paco')
+            other.removeProperty('name')
+            removed.delete()
+        # The elements are refreshed without getting them again
+        self.assertEqual(len(FakeRequest.requests), 1)
+        self.assertEqual(vertex.getProperties(), {'name': u'paco'})
+        self.assertEqual(other.getProperties(), {})
+        self.assertIsNone(removed.url)
+
+
+class CodecTestSuite(unittest.TestCase):
+
+    def testNativeCodec(self):
+        codec = NativeCodec()
+        self.assertEqual(codec.encode(3), 3)
+        self.assertEqual(codec.encode(2.5), 2.5)
+        self.assertEqual(codec.encode(False), False)
+        self.assertEqual(codec.encode((1, 2)), [1, 2])
+        self.assertIsNone(codec.decode(codec.encode(None)))
+        self.assertIsNone(CompactCodec().decode(CompactCodec().encode(None)))
+        for value in ({'a': 1}, [1, 'a'], set([1]), object()):
+            self.assertRaises(TypeError, codec.encode, value)
+            self.assertRaises(TypeError, CompactCodec().encode, value)
+        self.assertEqual(StringCodec().encode(3), u'3')
+
+    def testCompactCodec(self):
+        codec = CompactCodec(minLength=4)
+        features = [0.25, 0.5, 0.75, 1.0]
+        decoded = codec.decode(codec.encode(features))
+        self.assertIsInstance(decoded, array.array)
+        self.assertEqual(list(decoded), features)
+        self.assertEqual(list(codec.decode(codec.encode(range(10)))),
+                         range(10))
+        text = u'paquito ' * 100
+        self.assertTrue(len(codec.encode(text)) < len(text))
+        self.assertEqual(codec.decode(codec.encode(text)), text)
+        self.assertEqual(codec.encode([1, 2]), [1, 2])
+        self.assertEqual(codec.decode(u'paquito'), u'paquito')
+
+
 if __name__ == "__main__":
     unittest.main()